@@ -4,24 +4,36 @@ import json
 import logging
 import csv
 import copy
-import sys
+import os
 import traceback
+from contextlib import ExitStack
 from os import listdir
 from os.path import isfile, join
 from datetime import datetime as dt
 import time
+from io import StringIO
 
 from folioclient.FolioClient import FolioClient
 from pymarc import MARCReader
 from marc_to_folio import BibsRulesMapper
 
 from marc_to_folio.bibs_processor import BibsProcessor
+from marc_to_folio.byte_ranges import ByteRangeReader, iso2709_shard_ranges
+from marc_to_folio.folio_ids import DuplicateLegacyIdError
+from marc_to_folio.hrid_allocator import HridAllocator, HridBlock
+from marc_to_folio.marcxml_reader import MarcXmlReader
+from marc_to_folio.reference_snapshot import SnapshotFolioClient
+from marc_to_folio.staged_pipeline import StagedPipeline
+from marc_to_folio.transformation_report import TransformationReport
+from marc_to_folio.worker_pool import OrderedWorkerPool
 
 
 class Worker:
     """Class that is responsible for the acutal work"""
 
-    def __init__(self, folio_client, results_file, migration_report_file, args):
+    def __init__(
+        self, folio_client, results_file, migration_report_file, args, ref_data=None
+    ):
         # msu special case
         self.args = args
         self.migration_report_file = migration_report_file
@@ -33,26 +45,92 @@ class Worker:
             if isfile(join(args.source_folder, f))
         ]
         self.folio_client = folio_client
+        self.shard_ranges = {}
+        if args.shard_count > 1:
+            # Every shard has to see the files in the same order
+            self.files.sort()
+            for path, start, end in iso2709_shard_ranges(
+                [join(args.source_folder, f) for f in self.files],
+                args.shard_index,
+                args.shard_count,
+            ):
+                self.shard_ranges[os.path.basename(path)] = (start, end)
+            self.files = [f for f in self.files if f in self.shard_ranges]
+            print(
+                f"Shard {args.shard_index} of {args.shard_count}: "
+                f"{json.dumps(self.shard_ranges, sort_keys=True)}"
+            )
         print(f"Files to process: {len(self.files)}")
         print(json.dumps(self.files, sort_keys=True, indent=4))
-        self.mapper = BibsRulesMapper(self.folio_client, args)
+        self.mapper = BibsRulesMapper(self.folio_client, args, ref_data)
+        # Loaded before the worker processes are started, so they share it
+        if args.fetch_threads > 1 or args.workers > 1:
+            self.mapper.preload_reference_data(args.fetch_threads)
+        if args.hrid_start_number is not None:
+            hrid_start = args.hrid_start_number
+        else:
+            hrid_start = self.mapper.hrid_allocator.start_number
+        if args.shard_count > 1:
+            # Each shard creates HRIDs from its own block of numbers
+            hrid_start += args.shard_index * args.shard_hrid_block
+            self.hrid_allocator = HridAllocator(
+                hrid_start, hrid_start + args.shard_hrid_block
+            )
+        else:
+            self.hrid_allocator = HridAllocator(hrid_start)
+        self.mapper.hrid_allocator = self.hrid_allocator
         self.processor = None
+        self.pool = None
+        self.pipeline = None
+        self.chunk = []
         self.failed_files = list()
         self.bibids = set()
         print("Init done")
 
     def work(self):
         print("Starting....")
-        with open(self.results_file_path, "w+") as results_file:
+        with open(self.results_file_path, "w+") as results_file, ExitStack() as stack:
             self.processor = BibsProcessor(
                 self.mapper,
                 self.folio_client,
                 results_file,
                 self.args,
             )
+            if self.args.workers > 1:
+                print(f"Transforming records in {self.args.workers} worker processes")
+                pool = OrderedWorkerPool(
+                    self.args.workers,
+                    init_worker,
+                    (
+                        self.folio_client,
+                        self.args,
+                        self.mapper.ref_data,
+                        self.mapper.language_codes,
+                    ),
+                    process_chunk,
+                    self.merge_chunk_result,
+                )
+                # Terminated if the transformation fails
+                self.pool = stack.enter_context(pool)
+            else:
+                self.mapper.hrid_block = self.hrid_allocator.allocate()
+            if self.args.pipeline:
+                self.pipeline = self.start_pipeline()
             for file_name in self.files:
                 try:
-                    with open(join(sys.argv[1], file_name), "rb") as marc_file:
+                    if self.args.marcxml:
+                        print(f"running {file_name}")
+                        reader = MarcXmlReader(join(self.args.source_folder, file_name))
+                        self.read_records(reader)
+                        reader.report_throughput(self.mapper.report)
+                        continue
+                    with open(
+                        join(self.args.source_folder, file_name), "rb"
+                    ) as marc_file:
+                        if file_name in self.shard_ranges:
+                            marc_file = ByteRangeReader(
+                                marc_file, *self.shard_ranges[file_name]
+                            )
                         reader = MARCReader(marc_file, "rb", permissive=True)
                         reader.hide_utf8_warnings = True
                         if self.args.force_utf_8:
@@ -61,34 +139,170 @@ class Worker:
                         print(f"running {file_name}")
                         self.read_records(reader)
                 except Exception as exception:
+                    if self.pipeline and self.pipeline.stopped.is_set():
+                        # The records queued after it are lost. Fail the run
+                        print(f"Transformation stopped in {file_name}")
+                        raise
                     print(exception)
                     traceback.print_exc()
                     print(file_name)
+            if self.pool:
+                self.submit_chunk()
+                self.pool.close()
+            if self.pipeline:
+                try:
+                    self.pipeline.close()
+                finally:
+                    self.pipeline.print_timings()
+                self.pipeline.add_to_report(self.mapper.report)
             # wrap up
             self.wrap_up()
 
     def read_records(self, reader):
         for record in reader:
+            parse_error = ""
+            if record is None:
+                parse_error = f"{reader.current_exception} {reader.current_chunk}"
+            if self.pipeline:
+                # Records are counted on the thread of the map stage, like
+                # everything else added to the report
+                self.pipeline.put((record, parse_error))
+            elif self.count_record(record, parse_error):
+                if self.pool:
+                    if not self.claim_legacy_id(record):
+                        continue
+                    self.chunk.append(record)
+                    if len(self.chunk) >= self.args.chunk_size:
+                        self.submit_chunk()
+                else:
+                    self.processor.process_record(record, False)
+
+    def count_record(self, record, parse_error):
+        """Counts a record read from a file. Returns False if it failed to
+        parse"""
+        self.mapper.add_stats(
+            self.mapper.stats, "MARC21 records in file before parsing"
+        )
+        if record is None:
+            self.mapper.add_to_migration_report(
+                "Bib records that failed to parse. -", parse_error
+            )
             self.mapper.add_stats(
-                self.mapper.stats, "MARC21 records in file before parsing"
+                self.mapper.stats,
+                "MARC21 Records with encoding errors - parsing failed",
             )
-            if record is None:
-                self.mapper.add_to_migration_report(
-                    "Bib records that failed to parse. -",
-                    f"{reader.current_exception} {reader.current_chunk}",
-                )
-                self.mapper.add_stats(
-                    self.mapper.stats,
-                    "MARC21 Records with encoding errors - parsing failed",
-                )
-            else:
-                self.mapper.add_stats(
-                    self.mapper.stats, "MARC21 Records successfully parsed"
-                )
-                self.processor.process_record(record, False)
+            return False
+        self.mapper.add_stats(self.mapper.stats, "MARC21 Records successfully parsed")
+        return True
+
+    def claim_legacy_id(self, record):
+        """With deterministic ids, checks the legacy id of a record handed to a
+        worker process against the records read before it, since each worker
+        only sees its own records. Returns False for a duplicate"""
+        if not self.mapper.folio_ids.deterministic:
+            return True
+        try:
+            legacy_ids = self.mapper.get_legacy_id(record, self.args.ils_flavour)
+            self.mapper.folio_ids.claim("instances", legacy_ids[0])
+        except DuplicateLegacyIdError:
+            self.processor.count_duplicate(legacy_ids)
+            return False
+        except Exception:
+            # Failed by the worker, like in a single process run
+            pass
+        return True
+
+    def start_pipeline(self):
+        """Reads the records on this thread, and transforms, serializes and writes
+        them on threads of their own"""
+        print(
+            f"Transforming records in a pipeline with {self.args.serialize_threads} "
+            "serialization threads"
+        )
+        pipeline = StagedPipeline(self.args.queue_size)
+        pipeline.add_stage("map", self.map_read_record, on_error=self.skip_record)
+        pipeline.add_stage(
+            "serialize", self.processor.serialize_record, self.args.serialize_threads
+        )
+        pipeline.add_stage("write", self.processor.write_record, ordered=True)
+        pipeline.start()
+        return pipeline
+
+    def skip_record(self, read_record, exception):
+        """Keeps the pipeline going after a record that failed transformation.
+        It has been counted by the processor"""
+        print(f"Record failed transformation: {exception}")
+
+    def map_read_record(self, read_record):
+        record, parse_error = read_record
+        if self.count_record(record, parse_error):
+            return self.processor.map_record(record, False)
+        return None
+
+    def submit_chunk(self):
+        if self.chunk:
+            # Every record in the chunk could need a HRID, so reserve one each
+            # to keep the workers from handing out the same HRIDs
+            hrid_block = self.hrid_allocator.allocate(len(self.chunk))
+            self.pool.submit(self.chunk, hrid_block.start, hrid_block.end)
+            self.chunk = []
+
+    def report_hrid_ranges(self):
+        """Saves the HRID number ranges used and the number the HRID settings
+        of the tenant should start from after this run"""
+        prefix = self.mapper.hrid_prefix
+        ranges = self.hrid_allocator.merged_ranges()
+        for start, end in ranges:
+            self.mapper.report.migration_report.setdefault("HRID ranges used", {})[
+                f"{prefix}{str(start).zfill(11)} - {prefix}{str(end - 1).zfill(11)}"
+            ] = end - start
+        next_free_number = self.hrid_allocator.next_free_number()
+        with open(join(self.args.results_folder, "hrid_ranges.json"), "w+") as f:
+            json.dump(
+                {
+                    "prefix": prefix,
+                    "used_ranges": ranges,
+                    "next_free_start_number": next_free_number,
+                },
+                f,
+                indent=4,
+            )
+        if self.args.shard_count > 1:
+            # The other shards have used numbers past this one
+            print(
+                f"HRIDs created from {len(ranges)} number ranges. "
+                f"{next_free_number} is the next free number of this shard only. "
+                "Run main_merge_shards.py when all the shards are done for the "
+                "start number to set in the tenant"
+            )
+        else:
+            print(
+                f"HRIDs created from {len(ranges)} number ranges. Set the start "
+                f"number of the instance HRIDs in the tenant to {next_free_number} "
+                "after loading"
+            )
+
+    def merge_chunk_result(self, result):
+        """Writes the results of a chunk transformed by a worker process and adds
+        its counters to the ones of this mapper"""
+        self.processor.results_file.write(result["instances"])
+        self.processor.srs_records_file.write(result["srs_records"])
+        if self.processor.create_marc_xml_dump:
+            for marc_record in result["marc_xml_records"]:
+                self.processor.marc_xml_writer.write(marc_record)
+        self.mapper.report.merge(result["report"])
+        self.mapper.id_map.update(result["id_map"])
+        self.hrid_allocator.release(result["hrid_range"])
+        i = self.mapper.stats.get("Number of records in file(s)", 0)
+        elapsed = i / (time.time() - self.mapper.start)
+        elapsed_formatted = "{0:.4g}".format(elapsed)
+        print(f"{elapsed_formatted} records/sec.\t\t{i:,} records processed")
 
     def wrap_up(self):
         print("Done. Wrapping up...")
+        if not self.pool:
+            self.hrid_allocator.release(self.mapper.hrid_block.used_range())
+        self.report_hrid_ranges()
         self.processor.wrap_up()
         with open(self.migration_report_file, "w+") as report_file:
             report_file.write(f"# Bibliographic records transformation results   \n")
@@ -103,11 +317,81 @@ class Worker:
             )
             self.mapper.write_migration_report(report_file)
             self.mapper.print_mapping_report(report_file)
+            self.mapper.write_timings(report_file)
+        self.mapper.report.save(
+            os.path.join(self.args.results_folder, "instance_transformation_report.json.gz")
+        )
         print(f"Done. Transformation report written to {self.migration_report_file}")
 
 
-def parse_args():
-    """Parse CLI Arguments"""
+class MarcRecordCollector:
+    """Stands in for the MARC XML writer in worker processes. The records are
+    handed back to the main process that writes them"""
+
+    def __init__(self):
+        self.records = []
+
+    def write(self, marc_record):
+        self.records.append(marc_record)
+
+    def close(self):
+        pass
+
+
+# Mapper and processor of a worker process, set up by init_worker
+worker_processor = None
+
+
+def init_worker(folio_client, args, ref_data, language_codes):
+    global worker_processor
+    mapper = BibsRulesMapper(folio_client, args, ref_data, language_codes)
+    mapper.progress_interval = 0
+    worker_processor = BibsProcessor(
+        mapper,
+        folio_client,
+        StringIO(),
+        args,
+        srs_records_file=StringIO(),
+        marc_xml_writer=MarcRecordCollector(),
+    )
+
+
+def process_chunk(marc_records, hrid_start, hrid_end):
+    """Transforms a chunk of records in a worker process. Returns the serialized
+    records together with the counters and ids gathered for the chunk"""
+    processor = worker_processor
+    mapper = processor.mapper
+    mapper.hrid_block = HridBlock(hrid_start, hrid_end)
+    marc_xml_records = []
+    for marc_record in marc_records:
+        try:
+            processor.process_record(marc_record, False)
+        except Exception:
+            # Counted here, so the merged report adds up, and the rest of the
+            # chunk is transformed
+            traceback.print_exc()
+            mapper.add_stats(mapper.stats, "Records that failed in worker processes")
+    mapper.report_counters()
+    if processor.create_marc_xml_dump:
+        marc_xml_records = processor.marc_xml_writer.records
+        processor.marc_xml_writer = MarcRecordCollector()
+    result = {
+        "instances": processor.results_file.getvalue(),
+        "srs_records": processor.srs_records_file.getvalue(),
+        "marc_xml_records": marc_xml_records,
+        "report": mapper.report,
+        "id_map": mapper.id_map,
+        "hrid_range": mapper.hrid_block.used_range(),
+    }
+    processor.results_file = StringIO()
+    processor.srs_records_file = StringIO()
+    mapper.report = TransformationReport()
+    mapper.id_map = {}
+    return result
+
+
+def parse_args(argv=None):
+    """Parse CLI Arguments. From the command line, or argv"""
     parser = argparse.ArgumentParser()
     parser.add_argument("source_folder", help="path to marc records folder")
     parser.add_argument("results_folder", help="path to Instance results folder")
@@ -160,7 +444,150 @@ def parse_args():
         help=("Create MARC_XML file for Discovery system indexing"),
         action="store_true",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--workers",
+        "-w",
+        help=("Number of worker processes transforming records. Default is 1"),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--chunk-size",
+        help=("Number of records handed to a worker process at a time"),
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--pipeline",
+        help=(
+            "Read, transform, serialize and write the records on separate threads, "
+            "connected by queues of --queue-size records"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--serialize-threads",
+        help=("Number of threads serializing records in the pipeline"),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--queue-size",
+        help=("Number of records waiting between two stages of the pipeline"),
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--shard-index",
+        help=("Index (starting at 0) of the part of the records to transform"),
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--shard-count",
+        help=(
+            "Number of parts to split the records in the source folder into, "
+            "by bytes, so each part can be transformed on a separate machine. "
+            "Each part is written to its own subfolder of the results folder"
+        ),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--shard-hrid-block",
+        help=("Number of HRIDs reserved for each part"),
+        type=int,
+        default=10000000,
+    )
+    parser.add_argument(
+        "--hrid-start-number",
+        help=(
+            "Number to start creating HRIDs from, like the next free number "
+            "reported by an earlier run. Default is the start number in the "
+            "HRID settings of the tenant"
+        ),
+        type=int,
+    )
+    parser.add_argument(
+        "--deterministic-ids",
+        help=(
+            "Derive the ids of the instances and SRS records from their legacy ids and the tenant "
+            "instead of creating random ids. Reruns create the same ids"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--condition-memo-size",
+        help=(
+            "Remember the results of conditions that only depend on the value, "
+            "like trim and remove_ending_punc, for this many values. Default is 0 (off)"
+        ),
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--profile",
+        help=(
+            "Time the mapping of each MARC tag and each condition and add the "
+            "times to the transformation report"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--rules-cache-folder",
+        help=(
+            "Save the compiled mapping rules in this folder, and load them from "
+            "there in later runs and in the worker processes while the rules are "
+            "unchanged"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--reference-snapshot",
+        help=(
+            "Run from a snapshot of the tenant saved by main_snapshot.py instead "
+            "of fetching the reference data, mapping rules and settings"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--schema-file",
+        help=(
+            "Load the JSON schemas from a file saved by main_schemas.py instead "
+            "of fetching them from GitHub"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--language-codes",
+        help=(
+            "File with the MARC language codes, one per line. Fetched from the "
+            "Library of Congress and saved there if the file does not exist"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--fetch-threads",
+        help=(
+            "Number of reference data lists fetched from the tenant at the same "
+            "time at startup. 1 fetches each list when it is first used"
+        ),
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "--no-id-map-file",
+        help=(
+            "Do not save instance_id_map.json. For runs that hand the map to "
+            "the holdings transformation in memory"
+        ),
+        action="store_true",
+    )
+    args = parser.parse_args(argv)
+    if args.shard_count > 1 and args.marcxml:
+        parser.error("Splitting the records into shards requires MARC21 (ISO2709) files")
+    if args.pipeline and args.workers > 1:
+        parser.error("--pipeline can not be combined with worker processes")
     return args
 
 
@@ -171,22 +598,36 @@ def main():
     args = parse_args()
 
     logging.basicConfig(level=logging.CRITICAL)
+    print("\tOkapi URL:\t", args.okapi_url)
+    print("\tTenanti Id:\t", args.tenant_id)
+    print("\tUsername:   \t", args.username)
+    print("\tPassword:   \tSecret")
+    if args.reference_snapshot:
+        folio_client = SnapshotFolioClient.load(args.reference_snapshot)
+    else:
+        folio_client = FolioClient(
+            args.okapi_url, args.tenant_id, args.username, args.password
+        )
+    run(args, folio_client)
+
+
+def run(args, folio_client, ref_data=None):
+    """Transforms the bibs. Returns the instance id map"""
+    if args.shard_count > 1:
+        args.results_folder = join(
+            args.results_folder, f"shard_{args.shard_index}_of_{args.shard_count}"
+        )
+        os.makedirs(args.results_folder, exist_ok=True)
 
     results_file = join(args.results_folder, "folio_instances.json")
     migration_report_file = join(
         args.results_folder, "instance_transformation_report.md"
     )
     print("\tresults will be saved at:\t", args.results_folder)
-    print("\tOkapi URL:\t", args.okapi_url)
-    print("\tTenanti Id:\t", args.tenant_id)
-    print("\tUsername:   \t", args.username)
-    print("\tPassword:   \tSecret")
-    folio_client = FolioClient(
-        args.okapi_url, args.tenant_id, args.username, args.password
-    )
     # Iniiate Worker
-    worker = Worker(folio_client, results_file, migration_report_file, args)
+    worker = Worker(folio_client, results_file, migration_report_file, args, ref_data)
     worker.work()
+    return worker.mapper.id_map
 
 
 def get_subfield_contents(record, marc_tag, subfield_code):
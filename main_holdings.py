@@ -1,19 +1,28 @@
 '''Main "script."'''
 import argparse
-from marc_to_folio.rules_mapper_holdings import RulesMapperHoldings
+from marc_to_folio.rules_mapper_holdings import RulesMapperHoldings, get_legacy_id
 import os
 import csv
 import logging
 import json
+from contextlib import ExitStack
+from io import StringIO
 from os import listdir
 from os.path import isfile, join
 import pymarc
 from folioclient.FolioClient import FolioClient
-from marc_to_folio.holdings_processor import HoldingsProcessor
+from marc_to_folio.byte_ranges import ByteRangeReader, iso2709_shard_ranges
+from marc_to_folio.folio_ids import DuplicateLegacyIdError
+from marc_to_folio.holdings_processor import HoldingsProcessor, add_stats
+from marc_to_folio.marcxml_reader import MarcXmlReader
+from marc_to_folio.reference_snapshot import SnapshotFolioClient
+from marc_to_folio.staged_pipeline import StagedPipeline
+from marc_to_folio.transformation_report import TransformationReport
+from marc_to_folio.worker_pool import OrderedWorkerPool
 
 
-def parse_args():
-    """Parse CLI Arguments"""
+def parse_args(argv=None):
+    """Parse CLI Arguments. From the command line, or argv"""
     parser = argparse.ArgumentParser()
     parser.add_argument("source_folder", help="path to marc records folder")
     parser.add_argument("result_folder", help="path to results folder")
@@ -39,7 +48,128 @@ def parse_args():
         help=("This batch of records are to be suppressed in FOLIO."),
         action="store_true",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--workers",
+        "-w",
+        help=("Number of worker processes transforming records. Default is 1"),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--chunk-size",
+        help=("Number of records handed to a worker process at a time"),
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--pipeline",
+        help=(
+            "Read, transform, serialize and write the records on separate threads, "
+            "connected by queues of --queue-size records"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--serialize-threads",
+        help=("Number of threads serializing records in the pipeline"),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--queue-size",
+        help=("Number of records waiting between two stages of the pipeline"),
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--shard-index",
+        help=("Index (starting at 0) of the part of the records to transform"),
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--shard-count",
+        help=(
+            "Number of parts to split the records in the source folder into, "
+            "by bytes, so each part can be transformed on a separate machine. "
+            "Each part is written to its own subfolder of the results folder"
+        ),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--deterministic-ids",
+        help=(
+            "Derive the ids of the holdings from their legacy ids and the tenant "
+            "instead of creating random ids. Reruns create the same ids. "
+            "Without an instance id map, the instance ids are derived the same way"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--condition-memo-size",
+        help=(
+            "Remember the results of conditions that only depend on the value, "
+            "like trim and remove_ending_punc, for this many values. Default is 0 (off)"
+        ),
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--profile",
+        help=(
+            "Time the mapping of each MARC tag and each condition and add the "
+            "times to the transformation report"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--rules-cache-folder",
+        help=(
+            "Save the compiled mapping rules in this folder, and load them from "
+            "there in later runs and in the worker processes while the rules are "
+            "unchanged"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--reference-snapshot",
+        help=(
+            "Run from a snapshot of the tenant saved by main_snapshot.py instead "
+            "of fetching the reference data, mapping rules and settings"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--schema-file",
+        help=(
+            "Load the JSON schemas from a file saved by main_schemas.py instead "
+            "of fetching them from GitHub"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--fetch-threads",
+        help=(
+            "Number of reference data lists fetched from the tenant at the same "
+            "time at startup. 1 fetches each list when it is first used"
+        ),
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "--no-id-map-file",
+        help=(
+            "Do not save holdings_id_map.json. For runs that hand the map to "
+            "the items transformation in memory"
+        ),
+        action="store_true",
+    )
+    args = parser.parse_args(argv)
+    if args.shard_count > 1 and args.marcxml:
+        parser.error("Splitting the records into shards requires MARC21 (ISO2709) files")
+    if args.pipeline and args.workers > 1:
+        parser.error("--pipeline can not be combined with worker processes")
     logging.info(f"\tresults are stored at:\t{args.result_folder}")
     logging.info(f"\tOkapi URL:\t{args.okapi_url}")
     logging.info(f"\tTenanti Id:\t{args.tenant_id}")
@@ -51,55 +181,278 @@ def parse_args():
 def main():
     """Main method. Magic starts here."""
     args = parse_args()
-    logging.basicConfig(
-        filename=os.path.join(args.result_folder, "holdings_transform_log.log"),
-        filemode="w",
-    )
+    instance_id_map_path = os.path.join(args.result_folder, "instance_id_map.json")
+    if args.shard_count > 1:
+        args.result_folder = os.path.join(
+            args.result_folder, f"shard_{args.shard_index}_of_{args.shard_count}"
+        )
+        os.makedirs(args.result_folder, exist_ok=True)
+    # The log file is set up by run
     log = logging.getLogger()
     log.setLevel(logging.CRITICAL)
-    folio_client = FolioClient(
-        args.okapi_url, args.tenant_id, args.username, args.password
+    if args.reference_snapshot:
+        folio_client = SnapshotFolioClient.load(args.reference_snapshot)
+    else:
+        folio_client = FolioClient(
+            args.okapi_url, args.tenant_id, args.username, args.password
+        )
+    run(args, folio_client, read_instance_id_map(args, instance_id_map_path))
+
+
+def read_instance_id_map(args, instance_id_map_path):
+    """Returns the instance id map saved by main_bibs.py, or None if the
+    instance ids are derived from the legacy ids"""
+    if args.deterministic_ids and not isfile(instance_id_map_path):
+        if args.ils_flavour == "aleph":
+            # Only the first legacy id of an instance gives its id. The others
+            # are only found in the map
+            raise Exception(
+                f"No instance id map in {instance_id_map_path}. Aleph records have "
+                "several legacy ids, so the instance ids can not be derived from "
+                "them. Run main_bibs.py without --no-id-map-file"
+            )
+        print("No instance id map. Instance ids are derived from the legacy ids")
+        return None
+    with open(instance_id_map_path, "r") as json_file:
+        instance_id_map = json.load(json_file)
+    print(f"{len(instance_id_map)} Instance ids in map")
+    return instance_id_map
+
+
+def run(args, folio_client, instance_id_map, ref_data=None):
+    """Transforms the holdings, logging to holdings_transform_log.log in the
+    results folder. Returns the holdings id map"""
+    # Added for the run only, since main_migrate.py runs the other
+    # transformations in the same process
+    log_handler = logging.FileHandler(
+        os.path.join(args.result_folder, "holdings_transform_log.log"), mode="w"
     )
+    log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    logging.getLogger().addHandler(log_handler)
+    try:
+        return transform_holdings(args, folio_client, instance_id_map, ref_data)
+    finally:
+        logging.getLogger().removeHandler(log_handler)
+        log_handler.close()
+
+
+def transform_holdings(args, folio_client, instance_id_map, ref_data):
     csv.register_dialect("tsv", delimiter="\t")
     files = [
         os.path.join(args.source_folder, f)
         for f in listdir(args.source_folder)
         if isfile(os.path.join(args.source_folder, f))
     ]
+    shard_ranges = {}
+    if args.shard_count > 1:
+        # Every shard has to see the files in the same order
+        for path, start, end in iso2709_shard_ranges(
+            sorted(files), args.shard_index, args.shard_count
+        ):
+            shard_ranges[path] = (start, end)
+        files = [f for f in sorted(files) if f in shard_ranges]
+        print(f"Shard {args.shard_index} of {args.shard_count}: {shard_ranges}")
     with open(
-        os.path.join(args.result_folder, "instance_id_map.json"), "r"
-    ) as json_file, open(
         os.path.join(args.map_path, "locations.tsv")
     ) as location_map_f, open(
         os.path.join(args.map_path, "mfhd_rules.json")
     ) as mapping_rules_file, open(
         os.path.join(args.result_folder, "folio_holdings.json"), "w+"
-    ) as results_file:
-        instance_id_map = json.load(json_file)
+    ) as results_file, ExitStack() as stack:
         location_map = list(csv.DictReader(location_map_f, dialect="tsv"))
         rules_file = json.load(mapping_rules_file)
 
         print(f"Locations in map: {len(location_map)}")
         print(any(location_map))
-        print(f"{len(instance_id_map)} Instance ids in map")
         mapper = RulesMapperHoldings(
             folio_client,
             instance_id_map,
             location_map,
             rules_file["defaultLocationCode"],
             args,
+            ref_data,
         )
         mapper.mappings = rules_file["rules"]
+        # Loaded before the worker processes are started, so they share it
+        if args.fetch_threads > 1 or args.workers > 1:
+            mapper.preload_reference_data(args.fetch_threads)
 
         processor = HoldingsProcessor(mapper, folio_client, results_file, args)
+        record_handler = processor.process_record
+        if args.workers > 1:
+            print(f"Transforming records in {args.workers} worker processes")
+            # The workers share the instance id map and reference data loaded above
+            parallel = ParallelHoldings(
+                processor,
+                args,
+                (
+                    folio_client,
+                    instance_id_map,
+                    location_map,
+                    rules_file,
+                    args,
+                    mapper.ref_data,
+                ),
+            )
+            # Terminated if the transformation fails
+            stack.enter_context(parallel)
+            record_handler = parallel.add_record
+        elif args.pipeline:
+            print(
+                f"Transforming records in a pipeline with {args.serialize_threads} "
+                "serialization threads"
+            )
+            pipeline = StagedPipeline(args.queue_size)
+            pipeline.add_stage(
+                "map", processor.map_record, on_error=processor.skip_record
+            )
+            pipeline.add_stage(
+                "serialize", processor.serialize_record, args.serialize_threads
+            )
+            pipeline.add_stage("write", processor.write_record, ordered=True)
+            pipeline.start()
+            record_handler = pipeline.put
         for records_file in files:
             if args.marcxml:
-                pymarc.map_xml(processor.process_record, records_file)
+                reader = MarcXmlReader(records_file)
+                for marc_record in reader:
+                    if marc_record is None:
+                        logging.error(reader.current_exception)
+                        add_stats(mapper.stats, "MARCXML records that failed to parse")
+                    else:
+                        record_handler(marc_record)
+                reader.report_throughput(mapper.report)
             else:
                 with open(records_file, "rb") as marc_file:
-                    pymarc.map_records(processor.process_record, marc_file)
+                    if records_file in shard_ranges:
+                        marc_file = ByteRangeReader(
+                            marc_file, *shard_ranges[records_file]
+                        )
+                    pymarc.map_records(record_handler, marc_file)
+        if args.workers > 1:
+            parallel.close()
+        elif args.pipeline:
+            try:
+                pipeline.close()
+            finally:
+                pipeline.print_timings()
+            pipeline.add_to_report(mapper.report)
 
     processor.wrap_up()
+    return mapper.holdings_id_map
+
+
+class ParallelHoldings:
+    """Collects records into chunks for the worker processes and writes the
+    results handed back by them"""
+
+    def __init__(self, processor, args, worker_init_args):
+        self.processor = processor
+        self.pool = OrderedWorkerPool(
+            args.workers,
+            init_worker,
+            worker_init_args,
+            process_chunk,
+            self.merge_chunk_result,
+        )
+        self.chunk_size = args.chunk_size
+        self.chunk = []
+
+    def add_record(self, marc_record):
+        if not self.claim_legacy_id(marc_record):
+            return
+        self.chunk.append(marc_record)
+        if len(self.chunk) >= self.chunk_size:
+            self.pool.submit(self.chunk)
+            self.chunk = []
+
+    def claim_legacy_id(self, marc_record):
+        """With deterministic ids, checks the legacy id of a record against the
+        records read before it, since each worker only sees its own records.
+        Returns False for a duplicate"""
+        mapper = self.processor.mapper
+        if not mapper.folio_ids.deterministic:
+            return True
+        try:
+            mapper.folio_ids.claim("holdings", get_legacy_id(marc_record)[0])
+        except DuplicateLegacyIdError as duplicate_error:
+            add_stats(mapper.stats, "Duplicate legacy ids")
+            add_stats(mapper.stats, "Failed records")
+            logging.error(duplicate_error)
+            return False
+        except Exception:
+            # Failed by the worker, like in a single process run
+            pass
+        return True
+
+    def merge_chunk_result(self, result):
+        self.processor.results_file.write(result["holdings"])
+        self.processor.records_count += result["records_count"]
+        self.processor.report.merge(result["processor_report"])
+        self.processor.mapper.report.merge(result["report"])
+        self.processor.mapper.holdings_id_map.update(result["holdings_id_map"])
+
+    def close(self):
+        if self.chunk:
+            self.pool.submit(self.chunk)
+            self.chunk = []
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pool.terminate()
+
+
+# Processor of a worker process, set up by init_worker
+worker_processor = None
+
+
+def init_worker(
+    folio_client, instance_id_map, location_map, rules_file, args, ref_data
+):
+    global worker_processor
+    mapper = RulesMapperHoldings(
+        folio_client,
+        instance_id_map,
+        location_map,
+        rules_file["defaultLocationCode"],
+        args,
+        ref_data,
+    )
+    mapper.mappings = rules_file["rules"]
+    mapper.progress_interval = 0
+    worker_processor = HoldingsProcessor(mapper, folio_client, StringIO(), args)
+
+
+def process_chunk(marc_records):
+    """Transforms a chunk of records in a worker process. Returns the serialized
+    holdings together with the counters and ids gathered for the chunk"""
+    processor = worker_processor
+    mapper = processor.mapper
+    records_count = processor.records_count
+    for marc_record in marc_records:
+        try:
+            processor.process_record(marc_record)
+        except Exception as exception:
+            processor.skip_record(marc_record, exception)
+    mapper.report_counters()
+    result = {
+        "holdings": processor.results_file.getvalue(),
+        "records_count": processor.records_count - records_count,
+        "processor_report": processor.report,
+        "report": mapper.report,
+        "holdings_id_map": mapper.holdings_id_map,
+    }
+    processor.results_file = StringIO()
+    processor.report = TransformationReport()
+    mapper.report = TransformationReport()
+    mapper.holdings_id_map = {}
+    return result
 
 
 if __name__ == "__main__":
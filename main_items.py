@@ -7,12 +7,19 @@ import json
 import logging
 import os
 import pymarc
+from io import StringIO
 from os import listdir
 from os.path import isfile, join
 from folioclient.FolioClient import FolioClient
+from marc_to_folio.byte_ranges import line_aligned_ranges, read_range
 from marc_to_folio.items_default_mapper import ItemsDefaultMapper
 from marc_to_folio.items_processor import ItemsProcessor
-from typing import Dict, List
+from marc_to_folio.reference_data import ITEMS_REFERENCE_DATA, fetch_reference_data
+from marc_to_folio.reference_snapshot import SnapshotFolioClient
+from marc_to_folio.staged_pipeline import StagedPipeline
+from marc_to_folio.transformation_report import TransformationReport
+from marc_to_folio.worker_pool import OrderedWorkerPool
+from typing import List
 
 
 class Worker:
@@ -26,8 +33,7 @@ class Worker:
         file_names: List[str],
     ):
         self.processor = processor
-        self.stats: Dict[str, int] = {}
-        self.migration_report: Dict[str, List[str]] = {}
+        self.report = TransformationReport()
         self.failed_files: List[str] = list()
         self.file_names = file_names
         print("Init done")
@@ -35,52 +41,136 @@ class Worker:
     def work(self):
         print("Starting....")
         i = 0
+        args = self.processor.args
+        record_handler = self.processor.process_record
+        if args.pipeline:
+            print(
+                f"Mapping items in a pipeline with {args.serialize_threads} "
+                "serialization threads"
+            )
+            pipeline = StagedPipeline(args.queue_size)
+            pipeline.add_stage(
+                "map", self.processor.map_record, on_error=self.processor.skip_record
+            )
+            pipeline.add_stage(
+                "serialize", self.processor.serialize_record, args.serialize_threads
+            )
+            pipeline.add_stage("write", self.processor.write_record, ordered=True)
+            pipeline.start()
+            record_handler = pipeline.put
         for file_name in self.file_names:
             print(f"Processing {file_name}")
             try:
                 with open(file_name, encoding="utf-8-sig") as records_file:
-                    add_stats(self.stats, "Number of files processed")
+                    self.report.add_stats("Number of files processed")
                     f = 0
                     for rec in self.processor.mapper.get_records(records_file):
                         i += 1
-                        add_stats(self.stats, "Number of Legacy items in file")
+                        self.report.add_stats("Number of Legacy items in file")
                         f += 1
-                        self.processor.process_record(rec)
+                        record_handler(rec)
                     print(f"Done processing {file_name} containing {f} records")
             except Exception as ee:
+                if args.pipeline and pipeline.stopped.is_set():
+                    # The items queued after it are lost. Fail the run
+                    print(f"processing stopped in {file_name}")
+                    raise
                 print(f"processing of {file_name} failed: {ee}")
             # print_dict_to_md_table(self.processor.mapper.stats)
+        if args.pipeline:
+            try:
+                pipeline.close()
+            finally:
+                pipeline.print_timings()
+            pipeline.add_to_report(self.processor.mapper.report)
 
         print(f"processed {i} records {len(self.file_names)} files")
 
+    def work_in_parallel(self, args, worker_init_args):
+        """Splits the files into line-aligned byte ranges and maps the ranges in
+        worker processes"""
+        print(f"Starting {args.workers} worker processes....")
+        # Closed at the end of the block, or terminated if it fails
+        with OrderedWorkerPool(
+            args.workers,
+            init_worker,
+            worker_init_args,
+            process_range,
+            self.merge_range_result,
+        ) as pool:
+            for file_name in self.file_names:
+                print(f"Processing {file_name}")
+                self.report.add_stats("Number of files processed")
+                with open(file_name, "rb") as records_file:
+                    header_length = len(records_file.readline())
+                ranges = line_aligned_ranges(file_name, header_length, args.chunk_bytes)
+                for start, end in ranges:
+                    pool.submit(file_name, header_length, start, end)
+        print(
+            f"processed {self.report.stats.get('Number of Legacy items in file', 0)} records "
+            f"{len(self.file_names)} files"
+        )
+
+    def merge_range_result(self, result):
+        """Writes the items mapped by a worker process and adds its counters and
+        ids to the ones of this process"""
+        processor = self.processor
+        mapper = processor.mapper
+        processor.records_count += result["records_count"]
+        processor.report.merge(result["processor_report"])
+        if result["records_count"]:
+            self.report.stats["Number of Legacy items in file"] = (
+                self.report.stats.get("Number of Legacy items in file", 0)
+                + result["records_count"]
+            )
+        mapper.report.merge(result["report"])
+        for legacy_id, count in result["duplicate_item_ids"].items():
+            mapper.duplicate_item_ids[legacy_id] = (
+                mapper.duplicate_item_ids.get(legacy_id, 0) + count
+            )
+        # The same legacy id can show up in ranges mapped by different workers
+        duplicate_ids = set()
+        for legacy_id, item_id in result["item_id_map"].items():
+            if legacy_id in mapper.item_id_map:
+                mapper.add_stats(mapper.duplicate_item_ids, legacy_id)
+                mapper.add_stats(mapper.stats, "Duplicate item ids")
+                if mapper.folio_ids.deterministic:
+                    duplicate_ids.add(item_id)
+            else:
+                mapper.item_id_map[legacy_id] = item_id
+        items = result["items"]
+        if duplicate_ids:
+            # With deterministic ids, the duplicates have the id of an item
+            # already written
+            items = drop_items(items, duplicate_ids)
+            processor.report.stats["Number of Items written to disk"] -= len(
+                duplicate_ids
+            )
+        processor.results_file.write(items)
+        if result["error"]:
+            print(f"processing of {result['file_name']} failed: {result['error']}")
+
     def wrap_up(self):
         print("Done. Wrapping up...")
-        print_dict_to_md_table(self.stats)
+        print_dict_to_md_table(self.report.stats)
         self.processor.wrap_up()
-        self.write_migration_report(self.processor.migration_report)
+        self.write_migration_report()
         print("done")
 
-    def write_migration_report(self, other_report=None):
-        if other_report:
-            for a in other_report:
-                print(f"## {a} - {len(other_report[a])} things")
-                for b in other_report[a]:
-                    print(f"{b}\\")
-        else:
-            for a in self.migration_report:
-                print(f"## {a} - {len(self.migration_report[a])} things")
-                for b in self.migration_report[a]:
-                    print(f"{b}\\")
+    def write_migration_report(self):
+        # The report the processor and mapper have filled, and merged into
+        migration_report = self.processor.mapper.report.migration_report
+        for a in migration_report:
+            print(f"## {a} - {len(migration_report[a])} things")
+            for b, count in migration_report[a].items():
+                print(f"{b} ({count})\\")
 
     def add_to_migration_report(self, header, messageString):
-        # TODO: Move to interface or parent class
-        if header not in self.migration_report:
-            self.migration_report[header] = list()
-        self.migration_report[header].append(messageString)
+        self.report.add_to_migration_report(header, messageString)
 
 
-def parse_args():
-    """Parse CLI Arguments"""
+def parse_args(argv=None):
+    """Parse CLI Arguments. From the command line, or argv"""
     parser = argparse.ArgumentParser()
     parser.add_argument("records_path", help="path to items file")
     parser.add_argument("result_path", help="path to Instance results file")
@@ -107,19 +197,109 @@ def parse_args():
         help=("Validate JSON data against JSON Schema"),
         action="store_true",
     )
-    args = parser.parse_args()
-
+    parser.add_argument(
+        "--workers",
+        "-w",
+        help=(
+            "Number of worker processes mapping items. Default is 1. "
+            "Files are split on line breaks, so values must not contain line breaks"
+        ),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--chunk-bytes",
+        help=("Size in bytes of the file parts handed to a worker process at a time"),
+        type=int,
+        default=16 * 1024 * 1024,
+    )
+    parser.add_argument(
+        "--pipeline",
+        help=(
+            "Read, map, serialize and write the items on separate threads, "
+            "connected by queues of --queue-size items"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--serialize-threads",
+        help=("Number of threads serializing items in the pipeline"),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--queue-size",
+        help=("Number of items waiting between two stages of the pipeline"),
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--deterministic-ids",
+        help=(
+            "Derive the ids of the items from their legacy ids and the tenant "
+            "instead of creating random ids. Reruns create the same ids. "
+            "Without a holdings id map, the holdings ids are derived the same way"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--reference-snapshot",
+        help=(
+            "Run from a snapshot of the tenant saved by main_snapshot.py instead "
+            "of fetching the reference data, mapping rules and settings"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--schema-file",
+        help=(
+            "Load the JSON schemas from a file saved by main_schemas.py instead "
+            "of fetching them from GitHub"
+        ),
+        default="",
+    )
+    parser.add_argument(
+        "--fetch-threads",
+        help=(
+            "Number of reference data lists fetched from the tenant at the same "
+            "time at startup. 1 fetches each list when it is first used"
+        ),
+        type=int,
+        default=4,
+    )
+    args = parser.parse_args(argv)
+    if args.pipeline and args.workers > 1:
+        parser.error("--pipeline can not be combined with worker processes")
     return args
 
 
 def main():
     """Main Method. Used for bootstrapping. """
-    csv.register_dialect("tsv", delimiter="\t")
     args = parse_args()
 
-    folio_client = FolioClient(
-        args.okapi_url, args.tenant_id, args.username, args.password
-    )
+    if args.reference_snapshot:
+        folio_client = SnapshotFolioClient.load(args.reference_snapshot)
+    else:
+        folio_client = FolioClient(
+            args.okapi_url, args.tenant_id, args.username, args.password
+        )
+    run(args, folio_client, read_holdings_id_map(args))
+
+
+def read_holdings_id_map(args):
+    """Returns the holdings id map saved by main_holdings.py, or None if the
+    holdings ids are derived from the legacy ids"""
+    holdings_id_dict_path = os.path.join(args.result_path, "holdings_id_map.json")
+    if args.deterministic_ids and not isfile(holdings_id_dict_path):
+        print("No holdings id map. Holdings ids are derived from the legacy ids")
+        return None
+    with open(holdings_id_dict_path, "r") as holdings_id_map_file:
+        return json.load(holdings_id_map_file)
+
+
+def run(args, folio_client, holdings_id_map, ref_data=None):
+    """Transforms the items"""
+    csv.register_dialect("tsv", delimiter="\t")
     files = [
         join(args.records_path, f)
         for f in listdir(args.records_path)
@@ -129,7 +309,6 @@ def main():
     material_type_map = None
     loan_type_map = None
     print(f"Files to process: {files}")
-    holdings_id_dict_path = os.path.join(args.result_path, "holdings_id_map.json")
     items_map_path = os.path.join(args.map_path, "item_to_item.json")
     location_map_path = os.path.join(args.map_path, "locations.tsv")
     items_type_map_path = os.path.join(args.map_path, "item_types.tsv")
@@ -158,12 +337,17 @@ def main():
             "Not enough mapping files present for mapping to be performed. Check documentation"
         )
 
-    with open(holdings_id_dict_path, "r") as holdings_id_map_file, open(
-        items_map_path
-    ) as items_mapper_f, open(location_map_path) as location_map_f, open(
+    if ref_data is None:
+        ref_data = fetch_reference_data(
+            folio_client, ITEMS_REFERENCE_DATA, args.fetch_threads
+        )
+    else:
+        ref_data.load(ITEMS_REFERENCE_DATA, args.fetch_threads)
+    with open(items_map_path) as items_mapper_f, open(
+        location_map_path
+    ) as location_map_f, open(
         os.path.join(args.result_path, "folio_items.json"), "w+"
     ) as results_f:
-        holdings_id_map = json.load(holdings_id_map_file)
         items_map = json.load(items_mapper_f)
         print(f'{len(items_map["fields"])} fields in item to item map')
         location_map = list(csv.DictReader(location_map_f, dialect="tsv"))
@@ -175,13 +359,97 @@ def main():
             location_map,
             [item_type_map, material_type_map, loan_type_map],
             args,
+            ref_data,
         )
         processor = ItemsProcessor(mapper, folio_client, results_f, args)
         worker = Worker(folio_client, results_f, processor, files)
-        worker.work()
+        if args.workers > 1:
+            # The workers share the holdings id map and reference data loaded above
+            worker.work_in_parallel(
+                args,
+                (
+                    folio_client,
+                    items_map,
+                    holdings_id_map,
+                    location_map,
+                    [item_type_map, material_type_map, loan_type_map],
+                    args,
+                    mapper.ref_data,
+                ),
+            )
+        else:
+            worker.work()
         worker.wrap_up()
 
 
+# Processor of a worker process, set up by init_worker
+worker_processor = None
+
+
+def init_worker(
+    folio_client, items_map, holdings_id_map, location_map, other_maps, args, ref_data
+):
+    global worker_processor
+    mapper = ItemsDefaultMapper(
+        folio_client,
+        items_map,
+        holdings_id_map,
+        location_map,
+        other_maps,
+        args,
+        ref_data,
+    )
+    worker_processor = ItemsProcessor(mapper, folio_client, StringIO(), args)
+
+
+def process_range(file_name, header_length, start, end):
+    """Maps the rows in a byte range of a file in a worker process. Returns the
+    serialized items together with the counters and ids gathered for the range"""
+    processor = worker_processor
+    mapper = processor.mapper
+    records_count = 0
+    error = ""
+    try:
+        text = read_range(file_name, 0, header_length).decode("utf-8-sig")
+        text += read_range(file_name, start, end).decode("utf-8")
+        for rec in mapper.get_records(StringIO(text)):
+            records_count += 1
+            try:
+                processor.process_record(rec)
+            except Exception as exception:
+                processor.skip_record(rec, exception)
+    except Exception as ee:
+        traceback.print_exc()
+        error = str(ee)
+    result = {
+        "file_name": file_name,
+        "items": processor.results_file.getvalue(),
+        "records_count": records_count,
+        "processor_report": processor.report,
+        "report": mapper.report,
+        "item_id_map": mapper.item_id_map,
+        "duplicate_item_ids": mapper.duplicate_item_ids,
+        "error": error,
+    }
+    processor.results_file = StringIO()
+    processor.report = TransformationReport()
+    mapper.report = TransformationReport()
+    mapper.item_id_map = {}
+    mapper.duplicate_item_ids = {}
+    return result
+
+
+def drop_items(items, item_ids):
+    """Returns the serialized items, one per line, without the items with the
+    ids"""
+    kept = []
+    for line in items.splitlines(keepends=True):
+        # Postgres dump lines start with the id and a tab
+        if json.loads(line.split("\t", 1)[-1])["id"] not in item_ids:
+            kept.append(line)
+    return "".join(kept)
+
+
 def add_stats(stats, a):
     if a not in stats:
         stats[a] = 1
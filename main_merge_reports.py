@@ -0,0 +1,50 @@
+'''Main "script."'''
+import argparse
+from datetime import datetime as dt
+from os.path import join
+
+from marc_to_folio.transformation_report import TransformationReport
+
+
+def parse_args():
+    """Parse CLI Arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("results_folder", help="path to the merged report folder")
+    parser.add_argument(
+        "report_files",
+        help="saved reports (*_transformation_report.json.gz) to merge",
+        nargs="+",
+    )
+    parser.add_argument(
+        "--title",
+        help=("Kind of records in the reports, like Bibliographic records"),
+        default="Merged records",
+    )
+    return parser.parse_args()
+
+
+def main():
+    """Merges the reports saved by parallel, sharded or resumed runs into one
+    without transforming any records again"""
+    args = parse_args()
+    report = TransformationReport()
+    for report_file in args.report_files:
+        print(f"Merging {report_file}")
+        report.merge(TransformationReport.load(report_file))
+    report.save(join(args.results_folder, "merged_transformation_report.json.gz"))
+    mrf = join(args.results_folder, "merged_transformation_report.md")
+    with open(mrf, "w+") as report_file:
+        report_file.write(f"# {args.title} transformation results   \n")
+        report_file.write(f"Time Finished: {dt.isoformat(dt.utcnow())}   \n")
+        report_file.write(f"## {args.title} transformation counters   \n")
+        report.print_dict_to_md_table(
+            report.stats, report_file, "  Measure  ", "Count   \n",
+        )
+        report.write_migration_report(report_file)
+        report.print_mapping_report(report_file)
+        report.write_timings(report_file)
+    print(f"Done. Merged report written to {mrf}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+'''Main "script."'''
+import argparse
+import json
+from os.path import join
+
+from marc_to_folio.shard_results import (
+    merge_hrid_ranges,
+    merge_id_maps,
+    shard_folders,
+)
+
+# The id maps saved by the shards, and how the scripts save them
+ID_MAPS = {
+    "instance_id_map.json": {"sort_keys": True, "indent": 4},
+    "holdings_id_map.json": {"indent": 4},
+}
+
+
+def parse_args():
+    """Parse CLI Arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "results_folder",
+        help="results folder with the shard_N_of_M subfolders of a sharded run",
+    )
+    return parser.parse_args()
+
+
+def main():
+    """Merges the id maps saved by the shards of main_bibs.py or
+    main_holdings.py into the results folder, for the next transformation to
+    load, and the HRID ranges used by the shards"""
+    args = parse_args()
+    try:
+        folders = shard_folders(args.results_folder)
+        hrid_ranges = merge_hrid_ranges(folders)
+    except ValueError as error:
+        raise SystemExit(str(error))
+    print(f"Merging {len(folders)} shards")
+    for file_name, dump_options in ID_MAPS.items():
+        id_map, duplicates = merge_id_maps(folders, file_name)
+        if not id_map:
+            continue
+        if duplicates:
+            print(
+                f"{len(duplicates)} legacy ids are in more than one shard, like "
+                f"{duplicates[:10]}. The first shard with each keeps it"
+            )
+        path = join(args.results_folder, file_name)
+        with open(path, "w+") as id_map_file:
+            json.dump(id_map, id_map_file, **dump_options)
+        print(f"{len(id_map)} ids saved to {path}")
+    if hrid_ranges:
+        path = join(args.results_folder, "hrid_ranges.json")
+        with open(path, "w+") as hrid_ranges_file:
+            json.dump(hrid_ranges, hrid_ranges_file, indent=4)
+        print(
+            f"HRIDs created from {len(hrid_ranges['used_ranges'])} number ranges. "
+            "Set the start number of the instance HRIDs in the tenant to "
+            f"{hrid_ranges['next_free_start_number']} after loading all the shards"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+'''Main "script."'''
+import argparse
+import json
+import logging
+import os
+import time
+
+from folioclient.FolioClient import FolioClient
+
+import main_bibs
+import main_holdings
+import main_items
+from marc_to_folio.reference_data import ReferenceData
+from marc_to_folio.reference_snapshot import SnapshotFolioClient
+
+# The transformations, in the order they are run
+STAGES = {
+    "bibs": main_bibs,
+    "holdings": main_holdings,
+    "items": main_items,
+}
+
+
+def parse_args():
+    """Parse CLI Arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "config_file",
+        help=(
+            'JSON file with the arguments of each transformation, like {"bibs": '
+            '["source_folder", "results_folder", ...], "holdings": [...], '
+            '"items": [...]}. Transformations left out are not run'
+        ),
+    )
+    parser.add_argument(
+        "--save-id-maps",
+        help=(
+            "Save instance_id_map.json and holdings_id_map.json, even though "
+            "they are handed to the next transformation in memory"
+        ),
+        action="store_true",
+    )
+    args = parser.parse_args()
+    with open(args.config_file) as config_file:
+        config = json.load(config_file)
+    try:
+        args.stages = parse_stage_args(config, args.save_id_maps)
+    except ValueError as error:
+        parser.error(str(error))
+    if not args.stages:
+        parser.error(f"No transformations in {args.config_file}")
+    return args
+
+
+def parse_stage_args(config, save_id_maps):
+    """Returns the parsed arguments of the transformations in the config, by
+    stage"""
+    unknown = set(config) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown transformations in the config: {sorted(unknown)}")
+    stage_args = {
+        stage: module.parse_args(config[stage])
+        for stage, module in STAGES.items()
+        if stage in config
+    }
+    for stage, args in stage_args.items():
+        if getattr(args, "shard_count", 1) > 1:
+            raise ValueError(
+                f"The {stage} are split into shards. Shards hand their id maps on "
+                "in files, so run them with the scripts of each transformation"
+            )
+    # The maps handed on in memory are not saved, unless asked to
+    if "holdings" in stage_args and "bibs" in stage_args:
+        stage_args["bibs"].no_id_map_file = not save_id_maps
+    if "items" in stage_args and "holdings" in stage_args:
+        stage_args["holdings"].no_id_map_file = not save_id_maps
+    return stage_args
+
+
+def migrate(stage_args, folio_client, ref_data):
+    """Runs the transformations in order, handing the id maps and the
+    reference data from one to the next"""
+    instance_id_map = None
+    holdings_id_map = None
+    for stage, args in stage_args.items():
+        print(f"Transforming {stage}", flush=True)
+        start = time.time()
+        if stage == "bibs":
+            instance_id_map = main_bibs.run(args, folio_client, ref_data)
+        elif stage == "holdings":
+            if "bibs" not in stage_args:
+                instance_id_map = main_holdings.read_instance_id_map(
+                    args, os.path.join(args.result_folder, "instance_id_map.json")
+                )
+            holdings_id_map = main_holdings.run(
+                args, folio_client, instance_id_map, ref_data
+            )
+            instance_id_map = None
+        else:
+            if "holdings" not in stage_args:
+                holdings_id_map = main_items.read_holdings_id_map(args)
+            main_items.run(args, folio_client, holdings_id_map, ref_data)
+        print(f"Done transforming {stage} in {time.time() - start:.1f} s", flush=True)
+
+
+def main():
+    """Runs the bibs, holdings and items transformations in one process. The
+    tenant is logged in to and the reference data fetched once, and the id maps
+    are handed on without being saved and read back"""
+    args = parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    # The tenant of the first transformation is used for all of them
+    first = next(iter(args.stages.values()))
+    if first.reference_snapshot:
+        folio_client = SnapshotFolioClient.load(first.reference_snapshot)
+    else:
+        folio_client = FolioClient(
+            first.okapi_url, first.tenant_id, first.username, first.password
+        )
+    # Each transformation fetches the lists it uses that are not loaded yet,
+    # with its own --fetch-threads
+    ref_data = ReferenceData(folio_client=folio_client)
+    migrate(args.stages, folio_client, ref_data)
+
+
+if __name__ == "__main__":
+    main()
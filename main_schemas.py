@@ -0,0 +1,44 @@
+'''Main "script."'''
+import argparse
+
+from marc_to_folio.schema_cache import save_schemas
+
+
+def parse_args():
+    """Parse CLI Arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "schema_file", help="file to save the schemas in, like schemas.json"
+    )
+    parser.add_argument(
+        "--mod-inventory",
+        help=("Tag or branch of mod-inventory to fetch the instance schema from"),
+        default="master",
+    )
+    parser.add_argument(
+        "--mod-inventory-storage",
+        help=(
+            "Tag or branch of mod-inventory-storage to fetch the instance storage, "
+            "holdings and item schemas from"
+        ),
+        default="master",
+    )
+    return parser.parse_args()
+
+
+def main():
+    """Fetches the JSON schemas the transformations validate and map against,
+    for running them with --schema-file"""
+    args = parse_args()
+    save_schemas(
+        args.schema_file,
+        {
+            "mod-inventory": args.mod_inventory,
+            "mod-inventory-storage": args.mod_inventory_storage,
+        },
+    )
+    print(f"Done. Schemas saved to {args.schema_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+'''Main "script."'''
+import argparse
+
+from folioclient.FolioClient import FolioClient
+
+from marc_to_folio.reference_snapshot import take_snapshot
+
+
+def parse_args():
+    """Parse CLI Arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("okapi_url", help=("OKAPI base url"))
+    parser.add_argument("tenant_id", help=("id of the FOLIO tenant."))
+    parser.add_argument("username", help=("the api user"))
+    parser.add_argument("password", help=("the api users password"))
+    parser.add_argument(
+        "snapshot_file",
+        help="file to save the snapshot in, like reference_snapshot.json.gz",
+    )
+    return parser.parse_args()
+
+
+def main():
+    """Saves the reference data, mapping rules and settings of a tenant, for
+    running the transformations with --reference-snapshot"""
+    args = parse_args()
+    folio_client = FolioClient(
+        args.okapi_url, args.tenant_id, args.username, args.password
+    )
+    take_snapshot(folio_client, args.snapshot_file)
+    print(f"Done. Snapshot of {args.tenant_id} saved to {args.snapshot_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 """ Class that processes each MARC record """
 from io import StringIO
+from marc_to_folio.folio_ids import DuplicateLegacyIdError
 from marc_to_folio.rules_mapper_bibs import BibsRulesMapper
-import uuid
 from pymarc.field import Field
 
 from pymarc.writer import JSONWriter, XMLWriter
@@ -15,27 +15,43 @@ from jsonschema import ValidationError, validate
 class BibsProcessor:
     """the processor"""
 
-    def __init__(self, mapper, folio_client, results_file, args):
+    def __init__(
+        self,
+        mapper,
+        folio_client,
+        results_file,
+        args,
+        srs_records_file=None,
+        marc_xml_writer=None,
+    ):
         self.ils_flavour = args.ils_flavour
         self.create_marc_xml_dump = args.dump
         self.suppress = args.suppress
         self.results_folder = args.results_folder
         self.results_file = results_file
         self.folio_client = folio_client
-        self.instance_schema = folio_client.get_instance_json_schema()
+        self.instance_schema = mapper.schemas.get("instance_storage")
         self.mapper: BibsRulesMapper = mapper
         self.args = args
+        # Worker processes hand in their own buffers instead of the result files
         if self.create_marc_xml_dump:
-            self.marc_xml_writer = XMLWriter(
+            self.marc_xml_writer = marc_xml_writer or XMLWriter(
                 open(os.path.join(self.results_folder, "marc_xml_dump.xml"), "wb+")
             )
-        self.srs_records_file = open(
+        self.srs_records_file = srs_records_file or open(
             os.path.join(self.results_folder, "srs.json"), "w+"
         )
         self.start = time.time()
 
     def process_record(self, marc_record, inventory_only):
         """processes a marc record and saves it"""
+        mapped = self.map_record(marc_record, inventory_only)
+        if mapped:
+            self.write_record(self.serialize_record(mapped))
+
+    def map_record(self, marc_record, inventory_only):
+        """Transforms a marc record. Returns the record, the instance and the id
+        of the SRS record, or None if the record failed transformation"""
         try:
             legacy_id = self.mapper.get_legacy_id(marc_record, self.ils_flavour)
         except Exception as ee:
@@ -45,12 +61,21 @@ class BibsProcessor:
             # Transform the MARC21 to a FOLIO record
             folio_rec = self.mapper.parse_bib(marc_record, inventory_only)
             if self.validate_instance(folio_rec, marc_record):
-                write_to_file(self.results_file, self.args.postgres_dump, folio_rec)
-                self.save_source_record(marc_record, folio_rec)
+                srs_id = self.mapper.folio_ids.new_id("srs_records", legacy_id[0])
+                marc_record.add_ordered_field(
+                    Field(
+                        tag="999",
+                        indicators=["f", "f"],
+                        subfields=["i", folio_rec["id"], "s", srs_id],
+                    )
+                )
                 self.mapper.add_stats(
                     self.mapper.stats, "Successfully transformed bibs"
                 )
+                return marc_record, folio_rec, srs_id
 
+        except DuplicateLegacyIdError:
+            self.count_duplicate(legacy_id)
         except ValueError as value_error:
             self.mapper.add_to_migration_report(
                 "Records failed to migrate due to Value errors found in Transformation",
@@ -88,6 +113,33 @@ class BibsProcessor:
             if folio_rec:
                 print(folio_rec)
             raise inst
+        return None
+
+    def serialize_record(self, mapped):
+        """Creates the lines for the result files. Uses no state of the mapper,
+        so records can be serialized on other threads"""
+        marc_record, instance, srs_id = mapped
+        srs_record_string = get_srs_string(
+            (
+                marc_record,
+                instance["id"],
+                srs_id,
+                self.folio_client.get_metadata_construct(),
+                self.suppress,
+            )
+        )
+        return (
+            get_record_line(self.args.postgres_dump, instance),
+            srs_record_string,
+            marc_record,
+        )
+
+    def write_record(self, serialized):
+        instance_line, srs_record_string, marc_record = serialized
+        self.results_file.write(instance_line)
+        self.srs_records_file.write(f"{srs_record_string}\n")
+        if not self.suppress and self.create_marc_xml_dump:
+            self.marc_xml_writer.write(marc_record)
 
     def validate_instance(self, folio_rec, marc_record):
         if self.args.validate:
@@ -109,17 +161,32 @@ class BibsProcessor:
             return False
         return True
 
+    def count_duplicate(self, legacy_id):
+        """Counts a record left out since the record with the legacy id before
+        it keeps the id"""
+        self.mapper.add_to_migration_report(
+            "Records failed to migrate due to duplicate legacy ids", f"{legacy_id}"
+        )
+        self.mapper.add_stats(self.mapper.stats, "Duplicate legacy ids")
+        self.mapper.add_stats(
+            self.mapper.stats, "Bib records that failed transformation"
+        )
+
     def wrap_up(self):
         """Finalizes the mapping by writing things out."""
+        self.mapper.report_counters()
         try:
             self.mapper.wrap_up()
         except Exception as exception:
             print(f"error during wrap up {exception}")
-        print("Saving map of old and new IDs")
         if self.mapper.id_map:
-            map_path = os.path.join(self.results_folder, "instance_id_map.json")
-            with open(map_path, "w+") as id_map_file:
-                json.dump(self.mapper.id_map, id_map_file, sort_keys=True, indent=4)
+            if not self.args.no_id_map_file:
+                print("Saving map of old and new IDs")
+                map_path = os.path.join(self.results_folder, "instance_id_map.json")
+                with open(map_path, "w+") as id_map_file:
+                    json.dump(
+                        self.mapper.id_map, id_map_file, sort_keys=True, indent=4
+                    )
             self.mapper.stats["Number of Instances in map"] = len(self.mapper.id_map)
         print("Saving holdings created from bibs")
         if any(self.mapper.holdings_map):
@@ -131,38 +198,18 @@ class BibsProcessor:
             self.marc_xml_writer.close()
         self.srs_records_file.close()
 
-    def save_source_record(self, marc_record, instance):
-        """Saves the source Marc_record to the Source record Storage module"""
-        srs_id = str(uuid.uuid4())
-
-        marc_record.add_ordered_field(
-            Field(
-                tag="999",
-                indicators=["f", "f"],
-                subfields=["i", instance["id"], "s", srs_id],
-            )
-        )
-        srs_record_string = get_srs_string(
-            (
-                marc_record,
-                instance["id"],
-                srs_id,
-                self.folio_client.get_metadata_construct(),
-                self.suppress,
-            )
-        )
-        self.srs_records_file.write(f"{srs_record_string}\n")
-        if not self.suppress and self.create_marc_xml_dump:
-            self.marc_xml_writer.write(marc_record)
-
 
 def write_to_file(file, pg_dump, folio_record):
     """Writes record to file. pg_dump=true for importing directly via the
     psql copy command"""
+    file.write(get_record_line(pg_dump, folio_record))
+
+
+def get_record_line(pg_dump, folio_record):
     if pg_dump:
-        file.write("{}\t{}\n".format(folio_record["id"], json.dumps(folio_record)))
+        return "{}\t{}\n".format(folio_record["id"], json.dumps(folio_record))
     else:
-        file.write("{}\n".format(json.dumps(folio_record)))
+        return "{}\n".format(json.dumps(folio_record))
 
 
 def get_srs_string(my_tuple):
@@ -0,0 +1,105 @@
+"""Splitting of large record files into byte ranges that can be processed
+independently of each other"""
+import os
+
+
+def line_aligned_ranges(path, start, chunk_bytes):
+    """Splits the file from start into (start, end) byte ranges of about
+    chunk_bytes each. Every range ends right after a line break, so no line is
+    split between two ranges"""
+    file_size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as records_file:
+        while start < file_size:
+            records_file.seek(min(start + chunk_bytes, file_size))
+            records_file.readline()
+            end = min(records_file.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def read_range(path, start, end):
+    with open(path, "rb") as records_file:
+        records_file.seek(start)
+        return records_file.read(end - start)
+
+
+def iso2709_shard_ranges(paths, shard_index, shard_count):
+    """Splits the ISO2709 files into shard_count parts of about the same number
+    of bytes and returns the (path, start, end) ranges of the part with index
+    shard_index. A record belongs to the shard its first byte falls into, so the
+    shards are disjoint and together cover every record of every file"""
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} not in range 0-{shard_count - 1}")
+    sizes = [os.path.getsize(path) for path in paths]
+    total = sum(sizes)
+    shard_start = total * shard_index // shard_count
+    shard_end = total * (shard_index + 1) // shard_count
+    ranges = []
+    file_offset = 0
+    for path, size in zip(paths, sizes):
+        start = max(shard_start - file_offset, 0)
+        end = min(shard_end - file_offset, size)
+        file_offset += size
+        if start >= end:
+            continue
+        with open(path, "rb") as marc_file:
+            start = next_record_start(marc_file, start, size)
+            end = next_record_start(marc_file, end, size)
+        if start < end:
+            ranges.append((path, start, end))
+    return ranges
+
+
+def next_record_start(marc_file, position, file_size):
+    """Returns the offset of the first record starting at or after position.
+    Records end with a record terminator, and the record length in leader
+    positions 0-4 is used to make sure it really was one"""
+    while 0 < position < file_size:
+        marc_file.seek(position - 1)
+        buffer = b""
+        terminator = -1
+        while terminator == -1:
+            data = marc_file.read(65536)
+            if not data:
+                return file_size
+            buffer += data
+            terminator = buffer.find(RECORD_TERMINATOR)
+        candidate = position + terminator
+        if candidate >= file_size or is_record_start(marc_file, candidate, file_size):
+            return min(candidate, file_size)
+        position = candidate + 1
+    return min(position, file_size)
+
+
+def is_record_start(marc_file, position, file_size):
+    marc_file.seek(position)
+    length = marc_file.read(5)
+    if not length.isdigit() or position + int(length) > file_size:
+        return False
+    marc_file.seek(position + int(length) - 1)
+    return marc_file.read(1) == RECORD_TERMINATOR
+
+
+class ByteRangeReader:
+    """Read-only file-like object giving access to the bytes from start to end
+    of an open file, so a MARCReader can read one shard of the file"""
+
+    def __init__(self, records_file, start, end):
+        self.records_file = records_file
+        self.records_file.seek(start)
+        self.remaining = end - start
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.records_file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.records_file.close()
+
+
+RECORD_TERMINATOR = b"\x1d"
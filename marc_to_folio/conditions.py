@@ -1,79 +1,108 @@
+import collections
+import functools
 import logging
 import traceback
 import re
 
+from marc_to_folio.instance_formats import InstanceFormats
+from marc_to_folio.reference_data import ReferenceData
+
+
+# Conditions whose result only depends on the value, the parameter and, where
+# True, the second indicator of the field. These can be memoized
+PURE_CONDITIONS = {
+    "trim_period": False,
+    "trim": False,
+    "remove_ending_punc": False,
+    "remove_prefix_by_indicator": True,
+    "char_select": False,
+    "capitalize": False,
+    "remove_substring": False,
+}
+
+# The reference data each condition looks things up in
+CONDITION_REFERENCE_DATA = {
+    "set_instance_format_id": ("instance_formats",),
+    "set_identifier_type_id_by_value": ("identifier_types",),
+    "set_identifier_type_id_by_name": ("identifier_types",),
+    "set_holding_note_type_id_by_name": ("holding_note_types",),
+    "set_classification_type_id": ("class_types",),
+    "set_contributor_name_type_id": ("contrib_name_types",),
+    "set_note_type_id": ("instance_note_types",),
+    "set_contributor_type_id": ("contributor_types",),
+    "set_contributor_type_text": ("contributor_types",),
+    "set_url_relationship": ("electronic_access_relationships",),
+    "set_electronic_access_relations_id": ("electronic_access_relationships",),
+    "set_alternative_title_type_id": ("alt_title_types",),
+    "set_location_id_by_code": ("locations",),
+    "set_instance_type_id": ("instance_types",),
+}
+
 
 class Conditions:
-    def __init__(self, folio, mapper):
+    def __init__(self, folio, mapper, memo_size=0, ref_data=None):
         self.filter_chars = r"[.,\/#!$%\^&\*;:{}=\-_`~()]"
         self.stats = {}
         self.filter_chars_dop = r"[.,\/#!$%\^&\*;:{}=\_`~()]"
         self.filter_last_chars = r",$"
         self.folio = folio
-        self.electronic_access_relationships = {}
-        self.default_contributor_type = ""
+        # The last field a contributor type was looked up for, and its type
+        self.contributor_type_of_field = (None, None)
         self.mapper = mapper
         self.cache = {}
-        print(f"Fetched {len(self.folio.modes_of_issuance)} modes of issuances")
-        print(f"Fetched {len(self.folio.identifier_types)} identifier types")
-        print(f"Fetched {len(self.folio.instance_note_types)} note types")
-        print(f"Fetched {len(self.folio.class_types)} Classification types")
-        print(f"Fetched {len(self.folio.contrib_name_types)} contrib_name_types")
-        print(f"Fetched {len(self.folio.contributor_types)} contributor_types")
-        print(f"Fetched {len(self.folio.alt_title_types)} alt_title_types")
-        print(f"Fetched {len(self.folio.instance_types)} instance_types")
-        print(f"Fetched {len(self.folio.instance_formats)} instance_formats")
-        self.electronic_access_relationships = list(
-            self.folio.folio_get_all(
-                "/electronic-access-relationships",
-                "electronicAccessRelationships",
-                "?query=cql.allRecords=1 sortby name",
-            )
-        )
-        self.default_contributor_name_type = self.folio.contrib_name_types[0]["id"]
-        print(f"Default contributor name type is {self.default_contributor_name_type}")
-        print(
-            f"Fetched {len(self.electronic_access_relationships)} electronic_access_relationships"
-        )
+        # Results of the pure conditions, when memo_size is set
+        self.memo = ConditionMemo(memo_size) if memo_size > 0 else None
+        # Reference data shared with the mapper, loaded when first used
+        self.ref_data = ref_data or ReferenceData(folio_client=folio)
         self.ref_data_dicts = {}
-        self.holding_note_types = list(
-            self.folio.folio_get_all(
-                "/holdings-note-types",
-                "holdingsNoteTypes",
-                "?query=cql.allRecords=1 sortby name",
-            )
-        )
-        print(f"Fetched {len(self.holding_note_types)} holding_note_types")
 
-        self.call_number_types = list(
-            self.folio.folio_get_all(
-                "/call-number-types",
-                "callNumberTypes",
-                "?query=cql.allRecords=1 sortby name",
-            )
-        )
-        print(f"Fetched {len(self.call_number_types)} call_number_types")
-
-        self.locations = list(
-            self.folio.folio_get_all(
-                "/locations",
-                "locations",
-            )
-        )
-        print(f"Fetched {len(self.locations)} locations")
-        print(f"{len(self.folio.contrib_name_types)} contrib_name_types in tenant")
+    @functools.cached_property
+    def instance_formats(self):
+        return InstanceFormats(self.ref_data.records("instance_formats"))
+
+    @functools.cached_property
+    def default_contributor_type(self):
+        return self.ref_data.by_code("contributor_types", "ctb")
+
+    @functools.cached_property
+    def default_contributor_name_type(self):
+        return self.ref_data.records("contrib_name_types")[0]["id"]
+
+    @staticmethod
+    def reference_data_for(condition_names):
+        """Returns the names of the reference data the conditions use"""
+        return {
+            ref_name
+            for name in condition_names
+            for ref_name in CONDITION_REFERENCE_DATA.get(name, ())
+        }
 
     def get_condition(self, name, value, parameter=None, marc_field=None):
         try:
             if not self.cache.get(name, ""):
-                self.cache[name] = getattr(self, "condition_" + str(name))
+                self.cache[name] = self.resolve_condition(name)
             return self.cache[name](value, parameter, marc_field)
 
         except AttributeError as attrib_error:
-            self.mapper.add_to_migration_report(
-                "Unhandled condition defined in mapping rules", name
-            )
-            return ""
+            return self.unhandled_condition(name, value, parameter, marc_field)
+
+    def resolve_condition(self, name):
+        """Returns the function of a condition in the mapping rules. Conditions
+        not handled here resolve to a function that reports them"""
+        condition = getattr(self, "condition_" + str(name), None)
+        if condition is None:
+            return functools.partial(self.unhandled_condition, name)
+        if self.memo and name in PURE_CONDITIONS:
+            condition = self.memo.wrap(name, condition, PURE_CONDITIONS[name])
+        if self.mapper.profile:
+            condition = self.mapper.profile.timed_condition(name, condition)
+        return condition
+
+    def unhandled_condition(self, name, value, parameter, marc_field):
+        self.mapper.add_to_migration_report(
+            "Unhandled condition defined in mapping rules", name
+        )
+        return ""
 
     def condition_trim_period(self, value, parameter, marc_field):
         return value.strip().rstrip(".").rstrip(",")
@@ -91,18 +120,15 @@ class Conditions:
     def condition_set_instance_format_id(self, value, parameter, marc_field):
         # This method only handles the simple case of 2-character codes of RDA in the first 338$b
         # Other cases are handled in performAddidtionalParsing in the mapper class
-        format = next(
-            (f for f in self.folio.instance_formats if f["code"] == value),
-            None,
-        )
-        if format:
+        format_id = self.instance_formats.id_by_code(value)
+        if format_id:
             self.mapper.add_to_migration_report(
-                "Instance formats", f"{format['name']} set by mapping rules"
+                "Instance formats", self.instance_formats.mapped_measure(value)
             )
-            return format["id"]
+            return format_id
         else:
             self.mapper.add_to_migration_report(
-                "Instance formats", f"338$b value {value} not found in FOLIO"
+                "Instance formats", self.instance_formats.unmapped_measure(value)
             )
             return ""
 
@@ -133,27 +159,27 @@ class Conditions:
         return roles.get(marc_field.indicator2, "")
 
     def condition_set_identifier_type_id_by_value(self, value, parameter, marc_field):
-        if not self.folio.identifier_types:
+        if not self.ref_data.records("identifier_types"):
             raise ValueError("No identifier_types setup in tenant")
         if "oclc_regex" in parameter:
             if re.match(parameter["oclc_regex"], value):
                 t = self.get_ref_data_tuple_by_name(
-                    self.folio.identifier_types,
-                    "identifier_types",
-                    parameter["names"][1],
+                    "identifier_types", parameter["names"][1]
                 )
                 self.mapper.add_to_migration_report("Mapped identifier types", t[1])
                 return t[0]
             else:
                 t = self.get_ref_data_tuple_by_name(
-                    self.folio.identifier_types,
-                    "identifier_types",
-                    parameter["names"][0],
+                    "identifier_types", parameter["names"][0]
                 )
                 self.mapper.add_to_migration_report("Mapped identifier types", t[1])
                 return t[0]
         identifier_type = next(
-            (f for f in self.folio.identifier_types if f["name"] in parameter["names"]),
+            (
+                f
+                for f in self.ref_data.records("identifier_types")
+                if f["name"] in parameter["names"]
+            ),
             None,
         )
         self.mapper.add_to_migration_report(
@@ -171,39 +197,31 @@ class Conditions:
         return my_id
 
     def condition_set_holding_note_type_id_by_name(self, value, parameter, marc_field):
-        t = self.get_ref_data_tuple_by_name(
-            self.holding_note_types, "holding_note_types", parameter["name"]
-        )
+        t = self.get_ref_data_tuple_by_name("holding_note_types", parameter["name"])
         self.mapper.add_to_migration_report("Mapped note types", t[1])
         return t[0]
 
     def condition_set_classification_type_id(self, value, parameter, marc_field):
         # undef = next((f['id'] for f in self.folio.class_types
         #             if f['name'] == 'No type specified'), '')
-        if not self.folio.class_types:
+        if not self.ref_data.records("class_types"):
             raise ValueError("No class_types setup in tenant")
-        return self.get_ref_data_tuple_by_name(
-            self.folio.class_types, "class_types", parameter["name"]
-        )[0]
+        return self.get_ref_data_tuple_by_name("class_types", parameter["name"])[0]
 
     def condition_char_select(self, value, parameter, marc_field):
         return value[parameter["from"] : parameter["to"]]
 
     def condition_set_identifier_type_id_by_name(self, value, parameter, marc_field):
-        if not self.folio.identifier_types:
+        if not self.ref_data.records("identifier_types"):
             raise ValueError("No identifier_types setup in tenant")
-        t = self.get_ref_data_tuple_by_name(
-            self.folio.identifier_types, "identifier_types", parameter["name"]
-        )
+        t = self.get_ref_data_tuple_by_name("identifier_types", parameter["name"])
         self.mapper.add_to_migration_report("Mapped identifier types", t[1])
         return t[0]
 
     def condition_set_contributor_name_type_id(self, value, parameter, marc_field):
-        if not self.folio.contrib_name_types:
+        if not self.ref_data.records("contrib_name_types"):
             raise Exception("No contributor name types setup in tenant")
-        t = self.get_ref_data_tuple_by_name(
-            self.folio.contrib_name_types, "contrib_name_types", parameter["name"]
-        )
+        t = self.get_ref_data_tuple_by_name("contrib_name_types", parameter["name"])
         if not t:
             self.mapper.add_to_migration_report(
                 "Unmapped contributor name types", parameter["name"]
@@ -213,37 +231,20 @@ class Conditions:
         return t[0]
 
     def condition_set_note_type_id(self, value, parameter, marc_field):
-        t = self.get_ref_data_tuple_by_name(
-            self.folio.instance_note_types, "instance_not_types", parameter["name"]
-        )
+        t = self.get_ref_data_tuple_by_name("instance_note_types", parameter["name"])
         self.mapper.add_to_migration_report("Mapped note types", t[1])
         return t[0]
 
     def condition_set_contributor_type_id(self, value, parameter, marc_field):
-        if not self.folio.contributor_types:
-            raise ValueError("No contributor_types setup in tenant")
-        if not self.default_contributor_type:
-            self.default_contributor_type = next(
-                ct for ct in self.folio.contributor_types if ct["code"] == "ctb"
-            )
-        for subfield in marc_field.get_subfields("4", "e"):
-            for cont_type in self.folio.contributor_types:
-                if subfield == cont_type["code"]:
-                    self.mapper.add_to_migration_report(
-                        "Mapped contributor types", cont_type["name"]
-                    )
-                    return cont_type["id"]
-                elif subfield == cont_type["name"]:
-                    self.mapper.add_to_migration_report(
-                        "Mapped contributor types", cont_type["name"]
-                    )
-                    return cont_type["id"]
-        self.mapper.add_to_migration_report(
-            "Mapped contributor types", self.default_contributor_type["name"]
-        )
-        return self.default_contributor_type["id"]
+        cont_type = self.get_contributor_type(marc_field)
+        self.mapper.add_to_migration_report("Mapped contributor types", cont_type[1])
+        return cont_type[0]
 
     def condition_set_instance_id_by_map(self, value, parameter, marc_field):
+        if self.mapper.instance_id_map is None:
+            # Only matches instances with one legacy id. main_holdings.py does not
+            # run Aleph records without the map
+            return self.mapper.folio_ids.legacy_id_to_id("instances", value)
         if value in self.mapper.instance_id_map:
             return self.mapper.instance_id_map[value]["id"]
         else:
@@ -259,39 +260,43 @@ class Conditions:
         }
         ind2 = marc_field.indicator2
         name = enum.get(ind2, enum["8"])
-        if not self.electronic_access_relationships:
+        if not self.ref_data.records("electronic_access_relationships"):
             raise ValueError("No electronic_access_relationships setup in tenant")
-        t = self.get_ref_data_tuple_by_name(
-            self.electronic_access_relationships,
-            "electronic_access_relationships",
-            name,
-        )
+        t = self.get_ref_data_tuple_by_name("electronic_access_relationships", name)
         self.mapper.add_to_migration_report(
             "Mapped electronic access relationships types", t[1]
         )
         return t[0]
 
     def condition_set_contributor_type_text(self, value, parameter, marc_field):
-        if not self.folio.contributor_types:
+        return self.get_contributor_type(marc_field)[1]
+
+    def get_contributor_type(self, marc_field):
+        """Returns (id, name) of the contributor type of the first $4 or $e
+        matching the code or name of one, ignoring case, or of the type with the
+        code ctb. The type of the last field is remembered, since both its id
+        and text are mapped"""
+        if self.contributor_type_of_field[0] is marc_field:
+            return self.contributor_type_of_field[1]
+        if not self.ref_data.records("contributor_types"):
             raise ValueError("No contributor_types setup in tenant")
-        if not self.default_contributor_type:
-            self.default_contributor_type = next(
-                ct for ct in self.folio.contributor_types if ct["code"] == "ctb"
-            )
         for subfield in marc_field.get_subfields("4", "e"):
-            for cont_type in self.folio.contributor_types:
-                if subfield == cont_type["code"]:
-                    return cont_type["name"]
-                elif subfield == cont_type["name"]:
-                    return cont_type["name"]
-        return self.default_contributor_type["name"]
+            cont_type = self.ref_data.by_code(
+                "contributor_types", subfield
+            ) or self.ref_data.by_name("contributor_types", subfield)
+            if cont_type:
+                break
+        else:
+            cont_type = self.default_contributor_type
+        if cont_type is None:
+            raise ValueError("No contributor type with the code ctb in tenant")
+        self.contributor_type_of_field = (marc_field, cont_type)
+        return cont_type
 
     def condition_set_alternative_title_type_id(self, value, parameter, marc_field):
-        if not self.folio.alt_title_types:
+        if not self.ref_data.records("alt_title_types"):
             raise ValueError("No alt_title_types setup in tenant")
-        t = self.get_ref_data_tuple_by_name(
-            self.folio.alt_title_types, "alt_title_types", parameter["name"]
-        )
+        t = self.get_ref_data_tuple_by_name("alt_title_types", parameter["name"])
         if not t:
             raise Exception(
                 f"Alternative title type not found for {parameter['name']} {marc_field}"
@@ -321,70 +326,52 @@ class Conditions:
             mapped_code = value
 
         # Get the FOLIO UUID for the code and return it
-        t = self.get_ref_data_tuple_by_code(self.locations, "locations", mapped_code)
+        t = self.get_ref_data_tuple_by_code("locations", mapped_code)
         if not t:
             t = self.get_ref_data_tuple_by_code(
-                self.locations, "locations", parameter["unspecifiedLocationCode"]
+                "locations", parameter["unspecifiedLocationCode"]
             )
         self.mapper.add_to_migration_report("Mapped Locations", t[1])
         return t[0]
 
-    def get_ref_data_tuple_by_code(self, ref_data, ref_name, code):
-        return self.get_ref_data_tuple(ref_data, ref_name, code, "code")
+    def get_ref_data_tuple_by_code(self, ref_name, code):
+        return self.get_ref_data_tuple(ref_name, code, "code")
 
-    def get_ref_data_tuple_by_name(self, ref_data, ref_name, name):
-        return self.get_ref_data_tuple(ref_data, ref_name, name, "name")
+    def get_ref_data_tuple_by_name(self, ref_name, name):
+        return self.get_ref_data_tuple(ref_name, name, "name")
 
-    def get_ref_data_tuple(self, ref_data, ref_name, key_value, key_type):
-        dict_key = f"{ref_name}{key_type}"
-        if dict_key not in self.ref_data_dicts:
-            d = {}
-            for r in ref_data:
-                d[r[key_type].lower()] = (r["id"], r["name"])
-            self.ref_data_dicts[dict_key] = d
-        ref_object = (
-            self.ref_data_dicts[dict_key][key_value.lower()]
-            if key_value.lower() in self.ref_data_dicts[dict_key]
-            else None
-        )
+    def get_ref_data_tuple(self, ref_name, key_value, key_type):
+        ref_object = self.ref_data.lookup(ref_name, key_value, key_type)
         if not ref_object:
-            logging.debug(f"No matching element for {key_value} in {list(ref_data)}")
+            logging.debug(f"No matching element for {key_value} in {ref_name}")
             return None
         if validate_uuid(ref_object[0]):
             return ref_object
         else:
-            raise Exception(f"UUID Validation error for {key_value} in {ref_data}")
+            raise Exception(f"UUID Validation error for {key_value} in {ref_name}")
 
     def condition_remove_substring(self, value, parameter, marc_field):
         return value.replace(parameter["substring"], "")
 
     def condition_set_instance_type_id(self, value, parameter, marc_field):
-        if not self.folio.instance_types:
+        if not self.ref_data.records("instance_types"):
             raise Exception("No instance_types setup in tenant")
         
         if marc_field.tag == "336" and "b" not in marc_field:
              self.mapper.add_to_migration_report("Mapped Instance types", f"Subfield b not in 336")
 
         if marc_field.tag == "336" and "b" in marc_field:
-            t = self.get_ref_data_tuple_by_code(
-                self.folio.instance_types, "instance_types", marc_field["b"]
-            )
+            t = self.get_ref_data_tuple_by_code("instance_types", marc_field["b"])
             if not t:
-                t = self.get_ref_data_tuple_by_code(
-                    self.folio.instance_types, "instance_types", "zzz"
-                )
+                t = self.get_ref_data_tuple_by_code("instance_types", "zzz")
                 self.mapper.add_to_migration_report("Mapped Instance types", f"Code {marc_field['b']} not found in FOLIO (from 336$b)")
             else:
                 self.mapper.add_to_migration_report("Mapped Instance types", f"{t[1]} (from 336$b)")
             return t[0]
         elif marc_field.tag == "008":
-            t = self.get_ref_data_tuple_by_code(
-                self.folio.instance_types, "instance_types", value[:3]
-            )
+            t = self.get_ref_data_tuple_by_code("instance_types", value[:3])
             if not t:
-                t = self.get_ref_data_tuple_by_code(
-                    self.folio.instance_types, "instance_types", "zzz"
-                )
+                t = self.get_ref_data_tuple_by_code("instance_types", "zzz")
                 self.mapper.add_to_migration_report("Mapped Instance types",f"Code {value[:3]} in 008 not found in FOLIO)")
             else:
                 self.mapper.add_to_migration_report("Mapped Instance types",f"{t[1]} (from 008)")
@@ -392,9 +379,7 @@ class Conditions:
             return t[0]
         else:
             # TODO Remove later. Corenell specific
-            t = self.get_ref_data_tuple_by_code(
-                self.folio.instance_types, "instance_types", "txt"
-            )
+            t = self.get_ref_data_tuple_by_code("instance_types", "txt")
             self.mapper.add_to_migration_report(
                 "Mapped Instance types (No 336$b)", t[1]
             )
@@ -415,13 +400,9 @@ class Conditions:
         ind2 = marc_field.indicator2
         name = enum.get(ind2, enum["3"])
 
-        if not self.electronic_access_relationships:
+        if not self.ref_data.records("electronic_access_relationships"):
             raise ValueError("No electronic_access_relationships setup in tenant")
-        t = self.get_ref_data_tuple_by_name(
-            self.electronic_access_relationships,
-            "electronic_access_relationships",
-            name,
-        )
+        t = self.get_ref_data_tuple_by_name("electronic_access_relationships", name)
         self.mapper.add_to_migration_report(
             "Mapped electronic access relationships types", t[1]
         )
@@ -437,3 +418,54 @@ def validate_uuid(my_uuid):
         return True
     else:
         return False"""
+
+
+class ConditionMemo:
+    """Remembers the results of pure conditions for the max_size most recently
+    used values, parameters and indicators"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.results = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def wrap(self, name, condition, uses_indicator):
+        """Returns condition, with its results looked up here first"""
+        results = self.results
+
+        def memoized(value, parameter, marc_field):
+            key = (
+                name,
+                value,
+                tuple(sorted(parameter.items())) if parameter else None,
+                marc_field.indicator2 if uses_indicator else None,
+            )
+            try:
+                result = results[key]
+            except KeyError:
+                self.misses += 1
+                result = condition(value, parameter, marc_field)
+                results[key] = result
+                if len(results) > self.max_size:
+                    results.popitem(last=False)
+                    self.evictions += 1
+                return result
+            self.hits += 1
+            results.move_to_end(key)
+            return result
+
+        return memoized
+
+    def add_to_report(self, report):
+        """Adds the hits, misses and evictions since the last call to a
+        TransformationReport"""
+        memo_report = report.migration_report.setdefault("Condition memo", {})
+        for measure, count in [
+            ("Hits", self.hits),
+            ("Misses", self.misses),
+            ("Evictions", self.evictions),
+        ]:
+            memo_report[measure] = memo_report.get(measure, 0) + count
+        self.hits = self.misses = self.evictions = 0
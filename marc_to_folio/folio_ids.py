@@ -0,0 +1,57 @@
+"""Creation of the ids of new FOLIO records"""
+import uuid
+
+
+class DuplicateLegacyIdError(ValueError):
+    """The legacy id of a record has already been used to create an id"""
+
+
+class FolioIds:
+    """Creates the ids of new FOLIO records. The ids are random by default.
+    With deterministic set, an id is derived from the legacy id of the record
+    with a UUID namespace per tenant and object type. Reruns then create the
+    same ids, and the ids of parent records can be computed from the legacy
+    ids instead of being looked up in the id maps of earlier runs.
+
+    Only the first legacy id of a record is used, so records with several
+    legacy ids, like Aleph records, can only be linked to through the id map.
+    Two records with the same legacy id would get the same id, so the second
+    one raises a DuplicateLegacyIdError"""
+
+    object_types = ["instances", "holdings", "items", "srs_records"]
+
+    def __init__(self, folio_client, deterministic=False):
+        self.deterministic = deterministic
+        tenant_namespace = uuid.uuid5(
+            uuid.NAMESPACE_URL,
+            f"{folio_client.okapi_url.rstrip('/')}/{folio_client.tenant_id}",
+        )
+        self.namespaces = {
+            object_type: uuid.uuid5(tenant_namespace, object_type)
+            for object_type in self.object_types
+        }
+        # The ids created so far, by object type
+        self.created_ids = {object_type: set() for object_type in self.object_types}
+
+    def new_id(self, object_type, legacy_id):
+        if not self.deterministic:
+            return str(uuid.uuid4())
+        return self.claim(object_type, legacy_id)
+
+    def claim(self, object_type, legacy_id):
+        """Returns the id derived from the legacy id. Raises a
+        DuplicateLegacyIdError if it has been returned before"""
+        new_id = self.legacy_id_to_id(object_type, legacy_id)
+        created_ids = self.created_ids[object_type]
+        if new_id in created_ids:
+            raise DuplicateLegacyIdError(
+                f"Duplicate legacy id {str(legacy_id).strip()} of {object_type}"
+            )
+        created_ids.add(new_id)
+        return new_id
+
+    def legacy_id_to_id(self, object_type, legacy_id):
+        legacy_id = str(legacy_id or "").strip()
+        if not legacy_id:
+            raise ValueError(f"No legacy id to create the id of the {object_type} from")
+        return str(uuid.uuid5(self.namespaces[object_type], legacy_id))
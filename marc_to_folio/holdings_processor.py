@@ -6,6 +6,8 @@ import logging
 import os
 from datetime import datetime as dt
 from jsonschema import ValidationError, validate
+from marc_to_folio.folio_ids import DuplicateLegacyIdError
+from marc_to_folio.transformation_report import TransformationReport
 
 
 class HoldingsProcessor:
@@ -13,6 +15,9 @@ class HoldingsProcessor:
 
     def __init__(self, mapper, folio_client, results_file, args):
         self.results_file = results_file
+        # Counters of the write stage, kept apart from the ones of the mapper
+        # on the map thread of a pipeline
+        self.report = TransformationReport()
         self.records_count = 0
         self.mapper = mapper
         self.args = args
@@ -24,18 +29,29 @@ class HoldingsProcessor:
 
     def process_record(self, marc_record):
         """processes a marc holdings record and saves it"""
+        folio_rec = self.map_record(marc_record)
+        if folio_rec:
+            self.write_record(self.serialize_record(folio_rec))
+
+    def map_record(self, marc_record):
+        """Transforms a marc holdings record. Returns None if it failed"""
         try:
             self.records_count += 1
             # Transform the MARC21 to a FOLIO record
             folio_rec = self.mapper.parse_hold(marc_record)
-            write_to_file(self.results_file, self.args.postgres_dump, folio_rec)
-            add_stats(self.mapper.stats, "Holdings records written to disk")
             # Print progress
             if self.records_count % 10000 == 0:
                 logging.error(self.mapper.stats)
                 elapsed = self.records_count / (time.time() - self.start)
                 elapsed_formatted = "{0:.4g}".format(elapsed)
                 logging.error(f"{elapsed_formatted}\t\t{self.records_count}")
+            return folio_rec
+        except DuplicateLegacyIdError as duplicate_error:
+            # The record with the legacy id before this one keeps the id, and
+            # its entry in the id map
+            add_stats(self.mapper.stats, "Duplicate legacy ids")
+            add_stats(self.mapper.stats, "Failed records")
+            logging.error(duplicate_error)
         except ValueError as value_error:
             add_stats(self.mapper.stats, "Value errors")
             add_stats(self.mapper.stats, "Failed records")
@@ -64,16 +80,34 @@ class HoldingsProcessor:
             logging.error(inst)
             logging.error(marc_record)
             raise inst
+        return None
+
+    def skip_record(self, marc_record, exception):
+        """Counts a record that failed with an unexpected exception in a
+        pipeline, which keeps going with the next record"""
+        add_stats(self.mapper.stats, "Exceptions")
+        add_stats(self.mapper.stats, "Failed records")
+        logging.error(exception)
+
+    def serialize_record(self, folio_rec):
+        return get_record_line(self.args.postgres_dump, folio_rec)
+
+    def write_record(self, line):
+        self.results_file.write(line)
+        self.report.add_stats("Holdings records written to disk")
 
     def wrap_up(self):
         """Finalizes the mapping by writing things out."""
+        self.mapper.report_counters()
+        self.mapper.report.merge(self.report)
         id_map = self.mapper.holdings_id_map
-        path = os.path.join(self.args.result_folder, "holdings_id_map.json")
-        logging.warning(
-            "Saving map of {} old and new IDs to {}".format(len(id_map), path)
-        )
-        with open(path, "w+") as id_map_file:
-            json.dump(id_map, id_map_file, indent=4)
+        if not self.args.no_id_map_file:
+            path = os.path.join(self.args.result_folder, "holdings_id_map.json")
+            logging.warning(
+                "Saving map of {} old and new IDs to {}".format(len(id_map), path)
+            )
+            with open(path, "w+") as id_map_file:
+                json.dump(id_map, id_map_file, indent=4)
         logging.warning(f"{self.records_count} records processed")
         mrf = os.path.join(self.args.result_folder, "holdings_transformation_report.md")
         with open(mrf, "w+") as report_file:
@@ -85,16 +119,18 @@ class HoldingsProcessor:
             )
             self.mapper.write_migration_report(report_file)
             self.mapper.print_mapping_report(report_file)
+            self.mapper.write_timings(report_file)
+        self.mapper.report.save(
+            os.path.join(self.args.result_folder, "holdings_transformation_report.json.gz")
+        )
         print(f"Done. Transformation report written to {report_file}")
 
 
-def write_to_file(file, pg_dump, folio_record):
-    """Writes record to file. pg_dump=true for importing directly via the
-    psql copy command"""
+def get_record_line(pg_dump, folio_record):
     if pg_dump:
-        file.write("{}\t{}\n".format(folio_record["id"], json.dumps(folio_record)))
+        return "{}\t{}\n".format(folio_record["id"], json.dumps(folio_record))
     else:
-        file.write("{}\n".format(json.dumps(folio_record)))
+        return "{}\n".format(json.dumps(folio_record))
 
 
 def add_stats(stats, a):
@@ -0,0 +1,68 @@
+"""Hands out the numbers of the HRIDs created for records without one"""
+
+
+class HridBlock:
+    """A contiguous range of HRID numbers, used up from its start. end is
+    exclusive. A block without an end never runs out"""
+
+    def __init__(self, start, end=None):
+        self.start = start
+        self.end = end
+        self.next_number = start
+
+    def take(self):
+        if self.end is not None and self.next_number >= self.end:
+            raise ValueError(
+                f"HRID numbers {self.start}-{self.end - 1} are used up. "
+                "Rerun with a larger --shard-hrid-block"
+            )
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def used_range(self):
+        return self.start, self.next_number
+
+
+class HridAllocator:
+    """Gives out disjoint blocks of HRID numbers from start_number up to (not
+    including) end_number, to a worker process per chunk of records or to a
+    shard. The ranges used are recorded, so the start number in the tenant's
+    HRID settings can be moved past them once at the end of the run"""
+
+    def __init__(self, start_number, end_number=None):
+        self.start_number = start_number
+        self.end_number = end_number
+        self.next_block_start = start_number
+        self.used_ranges = []
+
+    def allocate(self, size=None):
+        """Returns the next block of size numbers, or all numbers left if size
+        is None"""
+        start = self.next_block_start
+        if start is None:
+            raise ValueError("All HRID numbers have been handed out")
+        end = self.end_number
+        if size is not None:
+            end = start + size if end is None else min(start + size, end)
+        # A block without an end takes all numbers left
+        self.next_block_start = None if end is None else max(start, end)
+        return HridBlock(start, end)
+
+    def release(self, used_range):
+        """Records the numbers used from a block"""
+        start, end = used_range
+        if end > start:
+            self.used_ranges.append((start, end))
+
+    def merged_ranges(self):
+        merged = []
+        for start, end in sorted(self.used_ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def next_free_number(self):
+        return max([end for _, end in self.used_ranges], default=self.start_number)
@@ -0,0 +1,34 @@
+"""Instance formats of the tenant by RDA carrier code"""
+
+
+class InstanceFormats:
+    """Looks up the instance format ids of RDA carrier codes, from a 338$b or
+    a one character 337$b (media type) and 338$b combined. Built once from the
+    instance formats of the tenant. The report measures are created once per
+    code"""
+
+    def __init__(self, instance_formats):
+        # code -> (id, name), the first format with the code wins
+        self.formats = {}
+        for f in instance_formats:
+            self.formats.setdefault(f["code"], (f["id"], f["name"]))
+        self.mapped_measures = {
+            code: f"{name} set by mapping rules"
+            for code, (_, name) in self.formats.items()
+        }
+        self.unmapped_measures = {}
+
+    def id_by_code(self, code):
+        """Returns the id of the format with the code, or an empty string"""
+        found = self.formats.get(code)
+        return found[0] if found else ""
+
+    def mapped_measure(self, code):
+        return self.mapped_measures[code]
+
+    def unmapped_measure(self, code):
+        measure = self.unmapped_measures.get(code)
+        if measure is None:
+            measure = f"338$b value {code} not found in FOLIO"
+            self.unmapped_measures[code] = measure
+        return measure
@@ -1,8 +1,8 @@
 """The Alabama mapper, responsible for parsing Items acording to the
 FOLIO community specifications"""
-import logging
+from marc_to_folio.folio_ids import DuplicateLegacyIdError, FolioIds
+from marc_to_folio.reference_data import ReferenceData
 from marc_to_folio.rules_mapper_base import RulesMapperBase
-import uuid
 import json
 import csv
 import sys
@@ -28,10 +28,15 @@ class ItemsDefaultMapper(RulesMapperBase):
         location_map: Dict,
         other_maps,
         args,
+        ref_data=None,
     ):
-        super().__init__(folio)
+        super().__init__(
+            folio,
+            None,
+            ref_data or ReferenceData(folio_client=folio),
+            schema_file=getattr(args, "schema_file", ""),
+        )
         self.args = args
-        self.ref_data_dicts = {}
         self.legacy_item_type_map = other_maps[0]
         self.duplicate_item_ids = {}
         self.legacy_material_type_map = other_maps[1]
@@ -41,38 +46,28 @@ class ItemsDefaultMapper(RulesMapperBase):
         csv.register_dialect("pipe", delimiter="|")
         self.folio = folio
         self.missing_holdings_ids = {}
-        self.item_schema = folio.get_item_schema()
+        self.item_schema = self.schemas.get("item")
         self.item_id_map: Dict[str, str] = {}
         self.item_to_item_map = item_map
+        # Without a map, the holdings ids are derived from the legacy holdings ids
         self.holdings_id_map = holdings_id_map
-        self.loan_types = list(
-            self.folio.folio_get_all("/loan-types", "loantypes"))
-        print(f"{len(self.loan_types)} loan types set up in tenant", flush=True)
-        self.material_types = list(
-            self.folio.folio_get_all("/material-types", "mtypes")
-        )
-        print(f"{len(self.material_types)} material types set up in tenant", flush=True)
+        self.folio_ids = FolioIds(folio, getattr(args, "deterministic_ids", False))
+        self.loan_types = self.ref_data.records("loan_types")
+        self.material_types = self.ref_data.records("material_types")
         """Locations stuff"""
         self.locations_map: Dict[str, str] = {}
         self.setup_locations(location_map)
         print(f"Location map set up with FOLIO locations", flush=True)
         """Note types"""
-        self.item_note_types = list(
-            self.folio.folio_get_all("/item-note-types", "itemNoteTypes")
-        )
-        print(
-            f"{len(self.item_note_types)} Item note types set up in tenant", flush=True
-        )
-        self.note_id = next(
-            x["id"] for x in self.item_note_types if "Note" == x["name"]
-        )
+        self.item_note_types = self.ref_data.records("item_note_types")
+        self.note_id = self.ref_data.by_name("item_note_types", "Note")[0]
 
         print(
             f"Default Loan type is {self.item_to_item_map['defaultLoantypeName']}",
             flush=True,
         )
         self.default_loan_type = self.get_ref_data_tuple_by_name(
-            self.loan_types, "loan_types", self.item_to_item_map["defaultLoantypeName"]
+            "loan_types", self.item_to_item_map["defaultLoantypeName"]
         )[0]
         print(
             f"Default Loan type UUID is {self.default_loan_type}", flush=True)
@@ -91,9 +86,7 @@ class ItemsDefaultMapper(RulesMapperBase):
             flush=True,
         )
         self.default_material_type = self.get_ref_data_tuple_by_name(
-            self.material_types,
-            "material_types",
-            self.item_to_item_map["defaultMaterialTypeName"],
+            "material_types", self.item_to_item_map["defaultMaterialTypeName"]
         )
         print(
             f"Default Material type UUID is {self.default_material_type}", flush=True)
@@ -104,7 +97,7 @@ class ItemsDefaultMapper(RulesMapperBase):
             "legacyFieldsToCountValuesFor"
         ]
         try:
-            item = self.instantiate_item()
+            item = self.instantiate_item(legacy_id)
             for legacy_key, temp_legacy_value in legacy_item.items():
                 legacy_value = (
                     str(temp_legacy_value).strip()
@@ -157,7 +150,11 @@ class ItemsDefaultMapper(RulesMapperBase):
                         item[folio_field] = self.handle_circulation_notes(
                             legacy_value)
                     elif folio_field == "holdingsRecordId":
-                        if legacy_value not in self.holdings_id_map:
+                        if self.holdings_id_map is None:
+                            item[folio_field] = self.folio_ids.legacy_id_to_id(
+                                "holdings", legacy_value
+                            )
+                        elif legacy_value not in self.holdings_id_map:
                             self.add_stats(
                                 self.stats, "Holdings id not in map")
                             # self.add_to_migration_report(
@@ -209,6 +206,11 @@ class ItemsDefaultMapper(RulesMapperBase):
             else:
                 self.item_id_map[legacy_id] = item["id"]
             return item
+        except DuplicateLegacyIdError:
+            # Not written, since the item before it already has the id
+            self.add_stats(self.duplicate_item_ids, legacy_id)
+            self.add_stats(self.stats, "Duplicate item ids")
+            return None
         except ValueError as ve:
             self.add_stats(self.stats, f"Total failed items with Value errors. Items not migrated")
             self.add_to_migration_report("ValueErrors", f"{ve}")
@@ -222,7 +224,7 @@ class ItemsDefaultMapper(RulesMapperBase):
 
     def setup_locations(self, location_map):
         temp_map = {}
-        for loc in self.folio.locations:
+        for loc in self.ref_data.records("locations"):
             key = loc[self.item_to_item_map["mapOnLocationField"]].strip()
             temp_map[key] = loc["id"]
         if location_map and any(location_map):
@@ -279,18 +281,11 @@ class ItemsDefaultMapper(RulesMapperBase):
         # self.print_mapping_report()
 
     def get_loc_id(self, loc_code):
-        folio_loc_id = next(
-            (
-                l["id"]
-                for l in self.folio.locations
-                if loc_code.strip().casefold() == l["code"].casefold()
-            ),
-            "",
-        )
-        if not folio_loc_id:
+        location = self.ref_data.by_code("locations", loc_code.strip())
+        if not location:
             self.add_stats(self.stats, "Location code not found in FOLIO")
             raise ValueError(f"Location code not found in FOLIO: {loc_code}")
-        return folio_loc_id
+        return location[0]
 
     def get_records(self, file):
         reader = None
@@ -321,9 +316,9 @@ class ItemsDefaultMapper(RulesMapperBase):
             traceback.print_exc()
             raise ee
 
-    def instantiate_item(self):
+    def instantiate_item(self, legacy_id):
         item = {
-            "id": str(uuid.uuid4()),
+            "id": self.folio_ids.new_id("items", legacy_id),
             "status": {"name": "Available"},
             "metadata": self.folio.get_metadata_construct(),
         }
@@ -360,11 +355,8 @@ class ItemsDefaultMapper(RulesMapperBase):
         note_type_name: str = "",
         staffOnly: bool = False,
     ):
-        nt_id = next(
-            (x["id"]
-             for x in self.item_note_types if note_type_name == x["name"]),
-            self.note_id,
-        )
+        note_type = self.ref_data.by_name("item_note_types", note_type_name)
+        nt_id = note_type[0] if note_type else self.note_id
         note_to_add = {
             "itemNoteTypeId": nt_id,
             "note": note_string,
@@ -409,9 +401,7 @@ class ItemsDefaultMapper(RulesMapperBase):
             if all(all_good):
                 folio_name = row["folio_name"]
 
-                t = self.get_ref_data_tuple_by_name(
-                    self.material_types, "material_types", folio_name
-                )
+                t = self.get_ref_data_tuple_by_name("material_types", folio_name)
                 if t:
                     self.add_to_migration_report(
                         "Mapped Material Types", f'{t[1]} - {" - ".join(fieldvalues)}'
@@ -434,9 +424,7 @@ class ItemsDefaultMapper(RulesMapperBase):
                 all_good.append(legacy_item[k] in row[k])
             if all(all_good):
                 folio_name = row["folio_name"]
-                t = self.get_ref_data_tuple_by_name(
-                    self.loan_types, "loan_types", folio_name
-                )
+                t = self.get_ref_data_tuple_by_name("loan_types", folio_name)
                 if t:
                     self.add_to_migration_report(
                         "Mapped loan types", f'{t[1]}: {" - ".join(fieldvalues)}'
@@ -449,26 +437,8 @@ class ItemsDefaultMapper(RulesMapperBase):
         )
         return self.default_loan_type
 
-    def get_ref_data_tuple_code(self, ref_data, ref_name, code):
-        return self.get_ref_data_tuple(ref_data, ref_name, code, "code")
-
-    def get_ref_data_tuple_by_name(self, ref_data, ref_name, name):
-        return self.get_ref_data_tuple(ref_data, ref_name, name, "name")
-
-    def get_ref_data_tuple(self, ref_data, ref_name, key_value, key_type):
-        dict_key = f"{ref_name}{key_type}"
-        if dict_key not in self.ref_data_dicts:
-            d = {}
-            for r in ref_data:
-                d[r[key_type].lower()] = (r["id"], r["name"])
-            self.ref_data_dicts[dict_key] = d
-        ref_object = (
-            self.ref_data_dicts[dict_key][key_value.lower()]
-            if key_value.lower() in self.ref_data_dicts[dict_key]
-            else None
-        )
-        if not ref_object:
-            logging.debug(
-                f"No matching element for {key_value} in {list(ref_data)}")
-            return None
-        return ref_object
+    def get_ref_data_tuple_code(self, ref_name, code):
+        return self.get_ref_data_tuple(ref_name, code, "code")
+
+    def get_ref_data_tuple_by_name(self, ref_name, name):
+        return self.get_ref_data_tuple(ref_name, name, "name")
@@ -5,6 +5,7 @@ import json
 import os
 from datetime import datetime as dt
 from jsonschema import ValidationError, validate
+from marc_to_folio.transformation_report import TransformationReport
 
 
 class ItemsProcessor:
@@ -12,9 +13,8 @@ class ItemsProcessor:
 
     def __init__(self, mapper, folio_client, results_file, args):
         self.results_file = results_file
-        self.item_schema = folio_client.get_item_schema()
-        self.stats = {}
-        self.migration_report = {}
+        self.item_schema = mapper.schemas.get("item")
+        self.report = TransformationReport()
         self.records_count = 0
         self.mapper = mapper
         self.instance_id_map = {}
@@ -24,16 +24,19 @@ class ItemsProcessor:
 
     def process_record(self, record):
         """processes a marc item record and saves it"""
+        folio_rec = self.map_record(record)
+        # write record to file
+        if folio_rec:
+            self.write_record(self.serialize_record(folio_rec))
+
+    def map_record(self, record):
+        """Transforms an item. Returns None if it failed"""
         try:
             self.records_count += 1
             # Transform the item to a FOLIO record
             folio_rec = self.mapper.parse_item(record)
             if self.args.validate:
                 validate(folio_rec, self.item_schema)
-            # write record to file
-            if folio_rec:
-                write_to_file(self.results_file, self.args.postgres_dump, folio_rec)
-                add_stats(self.stats, "Number of Items written to disk")
             # Print progress
             if self.records_count % 10000 == 0:
                 elapsed = self.records_count / (time.time() - self.start)
@@ -41,6 +44,7 @@ class ItemsProcessor:
                 print(
                     "{}\t\t{}".format(elapsed_formatted, self.records_count), flush=True
                 )
+            return folio_rec
         except ValueError as value_error:
             # print(marc_record)
             print(value_error)
@@ -58,10 +62,24 @@ class ItemsProcessor:
             print(record)
             raise inst
 
+    def skip_record(self, record, exception):
+        """Counts an item that failed in a pipeline, which keeps going with the
+        next item"""
+        self.mapper.add_stats(self.mapper.stats, "Failed items. Items not migrated")
+        print(f"Item failed: {exception}")
+
+    def serialize_record(self, folio_rec):
+        return get_record_line(self.args.postgres_dump, folio_rec)
+
+    def write_record(self, line):
+        self.results_file.write(line)
+        self.report.add_stats("Number of Items written to disk")
+
     def wrap_up(self):
         """Finalizes the mapping by writing things out."""
         id_map = self.mapper.item_id_map
-        self.mapper.stats = {**self.stats, **self.mapper.stats}
+        self.mapper.report_counters()
+        self.mapper.report.merge(self.report)
         path = os.path.join(self.args.result_path, "item_id_map.json")
         print("Saving map of {} old and new IDs to {}".format(len(id_map), path))
         with open(path, "w+") as id_map_file:
@@ -76,21 +94,17 @@ class ItemsProcessor:
             )
             self.mapper.write_migration_report(report_file)
             self.mapper.print_mapping_report(report_file)
-
-    def add_to_migration_report(self, header, messageString):
-        # TODO: Move to interface or parent class
-        if header not in self.migration_report:
-            self.migration_report[header] = list()
-        self.migration_report[header].append(messageString)
+            self.mapper.write_timings(report_file)
+        self.mapper.report.save(
+            os.path.join(self.args.result_path, "items_transformation_report.json.gz")
+        )
 
 
-def write_to_file(file, pg_dump, folio_record):
-    """Writes record to file. pg_dump=true for importing directly via the
-    psql copy command"""
+def get_record_line(pg_dump, folio_record):
     if pg_dump:
-        file.write("{}\t{}\n".format(folio_record["id"], json.dumps(folio_record)))
+        return "{}\t{}\n".format(folio_record["id"], json.dumps(folio_record))
     else:
-        file.write("{}\n".format(json.dumps(folio_record)))
+        return "{}\n".format(json.dumps(folio_record))
 
 
 def add_stats(stats, a):
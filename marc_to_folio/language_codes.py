@@ -0,0 +1,74 @@
+"""The MARC language codes of the Library of Congress, and the clean up of the
+language codes in 041 and 008.
+
+The codes are fetched from LoC, or read from a file with one code per line.
+With --language-codes FILE, main_bibs.py saves the fetched codes to FILE the
+first time and reads them from it after that. Delete the file to fetch the
+codes again.
+"""
+import os
+import xml.etree.ElementTree as ET
+
+import requests
+
+LOC_LANGUAGES_URL = "https://www.loc.gov/standards/codelists/languages.xml"
+
+# Codes that are left out without being reported
+FORBIDDEN_CODES = frozenset(["###", "zxx", "n/a", "N/A", "|||"])
+
+# Codes often found in records, and the MARC codes they are replaced with
+REPLACEMENTS = {"jap": "jpn", "fra": "fre", "sve": "swe", "tys": "ger"}
+
+
+def fetch_language_codes():
+    """Fetches the list of standardized language codes from LoC"""
+    tree = ET.fromstring(requests.get(LOC_LANGUAGES_URL).content)
+    name_space = "{info:lc/xmlns/codelist-v1}"
+    xpath_expr = "{0}languages/{0}language/{0}code".format(name_space)
+    return [code.text for code in tree.findall(xpath_expr)]
+
+
+def load_language_codes(codes_file=""):
+    """Returns LanguageCodes read from codes_file, or fetched from LoC and
+    saved to codes_file if it does not exist"""
+    if codes_file and os.path.isfile(codes_file):
+        with open(codes_file) as codes:
+            language_codes = LanguageCodes(line.strip() for line in codes)
+        print(f"Read {len(language_codes.codes)} language codes from {codes_file}")
+        return language_codes
+    print("Fetching valid language codes...")
+    language_codes = LanguageCodes(fetch_language_codes())
+    if codes_file:
+        with open(codes_file, "w") as codes:
+            codes.writelines(f"{code}\n" for code in sorted(language_codes.codes))
+        print(f"Language codes saved to {codes_file}")
+    return language_codes
+
+
+class LanguageCodes:
+    """The valid codes, and what each code found in the records is cleaned up
+    to. The results are remembered, so each distinct code is only looked at
+    once per run"""
+
+    def __init__(self, codes):
+        self.codes = frozenset(code for code in codes if code)
+        # code in a record -> valid code, "" to leave it out, None if unknown
+        self.normalized = {}
+
+    def normalize(self, value):
+        """Returns the valid code of value, "" if it should be left out, or
+        None if it is not recognized"""
+        try:
+            return self.normalized[value]
+        except KeyError:
+            pass
+        if value in self.codes and value not in FORBIDDEN_CODES:
+            normalized = value
+        elif value in REPLACEMENTS:
+            normalized = REPLACEMENTS[value]
+        elif not value.strip() or value in FORBIDDEN_CODES:
+            normalized = ""
+        else:
+            normalized = None
+        self.normalized[value] = normalized
+        return normalized
@@ -0,0 +1,203 @@
+"""Mapping rules compiled into plans, once before any records are mapped.
+
+The /mapping-rules document (or a holdings rules file) does not change during a
+run, so everything that can be read from it up front is: which way a mapping
+is applied, the conditions to run and their functions, the subfields to read
+and the keys of entity properties. The mappers only run the plans.
+
+The plans print as readable text, for debugging rules:
+
+    print(mapper.mapping_plans["245"])
+"""
+
+# How RulesMapperBase.apply_rules gets the value of a mapping
+CONCATENATED = "concatenated subfields"  # conditions on the subfields joined
+FIRST_SUBFIELDS = "first of each subfield"  # conditions on each, joined
+EACH_SUBFIELD = "each subfield"  # conditions on each, distinct values joined
+WHOLE_FIELD = "whole field"  # conditions on the formatted field
+VALUE = "constant value"  # the value in the rule
+SUBFIELDS = "subfields"  # the subfields joined, no conditions
+
+# What RulesMapperBase.map_field_according_to_mapping does with a mapping
+APPLY_RULES = "apply rules"
+ADD_VALUE = "add value"
+ADD_FIELD = "add formatted field"
+ENTITY = "entity"
+
+
+class RulePlan:
+    """How to get the value(s) of one mapping or entity property"""
+
+    __slots__ = ["path", "subfields", "conditions", "parameter", "value", "split"]
+
+    def __init__(self, mapping, conditions):
+        self.subfields = tuple(mapping.get("subfield", []))
+        self.split = bool(mapping.get("subFieldSplit", ""))
+        self.value = ""
+        self.parameter = {}
+        # (name, function) pairs, run in the order of the rule
+        self.conditions = ()
+        if has_conditions(mapping):
+            condition = mapping["rules"][0]["conditions"][0]
+            self.conditions = tuple(
+                (name, conditions.resolve_condition(name))
+                for name in (x.strip() for x in condition["type"].split(","))
+            )
+            self.parameter = condition.get("parameter", {})
+            if mapping.get("applyRulesOnConcatenatedData", ""):
+                self.path = CONCATENATED
+            elif self.subfields and mapping.get("ignoreSubsequentFields", False):
+                self.path = FIRST_SUBFIELDS
+            elif self.subfields:
+                self.path = EACH_SUBFIELD
+            else:
+                self.path = WHOLE_FIELD
+        elif has_value_to_add(mapping):
+            self.path = VALUE
+            self.value = mapping["rules"][0]["value"]
+        else:
+            self.path = SUBFIELDS
+
+    def __getstate__(self):
+        # The condition functions are bound to a Conditions, so only their
+        # names are pickled. bind_conditions resolves them again
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state["conditions"] = tuple(name for name, _ in self.conditions)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.conditions = tuple((name, None) for name in self.conditions)
+
+    def bind(self, conditions):
+        self.conditions = tuple(
+            (name, conditions.resolve_condition(name)) for name, _ in self.conditions
+        )
+
+    def __repr__(self):
+        parts = [self.path]
+        if self.subfields:
+            parts.append(" ".join(f"${s}" for s in self.subfields))
+        if self.conditions:
+            parts.append(", ".join(name for name, _ in self.conditions))
+        if self.parameter:
+            parts.append(f"parameter {self.parameter}")
+        if self.path == VALUE:
+            parts.append(repr(self.value))
+        if self.split:
+            parts.append("split in threes")
+        return " | ".join(parts)
+
+
+class EntityPlan:
+    """The properties of an object created from a field"""
+
+    __slots__ = ["parent", "per_subfield", "properties"]
+
+    def __init__(self, mapping, conditions):
+        entity = mapping["entity"]
+        self.parent = entity[0]["target"].split(".")[0]
+        self.per_subfield = mapping.get("entityPerRepeatedSubfield", False)
+        # (property key, RulePlan) pairs
+        self.properties = [
+            (m["target"].split(".")[-1], RulePlan(m, conditions)) for m in entity
+        ]
+
+    def __repr__(self):
+        lines = [f"{self.parent}{' per subfield' if self.per_subfield else ''}"]
+        lines.extend(f"    .{key}: {rule}" for key, rule in self.properties)
+        return "\n".join(lines)
+
+
+class MappingPlan:
+    __slots__ = ["action", "target", "rule", "entity", "genre"]
+
+    def __init__(self, tag, mapping, conditions):
+        self.target = mapping.get("target", "")
+        self.rule = None
+        self.entity = None
+        # Genre/form terms are added to the subjects with a prefix
+        self.genre = False
+        if "entity" in mapping:
+            self.action = ENTITY
+            self.entity = EntityPlan(mapping, conditions)
+        elif has_conditions(mapping):
+            self.action = APPLY_RULES
+            self.rule = RulePlan(mapping, conditions)
+            self.genre = tag == "655"
+        elif has_value_to_add(mapping):
+            self.action = ADD_VALUE
+            self.rule = RulePlan(mapping, conditions)
+        else:
+            self.action = ADD_FIELD
+
+    def __repr__(self):
+        if self.action == ENTITY:
+            return f"entity {self.entity!r}"
+        if self.action == ADD_FIELD:
+            return f"{self.target}: {self.action}"
+        genre = " | prefixed with Genre:" if self.genre else ""
+        return f"{self.target}: {self.rule!r}{genre}"
+
+
+class FieldPlan:
+    """The mappings of one MARC tag"""
+
+    __slots__ = ["tag", "mappings", "ignore_subsequent_fields"]
+
+    def __init__(self, tag, mappings, conditions):
+        self.tag = tag
+        self.mappings = [MappingPlan(tag, m, conditions) for m in mappings]
+        # Only the first field with the tag is mapped
+        self.ignore_subsequent_fields = any(
+            m.get("ignoreSubsequentFields", False) for m in mappings
+        )
+
+    def __repr__(self):
+        first_only = " (first field only)" if self.ignore_subsequent_fields else ""
+        lines = [f"{self.tag}{first_only}"]
+        lines.extend("  " + repr(m).replace("\n", "\n  ") for m in self.mappings)
+        return "\n".join(lines)
+
+
+def compile_mappings(mappings, conditions):
+    """Compiles mapping rules by tag into FieldPlans by tag. conditions
+    resolves the condition names to functions"""
+    return {
+        tag: FieldPlan(tag, tag_mappings, conditions)
+        for tag, tag_mappings in mappings.items()
+    }
+
+
+def bind_conditions(plans, conditions):
+    """Resolves the conditions of unpickled FieldPlans by tag with conditions"""
+    for field_plan in plans.values():
+        for mapping in field_plan.mappings:
+            if mapping.rule:
+                mapping.rule.bind(conditions)
+            if mapping.entity:
+                for _, rule in mapping.entity.properties:
+                    rule.bind(conditions)
+    return plans
+
+
+def condition_names(plans):
+    """Returns the names of the conditions in FieldPlans by tag"""
+    names = set()
+    for field_plan in plans.values():
+        for mapping in field_plan.mappings:
+            rules = [mapping.rule] if mapping.rule else []
+            if mapping.entity:
+                rules.extend(rule for _, rule in mapping.entity.properties)
+            for rule in rules:
+                names.update(name for name, _ in rule.conditions)
+    return names
+
+
+def has_conditions(mapping):
+    return mapping.get("rules", []) and mapping["rules"][0].get("conditions", [])
+
+
+def has_value_to_add(mapping):
+    return mapping.get("rules", []) and mapping["rules"][0].get("value", "")
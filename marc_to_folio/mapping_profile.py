@@ -0,0 +1,46 @@
+"""Times spent mapping, by MARC tag and by condition, for finding what slows
+a transformation down. Only collected when profiling is turned on"""
+import time
+
+TAGS = "MARC tag"
+CONDITIONS = "Condition"
+
+
+class MappingProfile:
+    """Counts the calls and adds up the total and slowest time by section and
+    key until they are added to a TransformationReport"""
+
+    def __init__(self):
+        self.timings = {TAGS: {}, CONDITIONS: {}}
+
+    def add(self, section, key, seconds):
+        timings = self.timings[section]
+        timing = timings.get(key)
+        if timing is None:
+            timings[key] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+    def timed_condition(self, name, condition):
+        """Returns condition, timed"""
+        add = self.add
+        clock = time.perf_counter
+
+        def timed(value, parameter, marc_field):
+            start = clock()
+            try:
+                return condition(value, parameter, marc_field)
+            finally:
+                add(CONDITIONS, name, clock() - start)
+
+        return timed
+
+    def add_to_report(self, report):
+        """Adds the times since the last call to a TransformationReport"""
+        for section, timings in self.timings.items():
+            for key, timing in timings.items():
+                report.add_timings(section, key, *timing)
+        self.timings = {TAGS: {}, CONDITIONS: {}}
@@ -0,0 +1,99 @@
+"""Streaming reader for large MARCXML files, like OAI-PMH harvests"""
+import os
+import time
+import xml.etree.ElementTree as ET
+
+from pymarc import Field, Record
+
+MARCXML_NAMESPACE = "{http://www.loc.gov/MARC21/slim}"
+RECORD_TAGS = {f"{MARCXML_NAMESPACE}record", "record"}
+
+
+class MarcXmlReader:
+    """Iterates over the records in a MARCXML file. The file is parsed
+    incrementally and every element is dropped as soon as it has been read, so
+    the memory used does not grow with the size of the file. Records in other
+    namespaces, like the OAI-PMH record envelopes, are skipped.
+
+    Yields None for records that could not be read, with the reason in
+    current_exception, like pymarc's MARCReader"""
+
+    def __init__(self, path):
+        self.path = path
+        self.records_read = 0
+        self.parse_seconds = 0.0
+        self.current_exception = None
+        self.current_chunk = None
+
+    def __iter__(self):
+        started = time.time()
+        # Open elements outside of MARC records. Ended elements are removed
+        # from their parent so the tree never grows
+        open_elements = []
+        record_depth = None
+        for event, element in ET.iterparse(self.path, events=("start", "end")):
+            if event == "start":
+                if record_depth is None and element.tag in RECORD_TAGS:
+                    record_depth = len(open_elements)
+                if record_depth is None or len(open_elements) == record_depth:
+                    open_elements.append(element)
+                continue
+            if record_depth is not None and element is not open_elements[-1]:
+                # Leader, fields and subfields are read with their record
+                continue
+            open_elements.pop()
+            is_record = record_depth is not None
+            if is_record:
+                record_depth = None
+                record = self.to_record(element)
+            element.clear()
+            if open_elements:
+                open_elements[-1].remove(element)
+            if is_record:
+                self.records_read += 1
+                self.parse_seconds += time.time() - started
+                yield record
+                started = time.time()
+        self.parse_seconds += time.time() - started
+
+    def to_record(self, record_element):
+        try:
+            record = Record()
+            for child in record_element:
+                tag = child.tag.replace(MARCXML_NAMESPACE, "")
+                if tag == "leader":
+                    record.leader = child.text or ""
+                elif tag == "controlfield":
+                    record.add_field(Field(tag=child.get("tag"), data=child.text or ""))
+                elif tag == "datafield":
+                    subfields = []
+                    for subfield in child:
+                        subfields.extend([subfield.get("code"), subfield.text or ""])
+                    record.add_field(
+                        Field(
+                            tag=child.get("tag"),
+                            indicators=[child.get("ind1", " "), child.get("ind2", " ")],
+                            subfields=subfields,
+                        )
+                    )
+            self.current_exception = None
+            self.current_chunk = None
+            return record
+        except Exception as exception:
+            self.current_exception = exception
+            self.current_chunk = ET.tostring(record_element, encoding="unicode")
+            return None
+
+    def report_throughput(self, report):
+        """Prints how fast the file was parsed and adds it to the
+        TransformationReport"""
+        seconds = max(self.parse_seconds, 0.000001)
+        megabytes = os.path.getsize(self.path) / 1024 / 1024
+        throughput = (
+            f"{os.path.basename(self.path)}: {self.records_read / seconds:.0f} records/sec, "
+            f"{megabytes / seconds:.1f} MB/sec"
+        )
+        print(f"Parsed {self.records_read:,} MARCXML records from {throughput}")
+        report.migration_report.setdefault("MARCXML parsing speed (records)", {})[
+            throughput
+        ] = self.records_read
@@ -0,0 +1,201 @@
+"""Reference data of the tenant, indexed once per run.
+
+The mappers and conditions look up identifier types, locations, loan types
+and so on by code, name or id for every record. ReferenceData fetches and
+indexes each list the first time it is used, so a run only loads what its
+mapping rules need. It is read only, and is pickled with its indexes, so
+worker processes get the lists loaded before they started without fetching
+or indexing them again.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Reference data the FolioClient fetches and keeps as properties
+FOLIO_CLIENT_LISTS = [
+    "modes_of_issuance",
+    "identifier_types",
+    "instance_note_types",
+    "class_types",
+    "contrib_name_types",
+    "contributor_types",
+    "alt_title_types",
+    "instance_types",
+    "instance_formats",
+]
+
+# Other reference data by (path, key in the response, query)
+FOLIO_ENDPOINTS = {
+    "electronic_access_relationships": (
+        "/electronic-access-relationships",
+        "electronicAccessRelationships",
+        "?query=cql.allRecords=1 sortby name",
+    ),
+    "holding_note_types": (
+        "/holdings-note-types",
+        "holdingsNoteTypes",
+        "?query=cql.allRecords=1 sortby name",
+    ),
+    "call_number_types": (
+        "/call-number-types",
+        "callNumberTypes",
+        "?query=cql.allRecords=1 sortby name",
+    ),
+    "locations": ("/locations", "locations", ""),
+    "holdings_types": ("/holdings-types", "holdingsTypes", ""),
+    "loan_types": ("/loan-types", "loantypes", ""),
+    "material_types": ("/material-types", "mtypes", ""),
+    "item_note_types": ("/item-note-types", "itemNoteTypes", ""),
+}
+
+# The reference data used by the mapping rules (Conditions)
+RULES_REFERENCE_DATA = [
+    "modes_of_issuance",
+    "identifier_types",
+    "instance_note_types",
+    "class_types",
+    "contrib_name_types",
+    "contributor_types",
+    "alt_title_types",
+    "instance_types",
+    "instance_formats",
+    "electronic_access_relationships",
+    "holding_note_types",
+    "call_number_types",
+    "locations",
+]
+HOLDINGS_REFERENCE_DATA = RULES_REFERENCE_DATA + ["holdings_types"]
+ITEMS_REFERENCE_DATA = ["loan_types", "material_types", "item_note_types", "locations"]
+
+
+# Section of the load times in the transformation report
+LOAD_TIMES = "Reference data loaded"
+
+
+def fetch_records(folio_client, name):
+    """Fetches the records of the named reference data from FOLIO"""
+    if name in FOLIO_CLIENT_LISTS:
+        return list(getattr(folio_client, name))
+    path, key, query = FOLIO_ENDPOINTS[name]
+    return list(folio_client.folio_get_all(path, key, query))
+
+
+def timed_fetch(folio_client, name):
+    """Returns the records of the named reference data and the seconds it took
+    to fetch them"""
+    start = time.perf_counter()
+    records = fetch_records(folio_client, name)
+    return records, time.perf_counter() - start
+
+
+def fetch_reference_data(folio_client, names, threads=1):
+    """Fetches the named reference data from FOLIO, in threads if more than
+    one, and indexes it"""
+    ref_data = ReferenceData(folio_client=folio_client)
+    ref_data.load(names, threads)
+    return ref_data
+
+
+class ReferenceData:
+    """Lists of reference data by name, like "identifier_types", with the
+    records indexed by case folded id, code and name. Lists not handed in
+    are fetched with folio_client when first used"""
+
+    index_keys = ("id", "code", "name")
+
+    def __init__(self, ref_data=None, folio_client=None):
+        object.__setattr__(self, "tables", {})
+        object.__setattr__(self, "folio_client", folio_client)
+        # Seconds spent fetching and indexing each list, until reported
+        object.__setattr__(self, "load_times", {})
+        for name, records in (ref_data or {}).items():
+            self.tables[name] = self.index(records)
+
+    def index(self, records):
+        records = tuple(records)
+        indexes = {key: {} for key in self.index_keys}
+        for record in records:
+            for key, index in indexes.items():
+                if isinstance(record.get(key), str):
+                    index[record[key].casefold()] = (
+                        record["id"],
+                        record.get("name", ""),
+                    )
+        return (records, indexes)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ReferenceData is read only")
+
+    def __reduce__(self):
+        return (_restore, (self.tables, self.folio_client))
+
+    def __contains__(self, name):
+        return name in self.tables
+
+    def table(self, name):
+        """Returns the records and indexes of the reference data, fetched and
+        indexed if this is the first time it is used"""
+        try:
+            return self.tables[name]
+        except KeyError:
+            if self.folio_client is None:
+                raise KeyError(f"No {name} in the reference data") from None
+        self.add_table(name, *timed_fetch(self.folio_client, name))
+        return self.tables[name]
+
+    def add_table(self, name, records, seconds):
+        self.tables[name] = self.index(records)
+        self.load_times[name] = seconds
+        print(f"Fetched {len(records)} {name} in {seconds:.2f} s")
+
+    def load(self, names, threads=1):
+        """Fetches the named reference data now, instead of when first used.
+        With more than one thread, the lists are fetched at the same time"""
+        names = [name for name in names if name not in self.tables]
+        if threads < 2 or len(names) < 2 or self.folio_client is None:
+            for name in names:
+                self.table(name)
+            return
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            fetches = {
+                name: executor.submit(timed_fetch, self.folio_client, name)
+                for name in names
+            }
+            # Indexed here, one at a time, as the fetches finish in order
+            for name, fetch in fetches.items():
+                self.add_table(name, *fetch.result())
+        print(
+            f"Fetched {len(names)} reference data lists in "
+            f"{time.perf_counter() - start:.2f} s using {threads} threads"
+        )
+
+    def add_to_report(self, report):
+        """Adds the times spent loading reference data since the last call to a
+        TransformationReport"""
+        for name, seconds in self.load_times.items():
+            report.add_timings(LOAD_TIMES, name, 1, seconds, seconds)
+        self.load_times.clear()
+
+    def records(self, name):
+        """Returns the records of the reference data as fetched"""
+        return self.table(name)[0]
+
+    def lookup(self, name, key_value, key_type="name"):
+        """Returns (id, name) of the record with key_value as its key_type
+        (id, code or name), ignoring case, or None"""
+        return self.table(name)[1][key_type].get(str(key_value).casefold())
+
+    def by_code(self, name, code):
+        return self.lookup(name, code, "code")
+
+    def by_name(self, name, record_name):
+        return self.lookup(name, record_name, "name")
+
+    def by_id(self, name, record_id):
+        return self.lookup(name, record_id, "id")
+
+
+def _restore(tables, folio_client):
+    ref_data = ReferenceData(folio_client=folio_client)
+    ref_data.tables.update(tables)
+    return ref_data
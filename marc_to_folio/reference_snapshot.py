@@ -0,0 +1,128 @@
+"""Everything the transformations fetch from the tenant, saved to one file.
+
+main_snapshot.py saves the reference data, the mapping rules, the HRID
+settings, the id of the user and the JSON schemas the FolioClient fetches.
+With --reference-snapshot, main_bibs.py, main_holdings.py and main_items.py
+run against a SnapshotFolioClient loaded from the file instead of logging in
+to the tenant, so they start without fetching anything from Okapi. The
+snapshot is only as current as the tenant was when it was taken.
+"""
+import gzip
+import json
+from datetime import datetime, timezone
+
+from marc_to_folio.reference_data import (
+    FOLIO_CLIENT_LISTS,
+    FOLIO_ENDPOINTS,
+    HOLDINGS_REFERENCE_DATA,
+    ITEMS_REFERENCE_DATA,
+    fetch_records,
+)
+
+# All the reference data of the three transformations
+SNAPSHOT_REFERENCE_DATA = list(
+    dict.fromkeys(HOLDINGS_REFERENCE_DATA + ITEMS_REFERENCE_DATA)
+)
+
+# Single objects fetched with folio_get_single_object
+SNAPSHOT_OBJECTS = ["/mapping-rules", "/hrid-settings-storage/hrid-settings"]
+
+# JSON schemas by the FolioClient method that fetches them
+SNAPSHOT_SCHEMAS = ["get_instance_json_schema", "get_item_schema"]
+
+
+def take_snapshot(folio_client, path):
+    """Fetches everything in the snapshot from the tenant and saves it"""
+    snapshot = {
+        "version": SnapshotFolioClient.version,
+        "taken": datetime.now(timezone.utc).isoformat(),
+        "okapi_url": folio_client.okapi_url,
+        "tenant_id": folio_client.tenant_id,
+        "current_user": folio_client.current_user,
+        "reference_data": {},
+        "objects": {},
+        "schemas": {},
+    }
+    for name in SNAPSHOT_REFERENCE_DATA:
+        snapshot["reference_data"][name] = fetch_records(folio_client, name)
+        print(f"Fetched {len(snapshot['reference_data'][name])} {name}")
+    for object_path in SNAPSHOT_OBJECTS:
+        snapshot["objects"][object_path] = folio_client.folio_get_single_object(
+            object_path
+        )
+        print(f"Fetched {object_path}")
+    for method in SNAPSHOT_SCHEMAS:
+        snapshot["schemas"][method] = getattr(folio_client, method)()
+        print(f"Fetched the schema of {method}")
+    with gzip.open(path, "wt", encoding="utf-8") as snapshot_file:
+        json.dump(snapshot, snapshot_file, separators=(",", ":"))
+    return snapshot
+
+
+class SnapshotFolioClient:
+    """Answers the calls the transformations make to a FolioClient from a
+    snapshot. Anything not in the snapshot raises a KeyError"""
+
+    version = 1
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.okapi_url = snapshot["okapi_url"]
+        self.tenant_id = snapshot["tenant_id"]
+        self.current_user = snapshot["current_user"]
+        self.reference_data = snapshot["reference_data"]
+        self.names_by_path = {
+            endpoint[0]: name for name, endpoint in FOLIO_ENDPOINTS.items()
+        }
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        if snapshot.get("version") != cls.version:
+            raise ValueError(
+                f"{path} is a version {snapshot.get('version')} snapshot. "
+                f"Take a new one with main_snapshot.py"
+            )
+        print(
+            f"Reference data of {snapshot['tenant_id']} loaded from {path}, "
+            f"taken {snapshot['taken']}"
+        )
+        return cls(snapshot)
+
+    def __getattr__(self, name):
+        # The reference data lists of the FolioClient, like identifier_types
+        if name in FOLIO_CLIENT_LISTS:
+            return self.reference_data[name]
+        raise AttributeError(name)
+
+    def __getstate__(self):
+        return self.snapshot
+
+    def __setstate__(self, snapshot):
+        self.__init__(snapshot)
+
+    def folio_get_all(self, path, key=None, query=""):
+        if path not in self.names_by_path:
+            raise KeyError(f"{path} is not in the reference data snapshot")
+        return iter(self.reference_data[self.names_by_path[path]])
+
+    def folio_get_single_object(self, path):
+        if path not in self.snapshot["objects"]:
+            raise KeyError(f"{path} is not in the reference data snapshot")
+        return self.snapshot["objects"][path]
+
+    def get_instance_json_schema(self):
+        return self.snapshot["schemas"]["get_instance_json_schema"]
+
+    def get_item_schema(self):
+        return self.snapshot["schemas"]["get_item_schema"]
+
+    def get_metadata_construct(self):
+        now = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        return {
+            "createdDate": now,
+            "createdByUserId": self.current_user,
+            "updatedDate": now,
+            "updatedByUserId": self.current_user,
+        }
@@ -0,0 +1,73 @@
+"""Compiled mapping rules saved to disk between runs.
+
+Compiling the mapping rules into plans is done once per mapper, which is
+once per run and once per worker process. With a cache folder, the plans
+are saved in a file named by a hash of the rules, and later runs and the
+workers load them instead of compiling the rules again. Rules that have
+changed hash differently, and files saved by an older version of the plans
+are not loaded, so a stale cache is never used.
+"""
+import hashlib
+import json
+import os
+import pickle
+
+from marc_to_folio.mapping_plan import bind_conditions, compile_mappings
+
+# Change when the plans in mapping_plan.py change, so cached plans are rebuilt
+PLAN_VERSION = 1
+
+
+def rules_key(mappings):
+    """Returns a hash of the mapping rules and the plan version"""
+    rules = json.dumps(mappings, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{PLAN_VERSION}:{rules}".encode("utf-8")).hexdigest()
+
+
+def cache_path(cache_folder, key):
+    return os.path.join(cache_folder, f"compiled_rules_{key[:16]}.pickle")
+
+
+def load_plans(cache_folder, key, conditions):
+    """Returns the cached plans of the rules with the key, bound to conditions,
+    or None if they are not cached"""
+    path = cache_path(cache_folder, key)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "rb") as cache_file:
+            cached = pickle.load(cache_file)
+    except Exception as exception:
+        print(f"Could not load the compiled rules in {path}: {exception}")
+        return None
+    if cached.get("version") != PLAN_VERSION or cached.get("key") != key:
+        print(f"The compiled rules in {path} are stale")
+        return None
+    return bind_conditions(cached["plans"], conditions)
+
+
+def save_plans(cache_folder, key, plans):
+    """Saves the plans. Written to a temporary file first, so workers starting
+    at the same time never load a file that is half written"""
+    os.makedirs(cache_folder, exist_ok=True)
+    path = cache_path(cache_folder, key)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as cache_file:
+        pickle.dump(
+            {"version": PLAN_VERSION, "key": key, "plans": plans},
+            cache_file,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(temp_path, path)
+
+
+def compile_cached(mappings, conditions, cache_folder):
+    """Returns the plans of the mapping rules, loaded from the cache folder if
+    they have been compiled before, otherwise compiled and saved there"""
+    key = rules_key(mappings)
+    plans = load_plans(cache_folder, key, conditions)
+    if plans is None:
+        plans = compile_mappings(mappings, conditions)
+        save_plans(cache_folder, key, plans)
+        print(f"Compiled mapping rules saved to {cache_path(cache_folder, key)}")
+    return plans
@@ -1,125 +1,177 @@
-import json
 import logging
 from marc_to_folio.conditions import Conditions
+from marc_to_folio.mapping_plan import (
+    ADD_FIELD,
+    ADD_VALUE,
+    APPLY_RULES,
+    CONCATENATED,
+    EACH_SUBFIELD,
+    FIRST_SUBFIELDS,
+    VALUE,
+    WHOLE_FIELD,
+    EntityPlan,
+    FieldPlan,
+    RulePlan,
+    compile_mappings,
+    condition_names,
+)
+from marc_to_folio.mapping_profile import TAGS, MappingProfile
+from marc_to_folio.rules_cache import compile_cached
+from marc_to_folio.schema_cache import load_schemas
+from marc_to_folio.subfield_pair import subfield_pairs
+from marc_to_folio.target_writers import build_target_writer
+from marc_to_folio.transformation_report import TransformationReport
 import time
 from typing import Dict, List
 import pymarc
-import copy
 
 from textwrap import wrap
 
-import requests
-
 
 class RulesMapperBase:
-    def __init__(self, folio_client, conditions = None):
-        self.migration_report = {}
-        self.mapped_folio_fields = {}
-        self.mapped_legacy_fields = {}
+    def __init__(
+        self, folio_client, conditions=None, ref_data=None, profile=False, schema_file=""
+    ):
+        self.report = TransformationReport()
+        # Times spent by tag and condition, when profiling
+        self.profile = MappingProfile() if profile else None
+        # Reference data of the tenant, shared with the conditions
+        self.ref_data = ref_data
         self.start = time.time()
-        self.stats = {}
         self.folio_client = folio_client
-        self.holdings_json_schema = fetch_holdings_schema()
-        self.instance_json_schema = get_instance_schema()
+        # The JSON schemas of this process, fetched or loaded once
+        self.schemas = load_schemas(folio_client, schema_file)
         self.schema = {}
         self.conditions = conditions
-        self.item_json_schema = ""
-        self.mappings = None
+        # The mapping rules by tag, and the plans they are compiled into
+        self._mappings = None
+        self.mapping_plans = {}
+        self.mapped_tags = frozenset()
+        # Where compiled rules are saved and loaded from, if set
+        self.rules_cache_folder = ""
+        # Writers of values by target path, built from self.schema when first used
+        self.target_writers = {}
+        self.progress_interval = 1000
         print(f"Current user id is {self.folio_client.current_user}")
 
-    def report_legacy_mapping(self, field_name, present, mapped, empty=False):
-        if field_name not in self.mapped_legacy_fields:
-            self.mapped_legacy_fields[field_name] = [
-                int(present),
-                int(mapped),
-                int(empty),
-            ]
+    @property
+    def mappings(self):
+        return self._mappings
+
+    @mappings.setter
+    def mappings(self, mappings):
+        """Compiles the mapping rules into the plans the records are mapped by"""
+        self._mappings = mappings
+        if self.rules_cache_folder and mappings:
+            self.mapping_plans = compile_cached(
+                mappings, self.conditions, self.rules_cache_folder
+            )
         else:
-            self.mapped_legacy_fields[field_name][0] += int(present)
-            self.mapped_legacy_fields[field_name][1] += int(mapped)
-            self.mapped_legacy_fields[field_name][2] += int(empty)
+            self.mapping_plans = compile_mappings(mappings or {}, self.conditions)
+        self.mapped_tags = frozenset(self.mapping_plans)
+
+    @property
+    def holdings_json_schema(self):
+        return self.schemas.get("holdings")
+
+    @property
+    def instance_json_schema(self):
+        return self.schemas.get("instance")
+
+    @property
+    def stats(self):
+        return self.report.stats
+
+    @stats.setter
+    def stats(self, stats):
+        self.report.stats = stats
+
+    @property
+    def migration_report(self):
+        return self.report.migration_report
+
+    @migration_report.setter
+    def migration_report(self, migration_report):
+        self.report.migration_report = migration_report
+
+    @property
+    def mapped_folio_fields(self):
+        return self.report.mapped_folio_fields
+
+    @mapped_folio_fields.setter
+    def mapped_folio_fields(self, mapped_folio_fields):
+        self.report.mapped_folio_fields = mapped_folio_fields
+
+    @property
+    def mapped_legacy_fields(self):
+        return self.report.mapped_legacy_fields
+
+    @mapped_legacy_fields.setter
+    def mapped_legacy_fields(self, mapped_legacy_fields):
+        self.report.mapped_legacy_fields = mapped_legacy_fields
+
+    def report_legacy_mapping(self, field_name, present, mapped, empty=False):
+        self.report.report_legacy_mapping(field_name, present, mapped, empty)
+
+    def report_field_tally(self, tally):
+        """Adds the legacy field counts of a record, and the number of fields
+        processed, to the report"""
+        if tally.processed:
+            self.report.add_stats("Total number of Tags processed", tally.processed)
+        self.report.add_legacy_mappings(tally)
 
     def report_folio_mapping(self, field_name, was_mapped, was_empty=False):
-        if field_name not in self.mapped_folio_fields:
-            self.mapped_folio_fields[field_name] = [int(was_mapped), int(was_empty)]
-        else:
-            self.mapped_folio_fields[field_name][0] += int(was_mapped)
-            self.mapped_folio_fields[field_name][1] += int(was_empty)
+        self.report.report_folio_mapping(field_name, was_mapped, was_empty)
 
     def print_mapping_report(self, report_file):
-        total_records = self.stats["Number of records in file(s)"]
-        report_file.write("\n## Mapped FOLIO fields   \n")
-        d_sorted = {
-            k: self.mapped_folio_fields[k] for k in sorted(self.mapped_folio_fields)
-        }
-        report_file.write(f"FOLIO Field | Mapped | Empty | Unmapped  \n")
-        report_file.write("--- | --- | --- | ---:  \n")
-        for k, v in d_sorted.items():
-            unmapped = total_records - v[0]
-            mapped = v[0] - v[1]
-            mp = mapped / total_records
-            mapped_per = "{:.0%}".format(mp if mp > 0 else 0)
-            report_file.write(
-                f"{k} | {mapped if mapped > 0 else 0} ({mapped_per}) | {v[1]} | {unmapped}  \n"
-            )
+        self.report.print_mapping_report(report_file)
 
-        # Legacy fields (like marc)
-        report_file.write("\n## Mapped Legacy fields  \n")
-        d_sorted = {
-            k: self.mapped_legacy_fields[k] for k in sorted(self.mapped_legacy_fields)
-        }
-        report_file.write(f"Legacy Field | Present | Mapped | Empty | Unmapped  \n")
-        report_file.write("--- | --- | --- | --- | ---:  \n")
-        for k, v in d_sorted.items():
-            present = v[0]
-            present_per = "{:.1%}".format(present / total_records)
-            unmapped = present - v[1]
-            mapped = v[1]
-            unmapped_per = "{:.1%}".format(unmapped / total_records)
-            mp = mapped / total_records
-            mapped_per = "{:.0%}".format(mp if mp > 0 else 0)
-            report_file.write(
-                f"{k} | {present if present > 0 else 0} ({present_per}) | {mapped if mapped > 0 else 0} ({mapped_per}) | {v[1]} | {unmapped}  \n"
+    def add_to_migration_report(self, header, measure_to_add):
+        self.report.add_to_migration_report(header, measure_to_add)
+
+    def get_ref_data_tuple(self, ref_name, key_value, key_type):
+        ref_object = self.ref_data.lookup(ref_name, key_value, key_type)
+        if not ref_object:
+            logging.debug(f"No matching element for {key_value} in {ref_name}")
+            return None
+        return ref_object
+
+    def report_counters(self):
+        """Adds the counts of the condition memo and the profile, and the times
+        spent loading reference data, to the report"""
+        if self.conditions and self.conditions.memo:
+            self.conditions.memo.add_to_report(self.report)
+        if self.profile:
+            self.profile.add_to_report(self.report)
+        if self.ref_data:
+            self.ref_data.add_to_report(self.report)
+
+    def preload_reference_data(self, threads=1):
+        """Loads the reference data the conditions in the mapping rules use,
+        in threads if more than one. Done before starting worker processes, so
+        they do not each fetch it"""
+        if self.conditions:
+            names = self.conditions.reference_data_for(
+                condition_names(self.mapping_plans)
             )
+            self.ref_data.load(sorted(names), threads)
 
-    def add_to_migration_report(self, header, measure_to_add):
-        if header not in self.migration_report:
-            self.migration_report[header] = {}
-        if measure_to_add not in self.migration_report[header]:
-            self.migration_report[header][measure_to_add] = 1
-        else:
-            self.migration_report[header][measure_to_add] += 1
+    def write_timings(self, report_file):
+        self.report.write_timings(report_file)
 
     def write_migration_report(self, report_file):
-
-        for a in self.migration_report:
-            report_file.write(f"   \n")
-            report_file.write(f"## {a}    \n")
-            report_file.write(f"<details><summary>Click to expand all {len(self.migration_report[a])} things</summary>     \n")
-            report_file.write(f"   \n")
-            report_file.write(f"Measure | Count   \n")
-            report_file.write(f"--- | ---:   \n")
-            b = self.migration_report[a]
-            sortedlist = [(k, b[k]) for k in sorted(b, key=as_str)]
-            for b in sortedlist:
-                report_file.write(f"{b[0]} | {b[1]}   \n")
-            report_file.write("</details>   \n")
+        self.report.write_migration_report(report_file)
 
     def print_progress(self):
         self.add_stats(self.stats, "Number of records in file(s)")
         i = self.stats["Number of records in file(s)"]
-        if i % 1000 == 0:
+        if self.progress_interval and i % self.progress_interval == 0:
             elapsed = i / (time.time() - self.start)
             elapsed_formatted = "{0:.4g}".format(elapsed)
             print(f"{elapsed_formatted} records/sec.\t\t{i:,} records processed")
 
     def print_dict_to_md_table(self, my_dict, report_file, h1="Measure", h2="Number"):
-        # TODO: Move to interface or parent class
-        d_sorted = {k: my_dict[k] for k in sorted(my_dict)}
-        report_file.write(f"{h1} | {h2}   \n")
-        report_file.write(f"--- | ---:   \n")
-        for k, v in d_sorted.items():
-            report_file.write(f"{k} | {v:,}   \n")
+        self.report.print_dict_to_md_table(my_dict, report_file, h1, h2)
 
     def add_stats(self, stats, a):
         if a not in stats:
@@ -175,201 +227,88 @@ class RulesMapperBase:
                         res.append(v)
                 rec[key] = res
 
-    def map_field_according_to_mapping(self, marc_field: pymarc.Field, mappings, rec):
-        for mapping in mappings:
-            if "entity" not in mapping:
-                target = mapping["target"]
-                if has_conditions(mapping):
-                    values = self.apply_rules(marc_field, mapping)
-                    # TODO: add condition to customize this...
-                    if marc_field.tag == "655":
-                        values[0] = f"Genre: {values[0]}"
-                    self.add_value_to_target(rec, target, values)
-                elif has_value_to_add(mapping):
-                    value = [mapping["rules"][0]["value"]]
-                    self.add_value_to_target(rec, target, value)
-                else:
-                    value = marc_field.format_field() if marc_field else ""
-                    self.add_value_to_target(rec, target, [value])
-            else:
-                e_per_subfield = mapping.get("entityPerRepeatedSubfield", False)
-                self.handle_entity_mapping(
-                    marc_field, mapping["entity"], rec, e_per_subfield
-                )
-
-    def apply_rules(self, marc_field: pymarc.Field, mapping):
-        values = []
-        value = ""
-        if has_conditions(mapping):
-            c_type_def = mapping["rules"][0]["conditions"][0]["type"].split(",")
-            condition_types = [x.strip() for x in c_type_def]
-            parameter = mapping["rules"][0]["conditions"][0].get("parameter", {})
-            # print(f'conditions {condition_types}')
-            if mapping.get("applyRulesOnConcatenatedData", ""):
-                value = " ".join(marc_field.get_subfields(*mapping["subfield"]))
-                value = self.apply_rule(value, condition_types, marc_field, parameter)
+    def map_field_according_to_mapping(
+        self, marc_field: pymarc.Field, field_plan: FieldPlan, rec
+    ):
+        if self.profile is None:
+            self.apply_field_plan(marc_field, field_plan, rec)
+        else:
+            start = time.perf_counter()
+            self.apply_field_plan(marc_field, field_plan, rec)
+            self.profile.add(TAGS, marc_field.tag, time.perf_counter() - start)
+
+    def apply_field_plan(self, marc_field: pymarc.Field, field_plan: FieldPlan, rec):
+        for mapping in field_plan.mappings:
+            if mapping.action == APPLY_RULES:
+                values = self.apply_rules(marc_field, mapping.rule)
+                if mapping.genre:
+                    values[0] = f"Genre: {values[0]}"
+                self.add_value_to_target(rec, mapping.target, values)
+            elif mapping.action == ADD_VALUE:
+                self.add_value_to_target(rec, mapping.target, [mapping.rule.value])
+            elif mapping.action == ADD_FIELD:
+                value = marc_field.format_field() if marc_field else ""
+                self.add_value_to_target(rec, mapping.target, [value])
             else:
-                if mapping.get("subfield", []):
-                    if mapping.get("ignoreSubsequentFields", False):
-                        sfs = []
-                        for sf in mapping["subfield"]:
-                            next_subfield = next(iter(marc_field.get_subfields(sf)), "")
-                            sfs.append(next_subfield)
-                        value = " ".join(
-                            [
-                                self.apply_rule(
-                                    x, condition_types, marc_field, parameter
-                                )
-                                for x in sfs
-                            ]
-                        )
-                    else:
-                        subfields = marc_field.get_subfields(*mapping["subfield"])
-                        x = [
-                            self.apply_rule(x, condition_types, marc_field, parameter)
-                            for x in subfields
-                        ]
-                        value = " ".join(set(x))
-                else:
-                    value1 = marc_field.format_field() if marc_field else ""
-                    value = self.apply_rule(
-                        value1, condition_types, marc_field, parameter
-                    )
-        elif has_value_to_add(mapping):
-            return [mapping["rules"][0]["value"]]
-        elif not mapping.get("rules", []) or not mapping["rules"][0].get(
-            "conditions", []
-        ):
-            value = " ".join(marc_field.get_subfields(*mapping["subfield"]))
-        if mapping.get("subFieldSplit", ""):
-            values = wrap(value, 3)
+                self.handle_entity_mapping(marc_field, mapping.entity, rec)
+
+    def apply_rules(self, marc_field: pymarc.Field, rule: RulePlan):
+        path = rule.path
+        if path == CONCATENATED:
+            value = " ".join(marc_field.get_subfields(*rule.subfields))
+            value = self.apply_rule(value, rule, marc_field)
+        elif path == FIRST_SUBFIELDS:
+            sfs = [
+                next(iter(marc_field.get_subfields(sf)), "") for sf in rule.subfields
+            ]
+            value = " ".join([self.apply_rule(x, rule, marc_field) for x in sfs])
+        elif path == EACH_SUBFIELD:
+            subfields = marc_field.get_subfields(*rule.subfields)
+            x = [self.apply_rule(x, rule, marc_field) for x in subfields]
+            value = " ".join(set(x))
+        elif path == WHOLE_FIELD:
+            value1 = marc_field.format_field() if marc_field else ""
+            value = self.apply_rule(value1, rule, marc_field)
+        elif path == VALUE:
+            return [rule.value]
         else:
-            values = [value]
-        return values
+            value = " ".join(marc_field.get_subfields(*rule.subfields))
+        if rule.split:
+            return wrap(value, 3)
+        return [value]
 
     def add_value_to_target(self, rec, target_string, value):
         if value:
-            targets = target_string.split(".")
-            if len(targets) == 1:
-                self.add_value_to_first_level_target(rec, target_string, value)
+            writer = self.target_writers.get(target_string)
+            if writer is None:
+                writer = build_target_writer(self.schema, target_string)
+                self.target_writers[target_string] = writer
+            writer(rec, value)
 
-            else:
-                sc_parent = None
-                parent = None
-                sch = self.schema["properties"]
-                sc_prop = sch
-                prop = copy.deepcopy(rec)
-                for target in targets:  # Iterate over names in hierarcy
-                    if target in sc_prop:  # property is on this level
-                        sc_prop = sc_prop[target]  # set current property
-                    else:  # next level. take the properties from the items
-                        sc_prop = sc_parent["items"]["properties"][target]
-                    if (
-                        target not in rec and not sc_parent
-                    ):  # have we added this already?
-                        if is_array_of_strings(sc_prop):
-                            rec[target] = []
-                            # break
-                            # prop[target].append({})
-                        elif is_array_of_objects(sc_prop):
-                            rec[target] = [{}]
-                            # break
-                        elif (
-                            sc_parent
-                            and is_array_of_objects(sc_parent)
-                            and sc_prop.get("type", "string") == "string"
-                        ):
-                            # print(f"break! {target} {prop} {value}")
-                            if len(rec[parent][-1]) > 0:
-                                rec[parent][-1][target] = value[0]
-                            else:
-                                rec[parent][-1] = {target: value[0]}
-                            # print(parent)
-                            # break
-                        else:
-                            if sc_parent["type"] == "array":
-                                prop[target] = {}
-                                parent.append(prop[target])
-                            else:
-                                raise Exception(
-                                    f"Edge! {target_string} {sch[target_string]}"
-                                )
-                    else:  # We already have stuff in here
-                        if is_array_of_objects(sc_prop) and len(rec[target][-1]) == len(
-                            sc_prop["items"]["properties"]
-                        ):
-                            rec[target].append({})
-                        elif sc_parent and target in rec[parent][-1]:
-                            rec[parent].append({})
-                            if len(rec[parent][-1]) > 0:
-                                rec[parent][-1][target] = value[0]
-                            else:
-                                rec[parent][-1] = {target: value[0]}
-                        elif (
-                            sc_parent
-                            and is_array_of_objects(sc_parent)
-                            and sc_prop.get("type", "string") == "string"
-                        ):
-                            # print(f"break! {target} {prop} {value}")
-                            if len(rec[parent][-1]) > 0:
-                                rec[parent][-1][target] = value[0]
-                                # print(rec[parent])
-                            else:
-                                rec[parent][-1] = {target: value[0]}
-                                # print(rec[parent])
-                        # break
-
-                    # if target == targets[-1]:
-                    # print(f"HIT {target} {value[0]}")
-                    # prop[target] = value[0]
-                    # prop = rec[target]
-                    sc_parent = sc_prop
-                    parent = target
-
-    def add_value_to_first_level_target(self, rec, target_string, value):
-        # print(f"{target_string} {value} {rec}")
-        sch = self.schema["properties"]
-        if (
-            sch[target_string]["type"] == "array"
-            and sch[target_string]["items"]["type"] == "string"
-        ):
-            if target_string not in rec:
-                rec[target_string] = value
-            else:
-                rec[target_string].extend(value)
-        elif sch[target_string]["type"] == "string":
-            rec[target_string] = value[0]
-        else:
-            raise Exception(f"Edge! {target_string} {sch[target_string]['type']}")
-
-    def create_entity(self, entity_mappings, marc_field, entity_parent_key):
+    def create_entity(self, entity_plan: EntityPlan, marc_field):
         entity = {}
-        for entity_mapping in entity_mappings:
-            k = entity_mapping["target"].split(".")[-1]
-            values = self.apply_rules(marc_field, entity_mapping)
+        for k, rule in entity_plan.properties:
+            values = self.apply_rules(marc_field, rule)
             if values:
-                if entity_parent_key == k:
+                if entity_plan.parent == k:
                     entity = values[0]
                 else:
                     entity[k] = values[0]
         return entity
 
-    def handle_entity_mapping(self, marc_field:pymarc.Field, entity_mapping, rec, e_per_subfield):
-        e_parent = entity_mapping[0]["target"].split(".")[0]
-        if e_per_subfield:
-            for sf_tuple in grouped(marc_field.subfields, 2):
-                temp_field = pymarc.Field(
-                    tag=marc_field.tag,
-                    indicators=marc_field.indicators,
-                    subfields=[sf_tuple[0], sf_tuple[1]],
-                )
-                entity = self.create_entity(entity_mapping, temp_field, e_parent)
+    def handle_entity_mapping(
+        self, marc_field: pymarc.Field, entity_plan: EntityPlan, rec
+    ):
+        e_parent = entity_plan.parent
+        if entity_plan.per_subfield:
+            for subfield in subfield_pairs(marc_field):
+                entity = self.create_entity(entity_plan, subfield)
                 if type(entity) is dict and any(entity.values()):
                     self.add_entity_to_record(entity, e_parent, rec)
                 elif type(entity) is list and any(entity):
                     self.add_entity_to_record(entity, e_parent, rec)
         else:
-            entity = self.create_entity(entity_mapping, marc_field, e_parent)
+            entity = self.create_entity(entity_plan, marc_field)
             if all(entity.values()) or e_parent == "electronicAccess":
                 self.add_entity_to_record(entity, e_parent, rec)
             else:
@@ -379,10 +318,15 @@ class RulesMapperBase:
                     "Incomplete entity mapping (a code issue)", f"{marc_field.tag} {sfs}"
                 )
 
-    def apply_rule(self, value, condition_types, marc_field, parameter):
+    def apply_rule(self, value, rule: RulePlan, marc_field):
         v = value
-        for condition_type in condition_types:
-            v = self.conditions.get_condition(condition_type, v, parameter, marc_field)
+        for name, condition in rule.conditions:
+            try:
+                v = condition(v, rule.parameter, marc_field)
+            except AttributeError:
+                v = self.conditions.unhandled_condition(
+                    name, v, rule.parameter, marc_field
+                )
         return v
 
     def add_entity_to_record(self, entity, entity_parent_key, rec):
@@ -395,53 +339,3 @@ class RulesMapperBase:
         else:
             rec[entity_parent_key] = entity
 
-
-def as_str(s):
-    try:
-        return str(s), ""
-    except ValueError:
-        return "", s
-
-
-def fetch_holdings_schema():
-    logging.info("Fetching holdings schema...", end="")
-    holdings_url = (
-        "https://raw.githubusercontent.com/folio-org/mod-inventory-storage/"
-        "master/ramls/holdingsrecord.json"
-    )
-    schema_request = requests.get(holdings_url)
-    schema_text = schema_request.text
-    logging.info("done")
-    return json.loads(schema_text)
-
-
-def get_instance_schema():
-    # instance_url = "https://raw.githubusercontent.com/folio-org/mod-inventory-storage/master/ramls/instance.json"
-    instance_url = "https://raw.githubusercontent.com/folio-org/mod-inventory/master/ramls/instance.json"
-    schema_request = requests.get(instance_url)
-    schema_text = schema_request.text
-    return json.loads(schema_text)
-
-
-def has_conditions(mapping):
-    return mapping.get("rules", []) and mapping["rules"][0].get("conditions", [])
-
-
-def has_value_to_add(mapping):
-    return mapping.get("rules", []) and mapping["rules"][0].get("value", "")
-
-
-def is_array_of_strings(schema_property):
-    sc_prop_type = schema_property.get("type", "string")
-    return sc_prop_type == "array" and schema_property["items"]["type"] == "string"
-
-
-def is_array_of_objects(schema_property):
-    sc_prop_type = schema_property.get("type", "string")
-    return sc_prop_type == "array" and schema_property["items"]["type"] == "object"
-
-
-def grouped(iterable, n):
-    "s -> (s0,s1,s2,...sn-1), (sn,sn+1,sn+2,...s2n-1), (s2n,s2n+1,s2n+2,...s3n-1), ..."
-    return zip(*[iter(iterable)] * n)
-
@@ -6,51 +6,65 @@ from marc_to_folio.conditions import Conditions
 import traceback
 from logging import exception
 import os.path
-import uuid
-import xml.etree.ElementTree as ET
 from io import StringIO
 
 import pymarc
 from pymarc.record import Record
-import requests
 from pymarc import Field, JSONWriter, XMLWriter
 
+from marc_to_folio.folio_ids import FolioIds
+from marc_to_folio.hrid_allocator import HridAllocator
+from marc_to_folio.language_codes import load_language_codes
+from marc_to_folio.reference_data import ReferenceData
 from marc_to_folio.rules_mapper_base import RulesMapperBase
+from marc_to_folio.transformation_report import FieldTally
+
+# The three digit tags, to skip checking each tag of each record
+NUMERIC_TAGS = frozenset(f"{i:03}" for i in range(1000))
 
 
 class BibsRulesMapper(RulesMapperBase):
     """Maps a MARC record to inventory instance format according to
     the FOLIO community convention"""
 
-    def __init__(
-        self, folio_client, args,
-    ):
-        super().__init__(folio_client, Conditions(folio_client, self))
+    def __init__(self, folio_client, args, ref_data=None, language_codes=None):
+        ref_data = ref_data or ReferenceData(folio_client=folio_client)
+        super().__init__(
+            folio_client,
+            Conditions(
+                folio_client,
+                self,
+                getattr(args, "condition_memo_size", 0),
+                ref_data,
+            ),
+            ref_data,
+            getattr(args, "profile", False),
+            getattr(args, "schema_file", ""),
+        )
         self.folio = folio_client
+        self.folio_ids = FolioIds(
+            folio_client, getattr(args, "deterministic_ids", False)
+        )
         self.record_status = {}
-        self.migration_report = {}
         self.suppress = args.suppress
         self.ils_flavour = args.ils_flavour
         self.holdings_map = {}
         self.id_map = {}
         self.srs_recs = []
         self.schema = self.instance_json_schema
-        print("Fetching valid language codes...")
-        self.language_codes = list(self.fetch_language_codes())
+        self.language_codes = language_codes or load_language_codes(
+            getattr(args, "language_codes", "")
+        )
         self.contrib_name_types = {}
-        self.mapped_folio_fields = {}
         self.unmapped_folio_fields = {}
         self.alt_title_map = {}
         self.identifier_types = []
+        self.rules_cache_folder = getattr(args, "rules_cache_folder", "")
         print("Fetching mapping rules from the tenant")
         self.mappings = self.folio.folio_get_single_object("/mapping-rules")
-        self.other_mode_of_issuance_id = next(
-            (
-                i["id"]
-                for i in self.folio.modes_of_issuance
-                if "unspecified" == i["name"].lower()
-            )
-        )
+        self.other_mode_of_issuance_id = self.ref_data.by_name(
+            "modes_of_issuance", "unspecified"
+        )[0]
         self.unmapped_tags = {}
         self.unmapped_conditions = {}
         self.instance_relationships = {}
@@ -59,7 +73,11 @@ class BibsRulesMapper(RulesMapperBase):
             "/hrid-settings-storage/hrid-settings"
         )
         self.hrid_prefix = self.hrid_handling["instances"]["prefix"]
-        self.hrid_counter = self.hrid_handling["instances"]["startNumber"]
+        self.hrid_allocator = HridAllocator(
+            self.hrid_handling["instances"]["startNumber"]
+        )
+        # The numbers of the HRIDs created by this mapper
+        self.hrid_block = self.hrid_allocator.allocate()
         print(f"Fetched HRID settings. HRID prefix is {self.hrid_prefix}")
 
     def parse_bib(self, marc_record: pymarc.Record, inventory_only=False):
@@ -69,7 +87,7 @@ class BibsRulesMapper(RulesMapperBase):
         self.print_progress()
         legacy_ids = self.get_legacy_id(marc_record, self.ils_flavour)
         folio_instance = {
-            "id": str(uuid.uuid4()),
+            "id": self.folio_ids.new_id("instances", legacy_ids[0]),
             "metadata": self.folio.get_metadata_construct(),
         }
         
@@ -80,37 +98,38 @@ class BibsRulesMapper(RulesMapperBase):
         ignored_subsequent_fields = set()
         bad_tags = set()  # "907"
 
-        for marc_field in marc_record:
-            self.add_stats(self.stats, "Total number of Tags processed")
-
-            if (
-                (not marc_field.tag.isnumeric())
-                and marc_field.tag != "LDR"
-                and marc_field.tag not in bad_tags
-            ):
-                self.add_to_migration_report(
-                    "Non-numeric tags in records", marc_field.tag
-                )
-                bad_tags.add(marc_field.tag)
-
-            if marc_field.tag not in self.mappings and marc_field.tag not in ["008"]:
-                self.report_legacy_mapping(marc_field.tag, True, False, True)
-            else:
-                if marc_field.tag not in ignored_subsequent_fields:
-                    self.report_legacy_mapping(
-                        marc_field.tag, True, True, False)
-                    mappings = self.mappings[marc_field.tag]
-                    self.map_field_according_to_mapping(
-                        marc_field, mappings, folio_instance
-                    )
-                    if any(m.get("ignoreSubsequentFields", False) for m in mappings):
-                        ignored_subsequent_fields.add(marc_field.tag)
+        tally = FieldTally()
+        try:
+            for marc_field in marc_record:
+                tag = marc_field.tag
+                if tag in self.mapped_tags or tag == "008":
+                    if tag not in ignored_subsequent_fields:
+                        tally.add(tag, 1, 0)
+                        field_plan = self.mapping_plans[tag]
+                        self.map_field_according_to_mapping(
+                            marc_field, field_plan, folio_instance
+                        )
+                        if field_plan.ignore_subsequent_fields:
+                            ignored_subsequent_fields.add(tag)
+                    else:
+                        tally.add(tag, 0, 1)
+                    if tag == "008":
+                        temp_inst_type = folio_instance["instanceTypeId"]
                 else:
-                    self.report_legacy_mapping(
-                        marc_field.tag, True, False, True)
-
-            if marc_field.tag == "008":
-                temp_inst_type = folio_instance["instanceTypeId"]
+                    # Numeric tags that are not three digits long, which
+                    # only MARCXML can hold, are reported as well
+                    if (
+                        tag not in NUMERIC_TAGS
+                        and tag != "LDR"
+                        and tag not in bad_tags
+                    ):
+                        self.add_to_migration_report(
+                            "Non-numeric tags in records", tag
+                        )
+                        bad_tags.add(tag)
+                    tally.add(tag, 0, 1)
+        finally:
+            self.report_field_tally(tally)
 
         self.perform_additional_parsing(
             folio_instance, temp_inst_type, marc_record, legacy_ids
@@ -171,11 +190,6 @@ class BibsRulesMapper(RulesMapperBase):
         print("Mapper wrapping up")
 
     def get_instance_format_ids(self, marc_record, legacy_id):
-        # Lambdas
-        def get_folio_id(code): return next(
-            (f["id"]
-             for f in self.folio.instance_formats if f["code"] == code), "",
-        )
         all_337s = marc_record.get_fields("337")
         all_338s = marc_record.get_fields("338")
         for fidx, f in enumerate(all_338s):
@@ -189,7 +203,7 @@ class BibsRulesMapper(RulesMapperBase):
                 for sfidx, b in enumerate(f.get_subfields("b")):
                     if len(b) == 2:  # Normal 338b. should be able to map this
                         logging.debug(f"Length of 338 $b is 2")
-                        yield get_folio_id(b)
+                        yield self.get_instance_format_id(b)
                     elif len(b) == 1:
                         logging.debug(f"Length of 338 $b is 1 ")
                         corresponding_337 = (
@@ -221,16 +235,25 @@ class BibsRulesMapper(RulesMapperBase):
                                     logging.debug(
                                         f"Combined codes are 2 chars long. Returning FOLIO ID"
                                     )
-                                    yield get_folio_id(combined_code)
+                                    yield self.get_instance_format_id(combined_code)
+
+    def get_instance_format_id(self, code):
+        instance_formats = self.conditions.instance_formats
+        format_id = instance_formats.id_by_code(code)
+        if not format_id:
+            self.add_to_migration_report(
+                "Instance format ids handling (337 + 338)",
+                instance_formats.unmapped_measure(code),
+            )
+        return format_id
 
     def handle_hrid(self, folio_instance, marc_record):
         """Create HRID if not mapped. Add hrid as MARC record 001"""
         if "hrid" not in folio_instance:
             self.add_stats(
                 self.stats, "Records without HRID from rules. Created HRID")
-            num_part = str(self.hrid_counter).zfill(11)
+            num_part = str(self.hrid_block.take()).zfill(11)
             folio_instance["hrid"] = f"{self.hrid_prefix}{num_part}"
-            self.hrid_counter += 1
         else:
             self.add_stats(self.stats, "Records with HRID from Rules")
         new_001 = Field(tag="001", data=folio_instance["hrid"])
@@ -251,14 +274,8 @@ class BibsRulesMapper(RulesMapperBase):
                 self.add_to_migration_report(
                     "unspecified Modes of issuance code", level
                 )
-            ret = next(
-                (
-                    i["id"]
-                    for i in self.folio.modes_of_issuance
-                    if str(name).lower() == i["name"].lower()
-                ),
-                "",
-            )
+            mode_of_issuance = self.ref_data.by_name("modes_of_issuance", name)
+            ret = mode_of_issuance[0] if mode_of_issuance else ""
 
             self.add_to_migration_report(
                 "Matched Modes of issuance code", f"{ret} - {name}"
@@ -276,7 +293,7 @@ class BibsRulesMapper(RulesMapperBase):
             return self.other_mode_of_issuance_id
         except StopIteration as ee:
             print(
-                f"StopIteration {marc_record.leader} {list(self.folio.modes_of_issuance)}"
+                f"StopIteration {marc_record.leader} {self.ref_data.records('modes_of_issuance')}"
             )
             raise ee
 
@@ -319,41 +336,17 @@ class BibsRulesMapper(RulesMapperBase):
         # TODO: test agianist valide language codes
         return list(languages)
 
-    def fetch_language_codes(self):
-        """fetches the list of standardized language codes from LoC"""
-        url = "https://www.loc.gov/standards/codelists/languages.xml"
-        tree = ET.fromstring(requests.get(url).content)
-        name_space = "{info:lc/xmlns/codelist-v1}"
-        xpath_expr = "{0}languages/{0}language/{0}code".format(name_space)
-        for code in tree.findall(xpath_expr):
-            yield code.text
-
     def filter_langs(self, language_values, marc_record):
-        forbidden_values = ["###", "zxx", "n/a", "N/A", "|||"]
+        normalize = self.language_codes.normalize
         for language_value in language_values:
-            if (
-                language_value in self.language_codes
-                and language_value not in forbidden_values
-            ):
-                yield language_value
-            else:
-                if language_value == "jap":
-                    yield "jpn"
-                elif language_value == "fra":
-                    yield "fre"
-                elif language_value == "sve":
-                    yield "swe"
-                elif language_value == "tys":
-                    yield "ger"
-                elif not language_value:
-                    continue
-                elif not language_value.strip():
-                    continue
-                elif language_value not in forbidden_values:
-                    self.add_to_migration_report(
-                        "Unrecognized language codes in records",
-                        f"{language_value} not recognized for {self.get_legacy_id(marc_record, self.ils_flavour)}",
-                    )
+            normalized = normalize(language_value)
+            if normalized:
+                yield normalized
+            elif normalized is None:
+                self.add_to_migration_report(
+                    "Unrecognized language codes in records",
+                    f"{language_value} not recognized for {self.get_legacy_id(marc_record, self.ils_flavour)}",
+                )
 
     def get_legacy_id(self, marc_record: Record, ils_flavour):
         if ils_flavour in ["iii", "sierra"]:
@@ -368,7 +361,7 @@ class BibsRulesMapper(RulesMapperBase):
                 if "b" in f:
                     res.add(f["b"].strip())
             if any(res):
-                return list(res)
+                return sorted(res)
             else:
                 try:
                     ret = [marc_record["001"].format_field().strip()]
@@ -1,35 +1,47 @@
 import json
-import logging
 from marc_to_folio.conditions import Conditions
-import uuid
 import requests
+from marc_to_folio.folio_ids import FolioIds
+from marc_to_folio.reference_data import ReferenceData
 from marc_to_folio.rules_mapper_base import RulesMapperBase
+from marc_to_folio.transformation_report import FieldTally
 
 
 class RulesMapperHoldings(RulesMapperBase):
     def __init__(
-        self, folio, instance_id_map, location_map, default_location_code, args
+        self,
+        folio,
+        instance_id_map,
+        location_map,
+        default_location_code,
+        args,
+        ref_data=None,
     ):
-        super().__init__(folio, Conditions(folio,self)
+        ref_data = ref_data or ReferenceData(folio_client=folio)
+        super().__init__(
+            folio,
+            Conditions(folio, self, getattr(args, "condition_memo_size", 0), ref_data),
+            ref_data,
+            getattr(args, "profile", False),
+            getattr(args, "schema_file", ""),
         )
         print("Init RulesMapperHoldings")
+        # Without a map, the instance ids are derived from the legacy bib ids
         self.instance_id_map = instance_id_map
+        self.folio_ids = FolioIds(folio, getattr(args, "deterministic_ids", False))
+        self.rules_cache_folder = getattr(args, "rules_cache_folder", "")
         self.location_map = location_map
         self.schema = self.holdings_json_schema
         self.holdings_id_map = {}
-        self.ref_data_dicts = {}
         print(any(self.location_map))
-        self.holdings_types = list(
-            folio.folio_get_all("/holdings-types", "holdingsTypes")
-        )
+        self.holdings_types = self.ref_data.records("holdings_types")
         self.default_call_number_type_id = "0b099785-75b4-4f6d-a027-4f113b58ee23"
-        print(f"Fetched {len(self.holdings_types)} holdings types")
         self.default_holdings_type_id = self.get_ref_data_tuple(
-            self.holdings_types, "holdings_types", "Monographic", "name"
+            "holdings_types", "Monographic", "name"
         )[0]
 
         self.default_location_id = self.get_ref_data_tuple(
-            self.conditions.locations, "locations", default_location_code, "code"
+            "locations", default_location_code, "code"
         )[0]
         print(f"Default location code is {self.default_location_id}")
 
@@ -40,7 +52,7 @@ class RulesMapperHoldings(RulesMapperBase):
         self.print_progress()
         legacy_id = get_legacy_id(marc_record)
         folio_holding = {
-            "id": str(uuid.uuid4()),
+            "id": self.folio_ids.new_id("holdings", legacy_id[0]),
             "metadata": self.folio_client.get_metadata_construct(),
         }
         self.add_to_migration_report(
@@ -48,25 +60,26 @@ class RulesMapperHoldings(RulesMapperBase):
         )
         ignored_subsequent_fields = set()
         
-        for marc_field in marc_record:
-            self.add_stats(self.stats, "Total number of Tags processed")
-
-            # if (not marc_field.tag.isnumeric()) and marc_field.tag != "LDR":
-            #    bad_tags.append(marc_field.tag)
-
-            if marc_field.tag not in self.mappings:
-                self.report_legacy_mapping(marc_field.tag, True, False, False)
-            else:
-                if marc_field.tag not in ignored_subsequent_fields:
-                    mappings = self.mappings[marc_field.tag]
-                    # print(mappings)
+        tally = FieldTally()
+        try:
+            for marc_field in marc_record:
+                tag = marc_field.tag
+                if tag not in self.mapped_tags:
+                    tally.add(tag, 0, 0)
+                elif tag not in ignored_subsequent_fields:
+                    field_plan = self.mapping_plans[tag]
                     self.map_field_according_to_mapping(
-                        marc_field, mappings, folio_holding
+                        marc_field, field_plan, folio_holding
                     )
-                    self.report_legacy_mapping(marc_field.tag, True, True, False)
-                    if any(m.get("ignoreSubsequentFields", False) for m in mappings):
-                        ignored_subsequent_fields.add(marc_field.tag)
+                    tally.add(tag, 1, 0)
+                    if field_plan.ignore_subsequent_fields:
+                        ignored_subsequent_fields.add(tag)
                     self.perform_additional_mapping(marc_record, folio_holding, legacy_id)
+                else:
+                    # Counted as processed, but not as a legacy field
+                    tally.add_processed()
+        finally:
+            self.report_field_tally(tally)
         self.holdings_id_map[marc_record["001"].format_field()] = folio_holding["id"]
         self.dedupe_rec(folio_holding)
         self.count_unmapped_fields(self.schema, folio_holding)
@@ -95,23 +108,6 @@ class RulesMapperHoldings(RulesMapperBase):
             print(f'Space in permanentLocationId for {legacy_id} ({folio_holding["permanentLocationId"]}). Taking the first one')
             folio_holding["permanentLocationId"] = folio_holding["permanentLocationId"].split(" ")[0]
 
-    def get_ref_data_tuple(self, ref_data, ref_name, key_value, key_type):
-        dict_key = f"{ref_name}{key_type}"
-        if dict_key not in self.ref_data_dicts:
-            d = {}
-            for r in ref_data:
-                d[r[key_type].lower()] = (r["id"], r["name"])
-            self.ref_data_dicts[dict_key] = d
-        ref_object = (
-            self.ref_data_dicts[dict_key][key_value.lower()]
-            if key_value.lower() in self.ref_data_dicts[dict_key]
-            else None
-        )
-        if not ref_object:
-            logging.debug(f"No matching element for {key_value} in {list(ref_data)}")
-            return None
-        return ref_object
-
     def remove_from_id_map(self, marc_record):
         """ removes the ID from the map in case parsing failed"""
         id_key = marc_record["001"].format_field()
@@ -0,0 +1,92 @@
+"""The JSON schemas of instances, holdings and items, fetched once.
+
+main_schemas.py fetches the schemas from GitHub at pinned versions of
+mod-inventory and mod-inventory-storage and saves them to a schema file.
+With --schema-file, the mappers and processors load the schemas from that
+file instead of fetching them. Either way, the schemas are loaded or fetched
+once per process and shared by every mapper and processor in it.
+"""
+import json
+
+import requests
+
+# Where each schema is, by name: (module, path in the module)
+SCHEMA_SOURCES = {
+    "instance": ("mod-inventory", "ramls/instance.json"),
+    "instance_storage": ("mod-inventory-storage", "ramls/instance.json"),
+    "holdings": ("mod-inventory-storage", "ramls/holdingsrecord.json"),
+    "item": ("mod-inventory-storage", "ramls/item.json"),
+}
+
+GITHUB_URL = "https://raw.githubusercontent.com/folio-org/{module}/{version}/{path}"
+
+# The Schemas of this process, by schema file ("" for fetched schemas)
+_schemas_by_file = {}
+
+
+def fetch_schema(module, path, version="master"):
+    url = GITHUB_URL.format(module=module, version=version, path=path)
+    schema_request = requests.get(url)
+    schema_request.raise_for_status()
+    return json.loads(schema_request.text)
+
+
+def save_schemas(schema_file, versions):
+    """Fetches all the schemas at the versions of the modules (git tags or
+    branches by module) and saves them to schema_file"""
+    schemas = {}
+    for name, (module, path) in SCHEMA_SOURCES.items():
+        version = versions.get(module, "master")
+        schemas[name] = fetch_schema(module, path, version)
+        print(f"Fetched the {name} schema from {module} {version}")
+    with open(schema_file, "w") as saved_file:
+        json.dump(
+            {"version": Schemas.version, "modules": versions, "schemas": schemas},
+            saved_file,
+            indent=2,
+        )
+
+
+def load_schemas(folio_client, schema_file=""):
+    """Returns the Schemas of the schema file, or fetched if there is no file.
+    Loaded once per process"""
+    schemas = _schemas_by_file.get(schema_file)
+    if schemas is None:
+        schemas = Schemas(folio_client, schema_file)
+        _schemas_by_file[schema_file] = schemas
+    return schemas
+
+
+class Schemas:
+    """The JSON schemas by name. Without a schema file, each schema is fetched
+    the first time it is used, the way it was before there was a file"""
+
+    version = 1
+
+    def __init__(self, folio_client, schema_file=""):
+        self.folio_client = folio_client
+        self.schemas = {}
+        if schema_file:
+            with open(schema_file) as saved_file:
+                saved = json.load(saved_file)
+            if saved.get("version") != self.version:
+                raise ValueError(
+                    f"{schema_file} is a version {saved.get('version')} schema "
+                    "file. Fetch the schemas again with main_schemas.py"
+                )
+            self.schemas = saved["schemas"]
+            print(f"Loaded the schemas of {saved['modules']} from {schema_file}")
+
+    def get(self, name):
+        schema = self.schemas.get(name)
+        if schema is None:
+            schema = self.fetch(name)
+            self.schemas[name] = schema
+        return schema
+
+    def fetch(self, name):
+        if name == "instance_storage":
+            return self.folio_client.get_instance_json_schema()
+        if name == "item":
+            return self.folio_client.get_item_schema()
+        return fetch_schema(*SCHEMA_SOURCES[name])
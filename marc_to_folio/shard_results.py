@@ -0,0 +1,95 @@
+"""Combining what the shards of a sharded run saved in their subfolders.
+
+Each shard of main_bibs.py and main_holdings.py saves its id map to its own
+subfolder of the results folder, like shard_0_of_4. main_merge_shards.py
+merges them into the id map in the results folder, where main_holdings.py
+and main_items.py load it from. The HRID ranges used by the bibs shards are
+merged the same way, so the HRID start number of the tenant is set once, past
+the HRIDs of every shard.
+"""
+import json
+import os
+import re
+
+from marc_to_folio.hrid_allocator import HridAllocator
+
+SHARD_FOLDER = re.compile(r"^shard_(\d+)_of_(\d+)$")
+
+
+def shard_folders(results_folder):
+    """Returns the shard subfolders of the results folder in shard order.
+    Raises a ValueError if a shard is missing, since merging what the others
+    saved would leave records out without anyone noticing"""
+    shards = {}
+    for name in os.listdir(results_folder):
+        match = SHARD_FOLDER.match(name)
+        if match and os.path.isdir(os.path.join(results_folder, name)):
+            shards[(int(match.group(2)), int(match.group(1)))] = name
+    counts = {count for count, _ in shards}
+    if not counts:
+        raise ValueError(f"No shard folders in {results_folder}")
+    if len(counts) > 1:
+        raise ValueError(
+            f"Shard folders of runs with different shard counts in {results_folder}"
+        )
+    count = counts.pop()
+    missing = [index for index in range(count) if (count, index) not in shards]
+    if missing:
+        raise ValueError(
+            f"Shards {missing} of {count} are missing in {results_folder}"
+        )
+    return [
+        os.path.join(results_folder, shards[(count, index)]) for index in range(count)
+    ]
+
+
+def merge_id_maps(folders, file_name):
+    """Returns the id maps saved as file_name in the folders merged into one,
+    and the legacy ids found in more than one shard. Folders without the file
+    are skipped. The first shard with a legacy id keeps it"""
+    merged = {}
+    duplicates = []
+    for folder in folders:
+        path = os.path.join(folder, file_name)
+        if not os.path.isfile(path):
+            continue
+        with open(path) as id_map_file:
+            id_map = json.load(id_map_file)
+        for legacy_id, folio_id in id_map.items():
+            if legacy_id in merged:
+                duplicates.append(legacy_id)
+            else:
+                merged[legacy_id] = folio_id
+        print(f"{len(id_map)} ids in {path}")
+    return merged, duplicates
+
+
+def merge_hrid_ranges(folders):
+    """Returns the HRID ranges saved in hrid_ranges.json by the shards merged
+    into one, with the number after the last HRID of any shard as the next
+    free number. None if no shard saved any"""
+    prefixes = set()
+    used_ranges = []
+    next_free_numbers = []
+    for folder in folders:
+        path = os.path.join(folder, "hrid_ranges.json")
+        if not os.path.isfile(path):
+            continue
+        with open(path) as hrid_ranges_file:
+            hrid_ranges = json.load(hrid_ranges_file)
+        prefixes.add(hrid_ranges["prefix"])
+        used_ranges.extend(tuple(used) for used in hrid_ranges["used_ranges"])
+        next_free_numbers.append(hrid_ranges["next_free_start_number"])
+    if not next_free_numbers:
+        return None
+    if len(prefixes) > 1:
+        raise ValueError(f"The shards used different HRID prefixes: {sorted(prefixes)}")
+    # Merged like the ranges of the worker processes of a single run
+    allocator = HridAllocator(max(next_free_numbers))
+    for used_range in used_ranges:
+        allocator.release(used_range)
+    return {
+        "prefix": prefixes.pop(),
+        "used_ranges": allocator.merged_ranges(),
+        "next_free_start_number": max(next_free_numbers),
+    }
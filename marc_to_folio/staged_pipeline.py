@@ -0,0 +1,165 @@
+"""Runs the steps of a transformation in stages on their own threads"""
+import heapq
+import queue
+import threading
+import time
+
+# Put on a queue once per thread of the next stage when a stage is done
+END = object()
+
+
+class Stage:
+    def __init__(self, name, function, threads, ordered, queue_size, on_error=None):
+        self.name = name
+        self.function = function
+        self.threads = threads
+        self.ordered = ordered
+        self.on_error = on_error
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.running = threads
+        self.items = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+
+    def add_timings(self, items, busy, idle, blocked):
+        with self.lock:
+            self.items += items
+            self.busy += busy
+            self.idle += idle
+            self.blocked += blocked
+
+
+class StagedPipeline:
+    """Hands the records put into it through the stages added to it. Each stage
+    runs on one or more threads and gets its records from a bounded queue, so a
+    stage that falls behind makes the stages before it wait. A stage function
+    returns what is handed to the next stage, or None to drop the record.
+
+    Stages with more than one thread finish records out of order. An ordered
+    stage gets the records in the order they were put into the pipeline.
+    Functions of stages with more than one thread must not share state with
+    other stages.
+
+    When the function of a stage raises, the on_error function of the stage is
+    called with the record and the exception, and the record is dropped. A
+    stage without one stops the pipeline, and put and close raise the
+    exception from then on"""
+
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self.stages = []
+        self.threads = []
+        self.errors = []
+        self.stopped = threading.Event()
+        self.sequence = 0
+        self.read = Stage("read", None, 1, False, 0)
+        self.start_time = None
+
+    def add_stage(self, name, function, threads=1, ordered=False, on_error=None):
+        if ordered and threads > 1:
+            raise ValueError(f"Ordered stage {name} can only run on one thread")
+        self.stages.append(
+            Stage(name, function, threads, ordered, self.queue_size, on_error)
+        )
+
+    def start(self):
+        self.start_time = time.time()
+        for i, stage in enumerate(self.stages):
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            for _ in range(stage.threads):
+                thread = threading.Thread(
+                    target=self.run_stage, args=(stage, next_stage), daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+
+    def put(self, record):
+        """Hands a record to the first stage. Blocks while its queue is full"""
+        if self.stopped.is_set():
+            raise self.errors[0]
+        started = time.time()
+        self.stages[0].queue.put((self.sequence, record))
+        self.read.blocked += time.time() - started
+        self.read.items += 1
+        self.sequence += 1
+
+    def close(self):
+        """Waits for all records to pass through the stages. Raises the first
+        exception raised by a stage"""
+        self.read.busy = time.time() - self.start_time - self.read.blocked
+        for _ in range(self.stages[0].threads):
+            self.stages[0].queue.put(END)
+        for thread in self.threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def run_stage(self, stage, next_stage):
+        items = 0
+        busy = idle = blocked = 0.0
+        # Records that arrived ahead of their turn in an ordered stage
+        waiting = []
+        next_sequence = 0
+        while True:
+            started = time.time()
+            entry = stage.queue.get()
+            idle += time.time() - started
+            if entry is END:
+                break
+            if stage.ordered:
+                heapq.heappush(waiting, entry)
+                ready = []
+                while waiting and waiting[0][0] == next_sequence:
+                    ready.append(heapq.heappop(waiting))
+                    next_sequence += 1
+            else:
+                ready = [entry]
+            for sequence, record in ready:
+                result = None
+                if record is not None and not self.stopped.is_set():
+                    started = time.time()
+                    try:
+                        result = stage.function(record)
+                    except Exception as exception:
+                        try:
+                            if not stage.on_error:
+                                raise
+                            stage.on_error(record, exception)
+                        except Exception as error:
+                            self.errors.append(error)
+                            self.stopped.set()
+                    busy += time.time() - started
+                    items += 1
+                if next_stage:
+                    # Dropped records are passed on so ordered stages know
+                    # they will not arrive
+                    started = time.time()
+                    next_stage.queue.put((sequence, result))
+                    blocked += time.time() - started
+        stage.add_timings(items, busy, idle, blocked)
+        with stage.lock:
+            stage.running -= 1
+            last = stage.running == 0
+        if last and next_stage:
+            for _ in range(next_stage.threads):
+                next_stage.queue.put(END)
+
+    def print_timings(self):
+        print("Stage | Threads | Records | Busy (s) | Waiting (s) | Blocked (s)")
+        for stage in [self.read, *self.stages]:
+            print(
+                f"{stage.name} | {stage.threads} | {stage.items:,} | "
+                f"{stage.busy:.2f} | {stage.idle:.2f} | {stage.blocked:.2f}"
+            )
+
+    def add_to_report(self, report):
+        """Adds the timings of the stages to a TransformationReport"""
+        stages = report.migration_report.setdefault("Pipeline stages (records)", {})
+        for i, stage in enumerate([self.read, *self.stages], 1):
+            stages[
+                f"{i}. {stage.name} ({stage.threads} threads): busy {stage.busy:.1f} s, "
+                f"waiting for records {stage.idle:.1f} s, "
+                f"waiting for the next stage {stage.blocked:.1f} s"
+            ] = stage.items
@@ -0,0 +1,80 @@
+"""One subfield of a MARC field, read the way the mapping rules read fields.
+
+Mappings with entityPerRepeatedSubfield create one entity per subfield, like
+one identifier per 020$a. SubfieldPair lets the rules and conditions read a
+single subfield as if it was a field of its own, without building a
+pymarc.Field for every subfield.
+"""
+
+
+class SubfieldPair:
+    """A subfield code and value in a field. Has the parts of pymarc.Field
+    the mapping rules and conditions use"""
+
+    __slots__ = ["field", "code", "subfield_value"]
+
+    def __init__(self, field, code, subfield_value):
+        self.field = field
+        self.code = code
+        self.subfield_value = subfield_value
+
+    @property
+    def tag(self):
+        return self.field.tag
+
+    @property
+    def indicators(self):
+        return self.field.indicators
+
+    @property
+    def indicator1(self):
+        return self.field.indicator1
+
+    @property
+    def indicator2(self):
+        return self.field.indicator2
+
+    @property
+    def subfields(self):
+        return [self.code, self.subfield_value]
+
+    def __iter__(self):
+        yield (self.code, self.subfield_value)
+
+    def get_subfields(self, *codes):
+        return [self.subfield_value] if self.code in codes else []
+
+    def __contains__(self, code):
+        return self.code == code
+
+    def __getitem__(self, code):
+        return self.subfield_value if self.code == code else None
+
+    def is_control_field(self):
+        return False
+
+    def is_subject_field(self):
+        return self.field.tag.startswith("6")
+
+    def format_field(self):
+        if self.code == "6":
+            return ""
+        if self.is_subject_field() and self.code in ("v", "x", "y", "z"):
+            return f"-- {self.subfield_value}".strip()
+        return self.subfield_value.strip()
+
+    def value(self):
+        return self.subfield_value.strip()
+
+    def __str__(self):
+        indicators = "".join(
+            "\\" if i in (" ", "\\") else i for i in self.field.indicators
+        )
+        return f"={self.field.tag}  {indicators}${self.code}{self.subfield_value}"
+
+
+def subfield_pairs(field):
+    """The subfields of a pymarc.Field as SubfieldPairs"""
+    subfields = iter(field.subfields)
+    for code, value in zip(subfields, subfields):
+        yield SubfieldPair(field, code, value)
@@ -0,0 +1,72 @@
+"""Functions writing mapped values to a target path in a FOLIO record.
+
+Each target of the mapping rules, like title or notes.note, gets a writer
+built from the instance or holdings JSON schema the first time it is written
+to. The writer changes the record in place, so writing a value costs the same
+however many fields the record already has.
+"""
+
+
+def build_target_writer(schema, target_string):
+    """Returns a function (rec, value) writing the values of a mapping to
+    target_string, a property or parent.property in the schema"""
+    targets = target_string.split(".")
+    sch = schema["properties"]
+    if len(targets) == 1:
+        return first_level_writer(sch, target_string)
+    if len(targets) == 2 and is_array_of_objects(sch.get(targets[0], {})):
+        return entity_property_writer(sch[targets[0]], *targets)
+    raise Exception(f"Edge! {target_string}")
+
+
+def first_level_writer(sch, target):
+    if is_array_of_strings(sch[target]):
+
+        def write(rec, value):
+            if target not in rec:
+                rec[target] = value
+            else:
+                rec[target].extend(value)
+
+    elif sch[target]["type"] == "string":
+
+        def write(rec, value):
+            rec[target] = value[0]
+
+    else:
+        raise Exception(f"Edge! {target} {sch[target]['type']}")
+    return write
+
+
+def entity_property_writer(sc_parent, parent, target):
+    """Sets target on the last object in the parent array. A new object is
+    started when the last one has all its properties or already has target.
+    Properties that are not strings are only set when they start a new object"""
+    properties = sc_parent["items"]["properties"]
+    if target not in properties:
+        raise Exception(f"Edge! {parent}.{target}")
+    property_count = len(properties)
+    is_string = properties[target].get("type", "string") == "string"
+
+    def write(rec, value):
+        if parent not in rec:
+            rec[parent] = [{}]
+        elif len(rec[parent][-1]) == property_count:
+            rec[parent].append({})
+        last = rec[parent][-1]
+        if target in last:
+            rec[parent].append({target: value[0]})
+        elif is_string:
+            last[target] = value[0]
+
+    return write
+
+
+def is_array_of_strings(schema_property):
+    sc_prop_type = schema_property.get("type", "string")
+    return sc_prop_type == "array" and schema_property["items"]["type"] == "string"
+
+
+def is_array_of_objects(schema_property):
+    sc_prop_type = schema_property.get("type", "string")
+    return sc_prop_type == "array" and schema_property["items"]["type"] == "object"
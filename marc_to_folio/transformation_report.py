@@ -0,0 +1,233 @@
+"""The counters behind the transformation reports"""
+import gzip
+import json
+
+
+class TransformationReport:
+    """Accumulates the counters of a transformation run. Reports from worker
+    processes, shards or earlier runs can be merged into each other and saved
+    to and loaded from a gzipped JSON file"""
+
+    version = 1
+
+    def __init__(self):
+        self.stats = {}
+        self.migration_report = {}
+        self.mapped_folio_fields = {}
+        self.mapped_legacy_fields = {}
+        # Profiled mapping times by section, like "MARC tag", and key:
+        # [calls, seconds, slowest call in seconds]
+        self.timings = {}
+
+    def add_stats(self, measure, count=1):
+        if measure not in self.stats:
+            self.stats[measure] = count
+        else:
+            self.stats[measure] += count
+
+    def add_to_migration_report(self, header, measure_to_add):
+        if header not in self.migration_report:
+            self.migration_report[header] = {}
+        if measure_to_add not in self.migration_report[header]:
+            self.migration_report[header][measure_to_add] = 1
+        else:
+            self.migration_report[header][measure_to_add] += 1
+
+    def report_legacy_mapping(self, field_name, present, mapped, empty=False):
+        if field_name not in self.mapped_legacy_fields:
+            self.mapped_legacy_fields[field_name] = [
+                int(present),
+                int(mapped),
+                int(empty),
+            ]
+        else:
+            self.mapped_legacy_fields[field_name][0] += int(present)
+            self.mapped_legacy_fields[field_name][1] += int(mapped)
+            self.mapped_legacy_fields[field_name][2] += int(empty)
+
+    def add_legacy_mappings(self, tally):
+        """Adds the legacy field counts of a FieldTally"""
+        mapped_legacy_fields = self.mapped_legacy_fields
+        for field_name, counts in tally.items():
+            mine = mapped_legacy_fields.get(field_name)
+            if mine is None:
+                mapped_legacy_fields[field_name] = counts
+            else:
+                mine[0] += counts[0]
+                mine[1] += counts[1]
+                mine[2] += counts[2]
+
+    def report_folio_mapping(self, field_name, was_mapped, was_empty=False):
+        if field_name not in self.mapped_folio_fields:
+            self.mapped_folio_fields[field_name] = [int(was_mapped), int(was_empty)]
+        else:
+            self.mapped_folio_fields[field_name][0] += int(was_mapped)
+            self.mapped_folio_fields[field_name][1] += int(was_empty)
+
+    def add_timings(self, section, key, calls, seconds, max_seconds):
+        timings = self.timings.setdefault(section, {})
+        if key not in timings:
+            timings[key] = [calls, seconds, max_seconds]
+        else:
+            timing = timings[key]
+            timing[0] += calls
+            timing[1] += seconds
+            timing[2] = max(timing[2], max_seconds)
+
+    def merge(self, other):
+        """Adds the counters of another report to this one"""
+        for k, v in other.stats.items():
+            self.stats[k] = self.stats.get(k, 0) + v
+        for header, measures in other.migration_report.items():
+            report = self.migration_report.setdefault(header, {})
+            for measure, count in measures.items():
+                report[measure] = report.get(measure, 0) + count
+        for mine, theirs in [
+            (self.mapped_folio_fields, other.mapped_folio_fields),
+            (self.mapped_legacy_fields, other.mapped_legacy_fields),
+        ]:
+            for field_name, counts in theirs.items():
+                if field_name not in mine:
+                    mine[field_name] = list(counts)
+                else:
+                    for i, count in enumerate(counts):
+                        mine[field_name][i] += count
+        for section, timings in other.timings.items():
+            for key, timing in timings.items():
+                self.add_timings(section, key, *timing)
+        return self
+
+    def save(self, path):
+        with gzip.open(path, "wt", encoding="utf-8") as report_file:
+            json.dump(
+                {
+                    "version": self.version,
+                    "stats": self.stats,
+                    "migration_report": self.migration_report,
+                    "mapped_folio_fields": self.mapped_folio_fields,
+                    "mapped_legacy_fields": self.mapped_legacy_fields,
+                    "timings": self.timings,
+                },
+                report_file,
+                separators=(",", ":"),
+            )
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as report_file:
+            saved = json.load(report_file)
+        if saved.get("version") != cls.version:
+            raise ValueError(
+                f"{path} is a version {saved.get('version')} report. "
+                f"Only version {cls.version} is supported"
+            )
+        report = cls()
+        report.stats = saved["stats"]
+        report.migration_report = saved["migration_report"]
+        report.mapped_folio_fields = saved["mapped_folio_fields"]
+        report.mapped_legacy_fields = saved["mapped_legacy_fields"]
+        report.timings = saved.get("timings", {})
+        return report
+
+    def print_dict_to_md_table(self, my_dict, report_file, h1="Measure", h2="Number"):
+        d_sorted = {k: my_dict[k] for k in sorted(my_dict)}
+        report_file.write(f"{h1} | {h2}   \n")
+        report_file.write(f"--- | ---:   \n")
+        for k, v in d_sorted.items():
+            report_file.write(f"{k} | {v:,}   \n")
+
+    def write_migration_report(self, report_file):
+        for a in self.migration_report:
+            report_file.write(f"   \n")
+            report_file.write(f"## {a}    \n")
+            report_file.write(f"<details><summary>Click to expand all {len(self.migration_report[a])} things</summary>     \n")
+            report_file.write(f"   \n")
+            report_file.write(f"Measure | Count   \n")
+            report_file.write(f"--- | ---:   \n")
+            b = self.migration_report[a]
+            sortedlist = [(k, b[k]) for k in sorted(b, key=as_str)]
+            for b in sortedlist:
+                report_file.write(f"{b[0]} | {b[1]}   \n")
+            report_file.write("</details>   \n")
+
+    def print_mapping_report(self, report_file):
+        total_records = self.stats["Number of records in file(s)"]
+        report_file.write("\n## Mapped FOLIO fields   \n")
+        d_sorted = {
+            k: self.mapped_folio_fields[k] for k in sorted(self.mapped_folio_fields)
+        }
+        report_file.write(f"FOLIO Field | Mapped | Empty | Unmapped  \n")
+        report_file.write("--- | --- | --- | ---:  \n")
+        for k, v in d_sorted.items():
+            unmapped = total_records - v[0]
+            mapped = v[0] - v[1]
+            mp = mapped / total_records
+            mapped_per = "{:.0%}".format(mp if mp > 0 else 0)
+            report_file.write(
+                f"{k} | {mapped if mapped > 0 else 0} ({mapped_per}) | {v[1]} | {unmapped}  \n"
+            )
+
+        # Legacy fields (like marc)
+        report_file.write("\n## Mapped Legacy fields  \n")
+        d_sorted = {
+            k: self.mapped_legacy_fields[k] for k in sorted(self.mapped_legacy_fields)
+        }
+        report_file.write(f"Legacy Field | Present | Mapped | Empty | Unmapped  \n")
+        report_file.write("--- | --- | --- | --- | ---:  \n")
+        for k, v in d_sorted.items():
+            present = v[0]
+            present_per = "{:.1%}".format(present / total_records)
+            unmapped = present - v[1]
+            mapped = v[1]
+            unmapped_per = "{:.1%}".format(unmapped / total_records)
+            mp = mapped / total_records
+            mapped_per = "{:.0%}".format(mp if mp > 0 else 0)
+            report_file.write(
+                f"{k} | {present if present > 0 else 0} ({present_per}) | {mapped if mapped > 0 else 0} ({mapped_per}) | {v[1]} | {unmapped}  \n"
+            )
+
+    def write_timings(self, report_file):
+        """Writes the profiled mapping times and reference data load times,
+        slowest in total first"""
+        for section, timings in sorted(self.timings.items()):
+            report_file.write(f"\n## Time by {section}   \n")
+            report_file.write(f"{section} | Calls | Total (s) | Mean (ms) | Max (ms)   \n")
+            report_file.write("--- | ---: | ---: | ---: | ---:   \n")
+            for key, (calls, seconds, max_seconds) in sorted(
+                timings.items(), key=lambda t: t[1][1], reverse=True
+            ):
+                report_file.write(
+                    f"{key} | {calls:,} | {seconds:.3f} | "
+                    f"{1000 * seconds / calls:.3f} | {1000 * max_seconds:.3f}   \n"
+                )
+
+
+class FieldTally(dict):
+    """Legacy field counts of a single record, [present, mapped, empty] by
+    tag, and the number of fields processed. Added to the report in one go
+    instead of field by field"""
+
+    def __init__(self):
+        super().__init__()
+        self.processed = 0
+
+    def add(self, field_name, mapped, empty):
+        self.processed += 1
+        counts = self.get(field_name)
+        if counts is None:
+            self[field_name] = [1, mapped, empty]
+        else:
+            counts[0] += 1
+            counts[1] += mapped
+            counts[2] += empty
+
+    def add_processed(self):
+        """Counts a field that is not reported as a legacy field"""
+        self.processed += 1
+
+
+def as_str(s):
+    try:
+        return str(s), ""
+    except ValueError:
+        return "", s
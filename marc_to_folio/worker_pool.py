@@ -0,0 +1,86 @@
+"""Process pool used by the transformation scripts when run with more than one
+worker"""
+import gc
+import multiprocessing
+from collections import deque
+
+
+class OrderedWorkerPool:
+    """Runs tasks in a pool of forked worker processes. Only a bounded number of
+    tasks are in flight at any time, so the reading side can not run away from
+    the workers, and results are handed back in the order they were submitted.
+
+    Used as a context manager, the pool is closed when the block ends, or
+    terminated if it raises"""
+
+    def __init__(self, processes, initializer, initargs, task, on_result, max_pending=0):
+        # Forking lets the workers inherit what the parent has already loaded
+        # (folio client, id maps) without pickling it. Freezing the objects
+        # keeps the garbage collector of the workers from going through them,
+        # which would copy the pages they are on. Reference counting still
+        # copies the pages of the objects a worker uses. Unfrozen when the
+        # workers are joined
+        gc.freeze()
+        try:
+            self.pool = multiprocessing.get_context("fork").Pool(
+                processes, initializer=initializer, initargs=initargs
+            )
+        except BaseException:
+            gc.unfreeze()
+            raise
+        self.task = task
+        self.on_result = on_result
+        self.max_pending = max_pending or processes * 2
+        self.pending = deque()
+        self.closed = False
+
+    def submit(self, *task_args):
+        while len(self.pending) >= self.max_pending:
+            self.handle_next_result()
+        self.pending.append(self.pool.apply_async(self.task, task_args))
+
+    def handle_next_result(self):
+        self.on_result(self.pending.popleft().get())
+
+    def drain(self):
+        while self.pending:
+            self.handle_next_result()
+
+    def close(self):
+        """Hands back the results of the tasks in flight and stops the workers"""
+        if self.closed:
+            return
+        try:
+            self.drain()
+        except BaseException:
+            self.terminate()
+            raise
+        self.pool.close()
+        self.join()
+
+    def terminate(self):
+        """Stops the workers without waiting for the tasks in flight"""
+        if self.closed:
+            return
+        self.pending.clear()
+        self.pool.terminate()
+        self.join()
+
+    def join(self):
+        self.closed = True
+        try:
+            self.pool.join()
+        finally:
+            # The objects of the parent can be collected again, for the
+            # transformations run after this one in the same process
+            gc.unfreeze()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from marc_to_folio.byte_ranges import (
+    ByteRangeReader,
+    iso2709_shard_ranges,
+    line_aligned_ranges,
+)
+
+
+def fake_iso2709_record(number):
+    """Returns a record that only has to be right about its length and its
+    record terminator, which is all the splitting looks at"""
+    body = f"00000nam a2200000 a 4500{'x' * (number % 50)}{number}\x1e".encode()
+    length = len(body) + 1
+    return f"{length:05d}".encode() + body[5:] + b"\x1d"
+
+
+class TestByteRanges(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def write_file(self, name, content):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_line_aligned_ranges(self):
+        lines = [f"row {i}\t{'x' * i}\n".encode() for i in range(200)]
+        path = self.write_file("items.tsv", b"header\n" + b"".join(lines))
+        ranges = line_aligned_ranges(path, len(b"header\n"), 500)
+        self.assertGreater(len(ranges), 1)
+        with open(path, "rb") as f:
+            content = f.read()
+        parts = [content[start:end] for start, end in ranges]
+        self.assertEqual(b"".join(lines), b"".join(parts))
+        for part in parts:
+            self.assertTrue(part.endswith(b"\n"))
+
+    def test_shards_cover_all_records_once(self):
+        records = [fake_iso2709_record(i) for i in range(300)]
+        paths = [
+            self.write_file("a.mrc", b"".join(records[:100])),
+            self.write_file("b.mrc", b"".join(records[100:120])),
+            self.write_file("c.mrc", b"".join(records[120:])),
+        ]
+        read_records = []
+        for shard_index in range(7):
+            for path, start, end in iso2709_shard_ranges(paths, shard_index, 7):
+                reader = ByteRangeReader(open(path, "rb"), start, end)
+                while True:
+                    length = reader.read(5)
+                    if not length:
+                        break
+                    read_records.append(length + reader.read(int(length) - 5))
+                reader.close()
+        self.assertEqual(records, read_records)
+
+    def test_shard_index_out_of_range(self):
+        path = self.write_file("a.mrc", fake_iso2709_record(1))
+        with self.assertRaises(ValueError):
+            iso2709_shard_ranges([path], 2, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import pymarc
+
+from marc_to_folio.conditions import ConditionMemo
+from marc_to_folio.transformation_report import TransformationReport
+
+
+class TestConditionMemo(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def condition(self, value, parameter, marc_field):
+        self.calls.append(value)
+        return value[marc_field.indicator2 and int(marc_field.indicator2) :]
+
+    def test_hits_misses_and_evictions(self):
+        memo = ConditionMemo(2)
+        condition = memo.wrap("skip", self.condition, True)
+        field = pymarc.Field(tag="245", indicators=["1", "4"], subfields=["a", "x"])
+        other = pymarc.Field(tag="245", indicators=["1", "0"], subfields=["a", "x"])
+        self.assertEqual("title", condition("The title", {}, field))
+        self.assertEqual("title", condition("The title", {}, field))
+        self.assertEqual("The title", condition("The title", {}, other))
+        self.assertEqual(["The title", "The title"], self.calls)
+        # The least recently used results are dropped
+        condition("Another", {}, field)
+        condition("The title", {}, field)
+        self.assertEqual(4, len(self.calls))
+        self.assertEqual((1, 4, 2), (memo.hits, memo.misses, memo.evictions))
+
+    def test_parameters_are_part_of_the_key(self):
+        memo = ConditionMemo(10)
+        condition = memo.wrap("char_select", lambda v, p, f: v[p["from"] : p["to"]], False)
+        self.assertEqual("ab", condition("abcd", {"from": 0, "to": 2}, None))
+        self.assertEqual("cd", condition("abcd", {"from": 2, "to": 4}, None))
+        self.assertEqual("ab", condition("abcd", {"to": 2, "from": 0}, None))
+        self.assertEqual((1, 2), (memo.hits, memo.misses))
+
+    def test_add_to_report(self):
+        memo = ConditionMemo(1)
+        condition = memo.wrap("trim", lambda v, p, f: v.strip(), False)
+        for value in [" a", " a", " b"]:
+            condition(value, {}, None)
+        report = TransformationReport()
+        memo.add_to_report(report)
+        memo.add_to_report(report)
+        self.assertEqual(
+            {"Hits": 1, "Misses": 2, "Evictions": 1},
+            report.migration_report["Condition memo"],
+        )
@@ -0,0 +1,93 @@
+import unittest
+
+from pymarc import Field
+
+from marc_to_folio.conditions import Conditions
+from marc_to_folio.reference_data import ReferenceData
+
+CONTRIBUTOR_TYPES = [
+    {"id": "t1", "code": "aut", "name": "Author"},
+    {"id": "t2", "code": "ill", "name": "Illustrator"},
+    {"id": "t3", "code": "ctb", "name": "Contributor"},
+]
+
+
+class FakeMapper:
+    def __init__(self):
+        self.migration_report = {}
+
+    def add_to_migration_report(self, header, measure):
+        self.migration_report.setdefault(header, []).append(measure)
+
+
+class CountingField(Field):
+    """Counts the lookups of the subfields the contributor type is taken from"""
+
+    lookups = 0
+
+    def get_subfields(self, *codes):
+        self.lookups += 1
+        return super().get_subfields(*codes)
+
+
+def contributor(*subfields, field_class=Field):
+    return field_class(
+        tag="100", indicators=["1", " "], subfields=["a", "Smith, Anna", *subfields]
+    )
+
+
+class TestContributorTypes(unittest.TestCase):
+    def setUp(self):
+        self.mapper = FakeMapper()
+        self.conditions = Conditions(
+            None,
+            self.mapper,
+            0,
+            ReferenceData({"contributor_types": CONTRIBUTOR_TYPES}),
+        )
+
+    def type_id(self, marc_field):
+        return self.conditions.condition_set_contributor_type_id("", {}, marc_field)
+
+    def test_code(self):
+        self.assertEqual("t1", self.type_id(contributor("4", "aut")))
+        self.assertEqual("t2", self.type_id(contributor("4", "ILL")))
+
+    def test_name_ignoring_case(self):
+        self.assertEqual("t2", self.type_id(contributor("e", "ILLUSTRATOR")))
+        self.assertEqual("t1", self.type_id(contributor("e", "author")))
+
+    def test_first_matching_subfield_wins(self):
+        for subfields, type_id in [
+            (("e", "illustrator", "4", "aut"), "t2"),
+            (("4", "aut", "e", "illustrator"), "t1"),
+            (("4", "xyz", "e", "illustrator"), "t2"),
+        ]:
+            self.assertEqual(type_id, self.type_id(contributor(*subfields)))
+
+    def test_contributor_by_default(self):
+        self.assertEqual("t3", self.type_id(contributor("e", "editor of sorts")))
+        self.assertEqual("t3", self.type_id(contributor()))
+        self.assertEqual(
+            ["Contributor", "Contributor"],
+            self.mapper.migration_report["Mapped contributor types"],
+        )
+
+    def test_id_and_text_from_one_lookup(self):
+        marc_field = contributor("e", "Illustrator", field_class=CountingField)
+        self.assertEqual("t2", self.type_id(marc_field))
+        self.assertEqual(
+            "Illustrator",
+            self.conditions.condition_set_contributor_type_text("", {}, marc_field),
+        )
+        self.assertEqual(1, marc_field.lookups)
+        other_field = contributor("4", "aut", field_class=CountingField)
+        self.assertEqual(
+            "Author",
+            self.conditions.condition_set_contributor_type_text("", {}, other_field),
+        )
+        self.assertEqual(1, other_field.lookups)
+
+
+if __name__ == "__main__":
+    unittest.main()
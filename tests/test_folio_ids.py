@@ -0,0 +1,80 @@
+import json
+import unittest
+import uuid
+from io import StringIO
+from types import SimpleNamespace
+
+from marc_to_folio.folio_ids import DuplicateLegacyIdError, FolioIds
+from marc_to_folio.holdings_processor import HoldingsProcessor
+
+
+def folio_client(tenant_id):
+    return SimpleNamespace(okapi_url="https://okapi.example.org/", tenant_id=tenant_id)
+
+
+class TestFolioIds(unittest.TestCase):
+    def test_random_by_default(self):
+        ids = FolioIds(folio_client("fs00001"))
+        self.assertNotEqual(ids.new_id("items", "i1"), ids.new_id("items", "i1"))
+
+    def test_deterministic(self):
+        ids = FolioIds(folio_client("fs00001"), True)
+        item_id = ids.new_id("items", "i1")
+        self.assertEqual(5, uuid.UUID(item_id).version)
+        self.assertEqual(item_id, FolioIds(folio_client("fs00001"), True).new_id("items", " i1"))
+        self.assertNotEqual(item_id, ids.new_id("holdings", "i1"))
+        self.assertNotEqual(item_id, FolioIds(folio_client("fs00002"), True).new_id("items", "i1"))
+
+    def test_parent_id_from_legacy_id(self):
+        ids = FolioIds(folio_client("fs00001"), True)
+        self.assertEqual(
+            ids.new_id("instances", "b1"), ids.legacy_id_to_id("instances", "b1")
+        )
+
+    def test_empty_legacy_id(self):
+        ids = FolioIds(folio_client("fs00001"), True)
+        with self.assertRaises(ValueError):
+            ids.new_id("items", " ")
+
+    def test_duplicate_legacy_id(self):
+        ids = FolioIds(folio_client("fs00001"), True)
+        ids.new_id("holdings", "h1")
+        with self.assertRaises(DuplicateLegacyIdError):
+            ids.new_id("holdings", " h1")
+        ids.new_id("items", "h1")
+        random_ids = FolioIds(folio_client("fs00001"))
+        random_ids.new_id("holdings", "h1")
+        random_ids.new_id("holdings", "h1")
+
+    def test_duplicate_record_not_written(self):
+        mapper = FakeHoldingsMapper(FolioIds(folio_client("fs00001"), True))
+        args = SimpleNamespace(suppress=False, result_folder="", postgres_dump=False)
+        results_file = StringIO()
+        processor = HoldingsProcessor(mapper, None, results_file, args)
+        for legacy_id in ["h1", "h2", "h1"]:
+            processor.process_record({"001": legacy_id})
+        results_file.seek(0)
+        written = [json.loads(line)["id"] for line in results_file]
+        self.assertEqual(
+            [mapper.holdings_id_map["h1"], mapper.holdings_id_map["h2"]], written
+        )
+        self.assertEqual(1, mapper.stats["Duplicate legacy ids"])
+
+
+class FakeHoldingsMapper:
+    def __init__(self, folio_ids):
+        self.folio_ids = folio_ids
+        self.stats = {}
+        self.holdings_id_map = {}
+
+    def parse_hold(self, marc_record):
+        holding = {"id": self.folio_ids.new_id("holdings", marc_record["001"])}
+        self.holdings_id_map[marc_record["001"]] = holding["id"]
+        return holding
+
+    def remove_from_id_map(self, marc_record):
+        del self.holdings_id_map[marc_record["001"]]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from marc_to_folio.hrid_allocator import HridAllocator
+
+
+class TestHridAllocator(unittest.TestCase):
+    def test_blocks_are_disjoint(self):
+        allocator = HridAllocator(100)
+        blocks = [allocator.allocate(10) for _ in range(3)]
+        numbers = [block.take() for block in blocks for _ in range(10)]
+        self.assertEqual(list(range(100, 130)), sorted(numbers))
+
+    def test_used_ranges_and_next_free_number(self):
+        allocator = HridAllocator(1)
+        first = allocator.allocate(10)
+        second = allocator.allocate(10)
+        third = allocator.allocate(10)
+        for block, used in [(first, 10), (second, 4), (third, 2)]:
+            for _ in range(used):
+                block.take()
+            allocator.release(block.used_range())
+        self.assertEqual([(1, 15), (21, 23)], allocator.merged_ranges())
+        self.assertEqual(23, allocator.next_free_number())
+
+    def test_nothing_used(self):
+        allocator = HridAllocator(7)
+        allocator.release(allocator.allocate(5).used_range())
+        self.assertEqual([], allocator.merged_ranges())
+        self.assertEqual(7, allocator.next_free_number())
+
+    def test_bounded_range_runs_out(self):
+        allocator = HridAllocator(1, 4)
+        block = allocator.allocate(10)
+        self.assertEqual([1, 2, 3], [block.take() for _ in range(3)])
+        with self.assertRaises(ValueError):
+            block.take()
+        with self.assertRaises(ValueError):
+            allocator.allocate(5).take()
+
+    def test_open_block_takes_the_rest(self):
+        allocator = HridAllocator(1)
+        block = allocator.allocate()
+        for _ in range(1000):
+            block.take()
+        with self.assertRaises(ValueError):
+            allocator.allocate(1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from marc_to_folio.instance_formats import InstanceFormats
+
+FORMATS = [
+    {"id": "1", "code": "nc", "name": "unmediated -- volume"},
+    {"id": "2", "code": "cr", "name": "computer -- online resource"},
+    {"id": "3", "code": "cr", "name": "duplicate code"},
+]
+
+
+class TestInstanceFormats(unittest.TestCase):
+    def test_lookup(self):
+        formats = InstanceFormats(FORMATS)
+        self.assertEqual("1", formats.id_by_code("nc"))
+        self.assertEqual("2", formats.id_by_code("cr"))
+        self.assertEqual("", formats.id_by_code("zz"))
+        self.assertEqual(
+            "computer -- online resource set by mapping rules",
+            formats.mapped_measure("cr"),
+        )
+
+    def test_unmapped_measure_is_created_once(self):
+        formats = InstanceFormats(FORMATS)
+        measure = formats.unmapped_measure("zz")
+        self.assertEqual("338$b value zz not found in FOLIO", measure)
+        self.assertIs(measure, formats.unmapped_measure("zz"))
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from marc_to_folio import language_codes
+from marc_to_folio.language_codes import LanguageCodes, load_language_codes
+
+CODES = ["eng", "fre", "ger", "jpn", "swe", "zxx"]
+
+
+class TestLanguageCodes(unittest.TestCase):
+    def test_normalize(self):
+        codes = LanguageCodes(CODES)
+        self.assertEqual("eng", codes.normalize("eng"))
+        self.assertEqual("jpn", codes.normalize("jap"))
+        self.assertEqual("ger", codes.normalize("tys"))
+        self.assertEqual("", codes.normalize("zxx"))
+        self.assertEqual("", codes.normalize("|||"))
+        self.assertEqual("", codes.normalize("   "))
+        self.assertIsNone(codes.normalize("xyz"))
+        self.assertIsNone(codes.normalize("xyz"))
+        self.assertEqual(7, len(codes.normalized))
+
+    def test_saved_and_read_back(self):
+        with tempfile.TemporaryDirectory() as folder:
+            codes_file = os.path.join(folder, "language_codes.txt")
+            with mock.patch.object(
+                language_codes, "fetch_language_codes", return_value=CODES
+            ) as fetch:
+                fetched = load_language_codes(codes_file)
+                read = load_language_codes(codes_file)
+                fetch.assert_called_once_with()
+        self.assertEqual(fetched.codes, read.codes)
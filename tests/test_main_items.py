@@ -0,0 +1,96 @@
+import json
+import unittest
+from io import StringIO
+from types import SimpleNamespace
+
+from main_items import Worker, add_stats, drop_items
+from marc_to_folio.transformation_report import TransformationReport
+
+
+class FakeItemsMapper:
+    def __init__(self, deterministic):
+        self.report = TransformationReport()
+        self.item_id_map = {}
+        self.duplicate_item_ids = {}
+        self.folio_ids = SimpleNamespace(deterministic=deterministic)
+
+    @property
+    def stats(self):
+        return self.report.stats
+
+    def add_stats(self, stats, a):
+        add_stats(stats, a)
+
+
+def range_result(items, duplicate_item_ids=None):
+    """The result of process_range for a range with the items, by legacy id"""
+    processor_report = TransformationReport()
+    for _ in items:
+        processor_report.add_stats("Number of Items written to disk")
+    return {
+        "file_name": "items.tsv",
+        "items": "".join(
+            json.dumps({"id": item_id}) + "\n" for item_id in items.values()
+        ),
+        "records_count": len(items),
+        "processor_report": processor_report,
+        "report": TransformationReport(),
+        "item_id_map": dict(items),
+        "duplicate_item_ids": duplicate_item_ids or {},
+        "error": "",
+    }
+
+
+class TestDropItems(unittest.TestCase):
+    def test_drop_items(self):
+        items = '{"id": "a"}\n{"id": "b"}\n'
+        self.assertEqual('{"id": "a"}\n', drop_items(items, {"b"}))
+        self.assertEqual(items, drop_items(items, set()))
+
+    def test_drop_postgres_dump_items(self):
+        items = 'a\t{"id": "a"}\nb\t{"id": "b"}\n'
+        self.assertEqual('b\t{"id": "b"}\n', drop_items(items, {"a"}))
+
+
+class TestMergeRangeResult(unittest.TestCase):
+    def merge(self, deterministic, second_items):
+        processor = SimpleNamespace(
+            mapper=FakeItemsMapper(deterministic),
+            report=TransformationReport(),
+            results_file=StringIO(),
+            records_count=0,
+        )
+        worker = Worker(None, None, processor, [])
+        worker.merge_range_result(range_result({"i1": "a", "i2": "b"}))
+        worker.merge_range_result(range_result(second_items, {"i9": 1}))
+        written = [
+            json.loads(line)["id"]
+            for line in processor.results_file.getvalue().splitlines()
+        ]
+        return processor, written
+
+    def test_deterministic_duplicate_is_dropped(self):
+        # The legacy id gives the same id in both workers
+        processor, written = self.merge(True, {"i2": "b", "i3": "d"})
+        mapper = processor.mapper
+        self.assertEqual(["a", "b", "d"], written)
+        self.assertEqual({"i1": "a", "i2": "b", "i3": "d"}, mapper.item_id_map)
+        self.assertEqual({"i9": 1, "i2": 1}, mapper.duplicate_item_ids)
+        self.assertEqual(1, mapper.stats["Duplicate item ids"])
+        self.assertEqual(3, processor.report.stats["Number of Items written to disk"])
+        self.assertEqual(4, processor.records_count)
+
+    def test_random_duplicate_is_written(self):
+        # Like in a single process, the item is written with its own id
+        processor, written = self.merge(False, {"i2": "c", "i3": "d"})
+        mapper = processor.mapper
+        self.assertEqual(["a", "b", "c", "d"], written)
+        self.assertEqual({"i1": "a", "i2": "b", "i3": "d"}, mapper.item_id_map)
+        self.assertEqual({"i9": 1, "i2": 1}, mapper.duplicate_item_ids)
+        self.assertEqual(1, mapper.stats["Duplicate item ids"])
+        self.assertEqual(4, processor.report.stats["Number of Items written to disk"])
+        self.assertEqual(4, processor.records_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
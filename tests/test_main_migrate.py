@@ -0,0 +1,50 @@
+import unittest
+
+from main_migrate import parse_stage_args
+
+CONNECTION = ["https://okapi.example.org", "fs00001", "user", "secret"]
+CONFIG = {
+    "bibs": ["bibs", "results", *CONNECTION, "voyager"],
+    "holdings": ["mfhds", "results", *CONNECTION, "voyager", "-m", "maps"],
+    "items": ["items", "results", *CONNECTION, "-m", "maps"],
+}
+
+
+class TestParseStageArgs(unittest.TestCase):
+    def test_stages_in_order(self):
+        config = {name: CONFIG[name] for name in ["items", "bibs", "holdings"]}
+        stage_args = parse_stage_args(config, False)
+        self.assertEqual(["bibs", "holdings", "items"], list(stage_args))
+        self.assertEqual("bibs", stage_args["bibs"].source_folder)
+        self.assertEqual("items", stage_args["items"].records_path)
+
+    def test_maps_handed_on_are_not_saved(self):
+        stage_args = parse_stage_args(CONFIG, False)
+        self.assertTrue(stage_args["bibs"].no_id_map_file)
+        self.assertTrue(stage_args["holdings"].no_id_map_file)
+
+    def test_save_id_maps(self):
+        stage_args = parse_stage_args(CONFIG, True)
+        self.assertFalse(stage_args["bibs"].no_id_map_file)
+        self.assertFalse(stage_args["holdings"].no_id_map_file)
+
+    def test_map_saved_without_next_stage(self):
+        stage_args = parse_stage_args(
+            {"bibs": CONFIG["bibs"], "items": CONFIG["items"]}, False
+        )
+        self.assertFalse(stage_args["bibs"].no_id_map_file)
+        stage_args = parse_stage_args({"holdings": CONFIG["holdings"]}, False)
+        self.assertFalse(stage_args["holdings"].no_id_map_file)
+
+    def test_unknown_stage(self):
+        with self.assertRaises(ValueError):
+            parse_stage_args({"orders": [], **CONFIG}, False)
+
+    def test_shards_rejected(self):
+        config = dict(CONFIG, bibs=CONFIG["bibs"] + ["--shard-count", "2"])
+        with self.assertRaises(ValueError):
+            parse_stage_args(config, False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import unittest
+
+from marc_to_folio.conditions import Conditions
+from marc_to_folio.mapping_plan import (
+    ADD_FIELD,
+    ADD_VALUE,
+    APPLY_RULES,
+    CONCATENATED,
+    EACH_SUBFIELD,
+    ENTITY,
+    FIRST_SUBFIELDS,
+    SUBFIELDS,
+    VALUE,
+    WHOLE_FIELD,
+    compile_mappings,
+    condition_names,
+)
+
+
+class FakeConditions:
+    def resolve_condition(self, name):
+        return getattr(self, "condition_" + name, None)
+
+    def condition_trim(self, value, parameter, marc_field):
+        return value.strip()
+
+
+def rule(condition_type, **parameter):
+    condition = {"type": condition_type}
+    if parameter:
+        condition["parameter"] = parameter
+    return [{"conditions": [condition]}]
+
+
+class TestMappingPlan(unittest.TestCase):
+    def test_paths(self):
+        mappings = {
+            "245": [
+                {
+                    "target": "title",
+                    "subfield": ["a", "b"],
+                    "rules": rule("trim, capitalize"),
+                    "applyRulesOnConcatenatedData": True,
+                },
+                {
+                    "target": "indexTitle",
+                    "subfield": ["a"],
+                    "rules": rule("trim"),
+                    "ignoreSubsequentFields": True,
+                },
+                {"target": "notes", "subfield": ["c"], "rules": rule("trim")},
+                {"target": "statement", "rules": rule("trim")},
+                {"target": "source", "rules": [{"value": "MARC"}]},
+                {"target": "other", "subfield": ["d"], "rules": []},
+            ]
+        }
+        plan = compile_mappings(mappings, FakeConditions())["245"]
+        self.assertTrue(plan.ignore_subsequent_fields)
+        self.assertEqual(
+            [APPLY_RULES, APPLY_RULES, APPLY_RULES, APPLY_RULES, ADD_VALUE, ADD_FIELD],
+            [m.action for m in plan.mappings],
+        )
+        self.assertEqual(
+            [CONCATENATED, FIRST_SUBFIELDS, EACH_SUBFIELD, WHOLE_FIELD, VALUE],
+            [m.rule.path for m in plan.mappings[:5]],
+        )
+        title = plan.mappings[0].rule
+        self.assertEqual(("a", "b"), title.subfields)
+        self.assertEqual(["trim", "capitalize"], [n for n, _ in title.conditions])
+        self.assertEqual("MARC", plan.mappings[4].rule.value)
+
+    def test_entity(self):
+        mappings = {
+            "020": [
+                {
+                    "entity": [
+                        {
+                            "target": "identifiers.identifierTypeId",
+                            "subfield": ["a"],
+                            "rules": rule("set_identifier_type_id_by_name", name="ISBN"),
+                        },
+                        {"target": "identifiers.value", "subfield": ["a"]},
+                    ],
+                    "entityPerRepeatedSubfield": True,
+                }
+            ]
+        }
+        mapping = compile_mappings(mappings, FakeConditions())["020"].mappings[0]
+        self.assertEqual(ENTITY, mapping.action)
+        self.assertEqual("identifiers", mapping.entity.parent)
+        self.assertTrue(mapping.entity.per_subfield)
+        (type_key, type_rule), (value_key, value_rule) = mapping.entity.properties
+        self.assertEqual(("identifierTypeId", "value"), (type_key, value_key))
+        self.assertEqual({"name": "ISBN"}, type_rule.parameter)
+        self.assertEqual(SUBFIELDS, value_rule.path)
+
+    def test_default_rules_print(self):
+        with open("./maps/mapping_rules_default.json") as rules_file:
+            mappings = json.load(rules_file)
+        plans = compile_mappings(mappings, FakeConditions())
+        self.assertEqual(set(mappings), set(plans))
+        self.assertTrue(repr(plans["245"]).startswith("245"))
+        self.assertIn("remove_ending_punc", repr(plans["245"]))
+
+    def test_reference_data_of_default_rules(self):
+        with open("./maps/mapping_rules_default.json") as rules_file:
+            plans = compile_mappings(json.load(rules_file), FakeConditions())
+        names = Conditions.reference_data_for(condition_names(plans))
+        self.assertIn("identifier_types", names)
+        self.assertIn("contributor_types", names)
+        self.assertNotIn("holding_note_types", names)
+        self.assertNotIn("call_number_types", names)
@@ -0,0 +1,40 @@
+import unittest
+from io import StringIO
+
+from marc_to_folio.mapping_profile import CONDITIONS, TAGS, MappingProfile
+from marc_to_folio.transformation_report import TransformationReport
+
+
+class TestMappingProfile(unittest.TestCase):
+    def test_timed_condition_counts_calls(self):
+        profile = MappingProfile()
+        trim = profile.timed_condition("trim", lambda value, p, f: value.strip())
+        self.assertEqual("a", trim(" a ", {}, None))
+        self.assertEqual("b", trim("b ", {}, None))
+        calls, seconds, max_seconds = profile.timings[CONDITIONS]["trim"]
+        self.assertEqual(2, calls)
+        self.assertLessEqual(max_seconds, seconds)
+
+    def test_add_to_report_resets(self):
+        profile = MappingProfile()
+        profile.add(TAGS, "245", 0.002)
+        profile.add(TAGS, "245", 0.001)
+        report = TransformationReport()
+        profile.add_to_report(report)
+        profile.add_to_report(report)
+        self.assertEqual([2, 0.003, 0.002], report.timings[TAGS]["245"])
+        self.assertEqual({TAGS: {}, CONDITIONS: {}}, profile.timings)
+
+    def test_reports_merge_and_render(self):
+        first, second = TransformationReport(), TransformationReport()
+        first.add_timings(TAGS, "245", 1, 0.5, 0.5)
+        second.add_timings(TAGS, "245", 3, 1.5, 0.75)
+        second.add_timings(TAGS, "100", 1, 0.25, 0.25)
+        first.merge(second)
+        self.assertEqual([4, 2.0, 0.75], first.timings[TAGS]["245"])
+        report_file = StringIO()
+        first.write_timings(report_file)
+        lines = report_file.getvalue().splitlines()
+        self.assertIn("## Time by MARC tag", lines[1])
+        self.assertTrue(lines[4].startswith("245 | 4 | 2.000 | 500.000 | 750.000"))
+        self.assertTrue(lines[5].startswith("100 | 1 | 0.250"))
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from marc_to_folio.marcxml_reader import MarcXmlReader
+
+COLLECTION = """<?xml version="1.0" encoding="UTF-8"?>
+<collection xmlns="http://www.loc.gov/MARC21/slim">
+{}
+</collection>"""
+
+OAI_ENVELOPE = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <ListRecords>
+{}
+  </ListRecords>
+</OAI-PMH>"""
+
+OAI_RECORD = """<record>
+  <header><identifier>oai:{0}</identifier></header>
+  <metadata>{1}</metadata>
+</record>"""
+
+MARC_RECORD = """<marc:record xmlns:marc="http://www.loc.gov/MARC21/slim">
+  <marc:leader>00000cam a2200000 a 4500</marc:leader>
+  <marc:controlfield tag="001">{0}</marc:controlfield>
+  <marc:datafield tag="245" ind1="1" ind2="0">
+    <marc:subfield code="a">Title {0}</marc:subfield>
+    <marc:subfield code="c">Author</marc:subfield>
+  </marc:datafield>
+</marc:record>"""
+
+
+class TestMarcXmlReader(unittest.TestCase):
+    def read(self, xml):
+        with tempfile.NamedTemporaryFile("w", suffix=".xml", delete=False) as f:
+            f.write(xml)
+        try:
+            reader = MarcXmlReader(f.name)
+            return reader, list(reader)
+        finally:
+            os.remove(f.name)
+
+    def test_collection(self):
+        records = "\n".join(MARC_RECORD.format(i) for i in range(3))
+        reader, records = self.read(COLLECTION.format(records))
+        self.assertEqual(3, reader.records_read)
+        self.assertEqual(["0", "1", "2"], [r["001"].data for r in records])
+        self.assertEqual(["Title 1", "Author"], records[1]["245"].subfields[1::2])
+        self.assertEqual(["1", "0"], records[1]["245"].indicators)
+        self.assertEqual("00000cam a2200000 a 4500", records[0].leader)
+
+    def test_oai_envelope(self):
+        records = "\n".join(
+            OAI_RECORD.format(i, MARC_RECORD.format(i)) for i in range(2)
+        )
+        reader, records = self.read(OAI_ENVELOPE.format(records))
+        self.assertEqual(2, reader.records_read)
+        self.assertEqual(["0", "1"], [r["001"].data for r in records])
+
+
+if __name__ == "__main__":
+    unittest.main()
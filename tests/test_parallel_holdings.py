@@ -0,0 +1,135 @@
+import json
+import os
+import tempfile
+import unittest
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+import main_holdings
+from main_holdings import ParallelHoldings, read_instance_id_map
+from marc_to_folio.holdings_processor import HoldingsProcessor
+from marc_to_folio.transformation_report import TransformationReport
+
+
+class FakeMapper:
+    """Stands in for RulesMapperHoldings, in the parent and the workers"""
+
+    def __init__(
+        self,
+        folio_client,
+        instance_id_map,
+        location_map,
+        default_location,
+        args,
+        ref_data,
+    ):
+        self.report = TransformationReport()
+        self.holdings_id_map = {}
+        self.folio_ids = SimpleNamespace(deterministic=False)
+        self.mappings = None
+
+    @property
+    def stats(self):
+        return self.report.stats
+
+    def parse_hold(self, marc_record):
+        legacy_id = marc_record["001"]
+        if legacy_id == "fail":
+            raise KeyError(legacy_id)
+        self.report.add_to_migration_report("Locations", marc_record["852"])
+        self.holdings_id_map[legacy_id] = {"id": f"id-{legacy_id}"}
+        return {"id": f"id-{legacy_id}", "permanentLocationId": marc_record["852"]}
+
+    def remove_from_id_map(self, marc_record):
+        self.holdings_id_map.pop(marc_record["001"], None)
+
+    def report_counters(self):
+        pass
+
+
+def holdings_args(**kwargs):
+    return SimpleNamespace(
+        suppress=False, result_folder="", postgres_dump=False, **kwargs
+    )
+
+
+def mfhd_records():
+    records = [
+        {"001": f"h{number}", "852": "main" if number % 3 else "annex"}
+        for number in range(23)
+    ]
+    records[7] = {"001": "fail", "852": "main"}
+    return records
+
+
+class TestParallelHoldings(unittest.TestCase):
+    def serial_run(self, records):
+        args = holdings_args()
+        processor = HoldingsProcessor(
+            FakeMapper(None, None, [], "", args, None), None, StringIO(), args
+        )
+        for marc_record in records:
+            try:
+                processor.process_record(marc_record)
+            except Exception as exception:
+                processor.skip_record(marc_record, exception)
+        return processor
+
+    def test_same_results_as_serial_run(self):
+        records = mfhd_records()
+        serial = self.serial_run(records)
+        args = holdings_args(workers=3, chunk_size=4)
+        with mock.patch.object(main_holdings, "RulesMapperHoldings", FakeMapper):
+            processor = HoldingsProcessor(
+                FakeMapper(None, None, [], "", args, None), None, StringIO(), args
+            )
+            rules_file = {"defaultLocationCode": "", "rules": {}}
+            worker_init_args = (None, None, [], rules_file, args, None)
+            parallel = ParallelHoldings(processor, args, worker_init_args)
+            for marc_record in records:
+                parallel.add_record(marc_record)
+            parallel.close()
+        self.assertEqual(
+            serial.results_file.getvalue(), processor.results_file.getvalue()
+        )
+        written = [
+            json.loads(line)["id"]
+            for line in processor.results_file.getvalue().splitlines()
+        ]
+        self.assertEqual(
+            [f"id-{r['001']}" for r in records if r["001"] != "fail"], written
+        )
+        self.assertEqual(serial.records_count, processor.records_count)
+        self.assertEqual(serial.mapper.stats, processor.mapper.stats)
+        self.assertEqual(1, processor.mapper.stats["Failed records"])
+        self.assertEqual(serial.report.stats, processor.report.stats)
+        self.assertEqual(
+            len(written), processor.report.stats["Holdings records written to disk"]
+        )
+        self.assertEqual(
+            serial.mapper.report.migration_report,
+            processor.mapper.report.migration_report,
+        )
+        self.assertEqual(
+            serial.mapper.holdings_id_map, processor.mapper.holdings_id_map
+        )
+        self.assertNotIn("fail", processor.mapper.holdings_id_map)
+
+
+class TestReadInstanceIdMap(unittest.TestCase):
+    def test_derived_instance_ids_without_a_map(self):
+        args = SimpleNamespace(deterministic_ids=True, ils_flavour="sierra")
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "instance_id_map.json")
+            self.assertIsNone(read_instance_id_map(args, path))
+            args.ils_flavour = "aleph"
+            with self.assertRaises(Exception):
+                read_instance_id_map(args, path)
+            with open(path, "w") as id_map_file:
+                json.dump({"b1": {"id": "i1"}}, id_map_file)
+            self.assertEqual({"b1": {"id": "i1"}}, read_instance_id_map(args, path))
+
+
+if __name__ == "__main__":
+    unittest.main()
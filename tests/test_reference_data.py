@@ -0,0 +1,87 @@
+import pickle
+import unittest
+
+from marc_to_folio.reference_data import (
+    LOAD_TIMES,
+    ReferenceData,
+    fetch_reference_data,
+)
+from marc_to_folio.transformation_report import TransformationReport
+
+LOAN_TYPES = [
+    {"id": "a1", "name": "Can circulate"},
+    {"id": "a2", "name": "Reading room"},
+]
+LOCATIONS = [{"id": "b1", "code": "MAIN", "name": "Main library"}]
+
+
+class FakeFolioClient:
+    identifier_types = [{"id": "c1", "name": "ISBN"}]
+    instance_types = [{"id": "d1", "code": "txt", "name": "text"}]
+
+    def __init__(self):
+        self.paths = []
+
+    def folio_get_all(self, path, key, query=""):
+        self.paths.append(path)
+        return iter(LOCATIONS)
+
+
+class TestReferenceData(unittest.TestCase):
+    def setUp(self):
+        self.ref_data = ReferenceData(
+            {"loan_types": LOAN_TYPES, "locations": LOCATIONS}
+        )
+
+    def test_lookups_ignore_case(self):
+        ref_data = self.ref_data
+        self.assertEqual(
+            ("a2", "Reading room"), ref_data.by_name("loan_types", "READING ROOM")
+        )
+        self.assertEqual(("b1", "Main library"), ref_data.by_code("locations", "main"))
+        self.assertEqual(("b1", "Main library"), ref_data.by_id("locations", "B1"))
+        self.assertIsNone(self.ref_data.by_name("loan_types", "Missing"))
+        self.assertIsNone(self.ref_data.by_code("loan_types", "a1"))
+        self.assertEqual(tuple(LOAN_TYPES), self.ref_data.records("loan_types"))
+
+    def test_read_only(self):
+        with self.assertRaises(AttributeError):
+            self.ref_data.tables = {}
+
+    def test_pickled_with_indexes(self):
+        restored = pickle.loads(pickle.dumps(self.ref_data))
+        self.assertEqual(self.ref_data.tables, restored.tables)
+        self.assertEqual(("b1", "Main library"), restored.by_code("locations", "MAIN"))
+
+    def test_fetch(self):
+        folio_client = FakeFolioClient()
+        ref_data = fetch_reference_data(folio_client, ["identifier_types", "locations"])
+        self.assertEqual(["/locations"], folio_client.paths)
+        self.assertEqual(("c1", "ISBN"), ref_data.by_name("identifier_types", "isbn"))
+        self.assertIn("locations", ref_data)
+
+    def test_loaded_when_first_used(self):
+        folio_client = FakeFolioClient()
+        ref_data = ReferenceData(folio_client=folio_client)
+        self.assertNotIn("locations", ref_data)
+        self.assertEqual(("b1", "Main library"), ref_data.by_code("locations", "main"))
+        ref_data.records("locations")
+        self.assertEqual(["/locations"], folio_client.paths)
+        report = TransformationReport()
+        ref_data.add_to_report(report)
+        ref_data.add_to_report(report)
+        self.assertEqual(1, report.timings[LOAD_TIMES]["locations"][0])
+
+    def test_missing_without_client(self):
+        with self.assertRaises(KeyError):
+            self.ref_data.records("material_types")
+
+    def test_fetched_in_threads(self):
+        names = ["identifier_types", "instance_types", "locations"]
+        sequential = fetch_reference_data(FakeFolioClient(), names)
+        folio_client = FakeFolioClient()
+        threaded = fetch_reference_data(folio_client, names, threads=3)
+        self.assertEqual(sequential.tables, threaded.tables)
+        self.assertEqual(set(names), set(threaded.load_times))
+        threaded.load(names, threads=3)
+        self.assertEqual(["/locations"], folio_client.paths)
@@ -0,0 +1,71 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from marc_to_folio.reference_data import (
+    HOLDINGS_REFERENCE_DATA,
+    ITEMS_REFERENCE_DATA,
+    fetch_reference_data,
+)
+from marc_to_folio.reference_snapshot import (
+    SNAPSHOT_REFERENCE_DATA,
+    SnapshotFolioClient,
+    take_snapshot,
+)
+
+
+class FakeFolioClient:
+    okapi_url = "https://okapi.example.org"
+    tenant_id = "diku"
+    current_user = "a-user-id"
+
+    def __getattr__(self, name):
+        if name in SNAPSHOT_REFERENCE_DATA:
+            return [{"id": f"{name}-id", "code": "c", "name": name}]
+        raise AttributeError(name)
+
+    def folio_get_all(self, path, key, query):
+        return iter([{"id": f"{path}-id", "code": "c", "name": path}])
+
+    def folio_get_single_object(self, path):
+        return {"path": path}
+
+    def get_instance_json_schema(self):
+        return {"title": "instance"}
+
+    def get_item_schema(self):
+        return {"title": "item"}
+
+
+class TestReferenceSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "snapshot.json.gz")
+        self.folio = FakeFolioClient()
+        take_snapshot(self.folio, self.path)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_same_reference_data_as_the_tenant(self):
+        snapshot_client = SnapshotFolioClient.load(self.path)
+        for names in [HOLDINGS_REFERENCE_DATA, ITEMS_REFERENCE_DATA]:
+            from_tenant = fetch_reference_data(self.folio, names)
+            from_snapshot = fetch_reference_data(snapshot_client, names)
+            self.assertEqual(from_tenant.tables, from_snapshot.tables)
+
+    def test_answers_the_client_calls(self):
+        snapshot_client = pickle.loads(
+            pickle.dumps(SnapshotFolioClient.load(self.path))
+        )
+        self.assertEqual("diku", snapshot_client.tenant_id)
+        self.assertEqual(
+            {"path": "/mapping-rules"},
+            snapshot_client.folio_get_single_object("/mapping-rules"),
+        )
+        self.assertEqual({"title": "item"}, snapshot_client.get_item_schema())
+        metadata = snapshot_client.get_metadata_construct()
+        self.assertEqual("a-user-id", metadata["createdByUserId"])
+        with self.assertRaises(KeyError):
+            snapshot_client.folio_get_single_object("/configurations/entries")
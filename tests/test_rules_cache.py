@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from marc_to_folio.rules_cache import (
+    cache_path,
+    compile_cached,
+    load_plans,
+    rules_key,
+    save_plans,
+)
+
+MAPPINGS = {
+    "245": [
+        {
+            "target": "title",
+            "subfield": ["a", "b"],
+            "rules": [{"conditions": [{"type": "trim, upper"}]}],
+            "applyRulesOnConcatenatedData": True,
+        }
+    ],
+    "020": [
+        {
+            "entityPerRepeatedSubfield": True,
+            "entity": [
+                {
+                    "target": "identifiers.value",
+                    "subfield": ["a"],
+                    "rules": [{"conditions": [{"type": "trim"}]}],
+                }
+            ],
+        }
+    ],
+}
+
+
+class CountingConditions:
+    def __init__(self):
+        self.resolved = []
+
+    def resolve_condition(self, name):
+        self.resolved.append(name)
+        return getattr(self, "condition_" + name)
+
+    def condition_trim(self, value, parameter, marc_field):
+        return value.strip()
+
+    def condition_upper(self, value, parameter, marc_field):
+        return value.upper()
+
+
+class TestRulesCache(unittest.TestCase):
+    def test_loads_plans_bound_to_new_conditions(self):
+        with tempfile.TemporaryDirectory() as cache_folder:
+            compiled = compile_cached(MAPPINGS, CountingConditions(), cache_folder)
+            conditions = CountingConditions()
+            loaded = compile_cached(MAPPINGS, conditions, cache_folder)
+        self.assertEqual(repr(compiled), repr(loaded))
+        self.assertEqual(["trim", "upper", "trim"], conditions.resolved)
+        name, condition = loaded["245"].mappings[0].rule.conditions[1]
+        self.assertEqual("upper", name)
+        self.assertIs(conditions, condition.__self__)
+
+    def test_changed_rules_are_not_loaded(self):
+        changed = dict(MAPPINGS, **{"100": [{"target": "contributors"}]})
+        self.assertNotEqual(rules_key(MAPPINGS), rules_key(changed))
+        with tempfile.TemporaryDirectory() as cache_folder:
+            compile_cached(MAPPINGS, CountingConditions(), cache_folder)
+            key = rules_key(changed)
+            self.assertIsNone(load_plans(cache_folder, key, CountingConditions()))
+
+    def test_stale_file_is_not_loaded(self):
+        key = rules_key(MAPPINGS)
+        with tempfile.TemporaryDirectory() as cache_folder:
+            save_plans(cache_folder, "another key", {})
+            os.replace(
+                cache_path(cache_folder, "another key"), cache_path(cache_folder, key)
+            )
+            self.assertIsNone(load_plans(cache_folder, key, CountingConditions()))
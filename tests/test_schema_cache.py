@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from marc_to_folio import schema_cache
+from marc_to_folio.schema_cache import SCHEMA_SOURCES, load_schemas, save_schemas
+
+
+def fake_fetch(module, path, version="master"):
+    return {"title": f"{module}/{path}", "version": version}
+
+
+class TestSchemaCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.schema_file = os.path.join(self.folder.name, "schemas.json")
+        schema_cache._schemas_by_file.clear()
+
+    def tearDown(self):
+        self.folder.cleanup()
+        schema_cache._schemas_by_file.clear()
+
+    def test_saves_pinned_versions(self):
+        with mock.patch.object(schema_cache, "fetch_schema", fake_fetch):
+            save_schemas(self.schema_file, {"mod-inventory-storage": "v20.2.0"})
+        with open(self.schema_file) as saved_file:
+            saved = json.load(saved_file)
+        self.assertEqual(set(SCHEMA_SOURCES), set(saved["schemas"]))
+        self.assertEqual("v20.2.0", saved["schemas"]["holdings"]["version"])
+        self.assertEqual("master", saved["schemas"]["instance"]["version"])
+
+    def test_loaded_once_per_process_without_fetching(self):
+        with mock.patch.object(schema_cache, "fetch_schema", fake_fetch):
+            save_schemas(self.schema_file, {})
+        with mock.patch.object(schema_cache, "fetch_schema") as fetch:
+            schemas = load_schemas(None, self.schema_file)
+            self.assertIs(schemas, load_schemas(None, self.schema_file))
+            self.assertEqual(
+                "mod-inventory-storage/ramls/item.json", schemas.get("item")["title"]
+            )
+            fetch.assert_not_called()
+
+    def test_fetches_each_schema_once_without_a_file(self):
+        fetch = mock.Mock(wraps=fake_fetch)
+        with mock.patch.object(schema_cache, "fetch_schema", fetch):
+            load_schemas(None).get("holdings")
+            load_schemas(None).get("holdings")
+        fetch.assert_called_once_with(
+            "mod-inventory-storage", "ramls/holdingsrecord.json"
+        )
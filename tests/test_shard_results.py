@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+import unittest
+
+from marc_to_folio.shard_results import (
+    merge_hrid_ranges,
+    merge_id_maps,
+    shard_folders,
+)
+
+
+def save_shard(results_folder, name, id_map=None):
+    folder = os.path.join(results_folder, name)
+    os.makedirs(folder)
+    if id_map is not None:
+        with open(os.path.join(folder, "instance_id_map.json"), "w") as id_map_file:
+            json.dump(id_map, id_map_file, indent=4)
+    return folder
+
+
+class TestShardResults(unittest.TestCase):
+    def test_merge_id_maps(self):
+        with tempfile.TemporaryDirectory() as results_folder:
+            save_shard(results_folder, "shard_1_of_3", {"b2": {"id": "2"}})
+            save_shard(results_folder, "shard_0_of_3", {"b1": {"id": "1"}})
+            save_shard(
+                results_folder, "shard_2_of_3", {"b1": {"id": "9"}, "b3": {"id": "3"}}
+            )
+            folders = shard_folders(results_folder)
+            self.assertEqual(
+                ["shard_0_of_3", "shard_1_of_3", "shard_2_of_3"],
+                [os.path.basename(folder) for folder in folders],
+            )
+            id_map, duplicates = merge_id_maps(folders, "instance_id_map.json")
+        self.assertEqual(
+            {"b1": {"id": "1"}, "b2": {"id": "2"}, "b3": {"id": "3"}}, id_map
+        )
+        self.assertEqual(["b1"], duplicates)
+
+    def test_merge_hrid_ranges(self):
+        with tempfile.TemporaryDirectory() as results_folder:
+            folders = [
+                save_shard(results_folder, f"shard_{index}_of_3") for index in range(3)
+            ]
+            # The last shard to finish is not the one with the highest numbers
+            for folder, used_ranges, next_free in [
+                (folders[0], [[1, 5]], 5),
+                (folders[1], [[5, 8], [20, 30]], 30),
+                (folders[2], [[10, 12]], 12),
+            ]:
+                with open(os.path.join(folder, "hrid_ranges.json"), "w") as f:
+                    json.dump(
+                        {
+                            "prefix": "in",
+                            "used_ranges": used_ranges,
+                            "next_free_start_number": next_free,
+                        },
+                        f,
+                    )
+            hrid_ranges = merge_hrid_ranges(folders)
+        self.assertEqual(30, hrid_ranges["next_free_start_number"])
+        self.assertEqual([(1, 8), (10, 12), (20, 30)], hrid_ranges["used_ranges"])
+        self.assertEqual("in", hrid_ranges["prefix"])
+
+    def test_missing_shard(self):
+        with tempfile.TemporaryDirectory() as results_folder:
+            save_shard(results_folder, "shard_0_of_2", {})
+            with self.assertRaises(ValueError):
+                shard_folders(results_folder)
+
+    def test_different_shard_counts(self):
+        with tempfile.TemporaryDirectory() as results_folder:
+            save_shard(results_folder, "shard_0_of_1", {})
+            save_shard(results_folder, "shard_0_of_2", {})
+            save_shard(results_folder, "shard_1_of_2", {})
+            with self.assertRaises(ValueError):
+                shard_folders(results_folder)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import random
+import time
+import unittest
+
+from marc_to_folio.staged_pipeline import StagedPipeline
+
+
+def slow_square(number):
+    time.sleep(random.random() / 1000)
+    return number * number
+
+
+class TestStagedPipeline(unittest.TestCase):
+    def test_ordered_stage_gets_records_in_order(self):
+        written = []
+        pipeline = StagedPipeline(queue_size=5)
+        pipeline.add_stage("map", lambda n: n if n % 3 else None)
+        pipeline.add_stage("serialize", slow_square, threads=4)
+        pipeline.add_stage("write", written.append, ordered=True)
+        pipeline.start()
+        for number in range(200):
+            pipeline.put(number)
+        pipeline.close()
+        self.assertEqual([n * n for n in range(200) if n % 3], written)
+        self.assertEqual(200, pipeline.read.items)
+        self.assertEqual(
+            [200, len(written), len(written)],
+            [stage.items for stage in pipeline.stages],
+        )
+
+    def test_stage_exception_is_raised(self):
+        def fail_on_ten(number):
+            if number == 10:
+                raise KeyError(number)
+            return number
+
+        pipeline = StagedPipeline(queue_size=2)
+        pipeline.add_stage("map", fail_on_ten)
+        pipeline.add_stage("write", lambda n: None, ordered=True)
+        pipeline.start()
+        with self.assertRaises(KeyError):
+            for number in range(1000):
+                pipeline.put(number)
+            pipeline.close()
+
+    def test_failed_records_are_skipped(self):
+        def fail_on_tens(number):
+            if number % 10 == 0:
+                raise KeyError(number)
+            return number
+
+        written = []
+        failed = []
+        pipeline = StagedPipeline(queue_size=2)
+        pipeline.add_stage(
+            "map", fail_on_tens, on_error=lambda n, exception: failed.append(n)
+        )
+        pipeline.add_stage("serialize", slow_square, threads=3)
+        pipeline.add_stage("write", written.append, ordered=True)
+        pipeline.start()
+        for number in range(100):
+            pipeline.put(number)
+        pipeline.close()
+        self.assertEqual(list(range(0, 100, 10)), failed)
+        self.assertEqual([n * n for n in range(100) if n % 10], written)
+
+    def test_failing_error_handler_stops_the_pipeline(self):
+        def fail(number, exception):
+            raise exception
+
+        pipeline = StagedPipeline(queue_size=2)
+        pipeline.add_stage("map", lambda n: 1 / (n - 10), on_error=fail)
+        pipeline.add_stage("write", lambda n: None, ordered=True)
+        pipeline.start()
+        with self.assertRaises(ZeroDivisionError):
+            for number in range(1000):
+                pipeline.put(number)
+            pipeline.close()
+        self.assertTrue(pipeline.stopped.is_set())
+
+    def test_ordered_stage_on_one_thread(self):
+        with self.assertRaises(ValueError):
+            StagedPipeline().add_stage("write", print, threads=2, ordered=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
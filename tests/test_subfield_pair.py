@@ -0,0 +1,58 @@
+import tracemalloc
+import unittest
+
+import pymarc
+
+from marc_to_folio.subfield_pair import subfield_pairs
+
+SUBJECT = pymarc.Field(
+    tag="650",
+    indicators=["1", "0"],
+    subfields=["a", "Cats ", "x", "Behavior.", "z", "Sweden", "6", "880-01"],
+)
+
+
+def temp_fields(field):
+    subfields = field.subfields
+    return [
+        pymarc.Field(
+            tag=field.tag, indicators=field.indicators, subfields=[code, value]
+        )
+        for code, value in zip(subfields[0::2], subfields[1::2])
+    ]
+
+
+def allocated(make, field, rounds=200):
+    tracemalloc.start()
+    for _ in range(rounds):
+        for view in make(field):
+            view.format_field()
+            view.get_subfields("a", "x")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+class TestSubfieldPair(unittest.TestCase):
+    def test_reads_like_a_field(self):
+        for pair, field in zip(subfield_pairs(SUBJECT), temp_fields(SUBJECT)):
+            self.assertEqual(field.tag, pair.tag)
+            self.assertEqual(field.indicator2, pair.indicator2)
+            self.assertEqual(field.subfields, pair.subfields)
+            self.assertEqual(field.format_field(), pair.format_field())
+            self.assertEqual(field.value(), pair.value())
+            self.assertEqual(str(field), str(pair))
+            for code in ["a", "x", "b"]:
+                self.assertEqual(field.get_subfields(code), pair.get_subfields(code))
+                self.assertEqual(field[code], pair[code])
+                self.assertEqual(code in field, code in pair)
+
+    def test_allocates_less_than_temporary_fields(self):
+        field = pymarc.Field(
+            tag="650",
+            indicators=[" ", "0"],
+            subfields=[x for i in range(50) for x in ("x", f"Heading {i}")],
+        )
+        self.assertLess(
+            allocated(subfield_pairs, field), allocated(temp_fields, field)
+        )
@@ -0,0 +1,72 @@
+import unittest
+
+from marc_to_folio.target_writers import build_target_writer
+
+SCHEMA = {
+    "properties": {
+        "title": {"type": "string"},
+        "series": {"type": "array", "items": {"type": "string"}},
+        "statisticalCodeIds": {"type": "object"},
+        "notes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "instanceNoteTypeId": {"type": "string"},
+                    "note": {"type": "string"},
+                    "staffOnly": {"type": "boolean"},
+                },
+            },
+        },
+    }
+}
+
+
+def write(rec, target, value):
+    build_target_writer(SCHEMA, target)(rec, value)
+
+
+class TestTargetWriters(unittest.TestCase):
+    def test_first_level(self):
+        rec = {}
+        write(rec, "title", ["A title", "ignored"])
+        write(rec, "series", ["One"])
+        write(rec, "series", ["Two", "Three"])
+        self.assertEqual(
+            {"title": "A title", "series": ["One", "Two", "Three"]}, rec
+        )
+
+    def test_entity_properties(self):
+        rec = {}
+        write(rec, "notes.instanceNoteTypeId", ["general"])
+        write(rec, "notes.note", ["First"])
+        write(rec, "notes.note", ["Second"])
+        write(rec, "notes.instanceNoteTypeId", ["general"])
+        self.assertEqual(
+            [
+                {"instanceNoteTypeId": "general", "note": "First"},
+                {"note": "Second", "instanceNoteTypeId": "general"},
+            ],
+            rec["notes"],
+        )
+
+    def test_new_object_when_last_is_complete(self):
+        rec = {"notes": [{"instanceNoteTypeId": "a", "note": "b", "staffOnly": True}]}
+        write(rec, "notes.note", ["c"])
+        self.assertEqual({"note": "c"}, rec["notes"][-1])
+
+    def test_boolean_only_starts_new_objects(self):
+        rec = {}
+        write(rec, "notes.staffOnly", [True])
+        self.assertEqual([{}], rec["notes"])
+
+    def test_unsupported_targets(self):
+        for target in ["statisticalCodeIds", "series.value", "notes.missing"]:
+            with self.assertRaises(Exception):
+                build_target_writer(SCHEMA, target)
+
+    def test_many_writes_do_not_copy(self):
+        rec = {}
+        for i in range(5000):
+            write(rec, "notes.note", [str(i)])
+        self.assertEqual(5000, len(rec["notes"]))
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from io import StringIO
+
+from marc_to_folio.transformation_report import FieldTally, TransformationReport
+
+
+def make_report(records, legacy_id):
+    report = TransformationReport()
+    for _ in range(records):
+        report.add_stats("Number of records in file(s)")
+        report.report_folio_mapping("title", True, False)
+        report.report_legacy_mapping("245", True, True, False)
+    report.add_to_migration_report("Mapped Instance types", "text")
+    report.add_to_migration_report("Records without titles", legacy_id)
+    return report
+
+
+def render(report):
+    report_file = StringIO()
+    report.print_dict_to_md_table(report.stats, report_file)
+    report.write_migration_report(report_file)
+    report.print_mapping_report(report_file)
+    return report_file.getvalue()
+
+
+class TestTransformationReport(unittest.TestCase):
+    def test_merge_equals_single_run(self):
+        single_run = make_report(5, "a")
+        single_run.add_to_migration_report("Mapped Instance types", "text")
+        single_run.add_to_migration_report("Records without titles", "b")
+        merged = make_report(2, "a").merge(make_report(3, "b"))
+        self.assertEqual(single_run.stats, merged.stats)
+        self.assertEqual(single_run.migration_report, merged.migration_report)
+        self.assertEqual(single_run.mapped_folio_fields, merged.mapped_folio_fields)
+        self.assertEqual(single_run.mapped_legacy_fields, merged.mapped_legacy_fields)
+        self.assertEqual(render(single_run), render(merged))
+
+    def test_merge_does_not_share_counts(self):
+        other = make_report(1, "a")
+        merged = TransformationReport().merge(other)
+        merged.merge(make_report(1, "b"))
+        self.assertEqual([1, 0], other.mapped_folio_fields["title"])
+
+    def test_save_and_load(self):
+        report = make_report(3, "a")
+        path = os.path.join(tempfile.mkdtemp(), "report.json.gz")
+        report.save(path)
+        loaded = TransformationReport.load(path)
+        self.assertEqual(render(report), render(loaded))
+
+    def test_field_tally_equals_field_by_field(self):
+        fields = [("245", True, False), ("650", True, False), ("650", False, True)]
+        field_by_field = make_report(1, "a")
+        for tag, mapped, empty in fields:
+            field_by_field.report_legacy_mapping(tag, True, mapped, empty)
+            field_by_field.add_stats("Total number of Tags processed")
+        tallied = make_report(1, "a")
+        tally = FieldTally()
+        for tag, mapped, empty in fields:
+            tally.add(tag, int(mapped), int(empty))
+        tallied.add_stats("Total number of Tags processed", tally.processed)
+        tallied.add_legacy_mappings(tally)
+        self.assertEqual(field_by_field.mapped_legacy_fields, tallied.mapped_legacy_fields)
+        self.assertEqual(render(field_by_field), render(tallied))
+
+
+if __name__ == "__main__":
+    unittest.main()
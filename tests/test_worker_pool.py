@@ -0,0 +1,102 @@
+import gc
+import os
+import random
+import time
+import unittest
+
+from marc_to_folio.transformation_report import TransformationReport
+from marc_to_folio.worker_pool import OrderedWorkerPool
+
+# Set in each worker process by init_worker
+worker_prefix = None
+
+
+def init_worker(prefix):
+    global worker_prefix
+    worker_prefix = prefix
+
+
+def map_chunk(numbers):
+    """Stands in for the chunk tasks of the scripts"""
+    time.sleep(random.random() / 100)
+    report = TransformationReport()
+    id_map = {}
+    for number in numbers:
+        report.add_stats("Records")
+        report.add_to_migration_report("Parity", "odd" if number % 2 else "even")
+        id_map[f"{worker_prefix}{number}"] = {"id": str(number * 10)}
+    return {
+        "numbers": numbers,
+        "report": report,
+        "id_map": id_map,
+        "pid": os.getpid(),
+    }
+
+
+def fail_on_three(numbers):
+    if 3 in numbers:
+        raise KeyError(3)
+    return numbers
+
+
+class TestOrderedWorkerPool(unittest.TestCase):
+    def test_results_in_order_and_merged(self):
+        merged_numbers = []
+        report = TransformationReport()
+        id_map = {}
+        pids = set()
+
+        def merge(result):
+            merged_numbers.extend(result["numbers"])
+            report.merge(result["report"])
+            id_map.update(result["id_map"])
+            pids.add(result["pid"])
+
+        pool = OrderedWorkerPool(3, init_worker, ("b",), map_chunk, merge)
+        chunks = [list(range(start, start + 7)) for start in range(0, 140, 7)]
+        for chunk in chunks:
+            pool.submit(chunk)
+        pool.close()
+        self.assertEqual(list(range(140)), merged_numbers)
+        self.assertEqual(140, report.stats["Records"])
+        self.assertEqual({"odd": 70, "even": 70}, report.migration_report["Parity"])
+        self.assertEqual(140, len(id_map))
+        self.assertEqual({"id": "1390"}, id_map["b139"])
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_pending_tasks_are_bounded(self):
+        results = []
+        pool = OrderedWorkerPool(2, init_worker, ("",), map_chunk, results.append)
+        for number in range(10):
+            pool.submit([number])
+            self.assertLessEqual(len(pool.pending), pool.max_pending)
+        pool.close()
+        self.assertEqual(list(range(10)), [r["numbers"][0] for r in results])
+
+    def test_terminated_when_a_task_fails(self):
+        results = []
+        with self.assertRaises(KeyError):
+            with OrderedWorkerPool(
+                2, init_worker, ("",), fail_on_three, results.append
+            ) as pool:
+                self.assertGreater(gc.get_freeze_count(), 0)
+                for number in range(10):
+                    pool.submit([number])
+        self.assertEqual([[0], [1], [2]], results)
+        self.assertTrue(pool.closed)
+        self.assertFalse(pool.pending)
+        self.assertEqual(0, gc.get_freeze_count())
+
+    def test_closed_at_the_end_of_the_block(self):
+        results = []
+        pool = OrderedWorkerPool(2, init_worker, ("",), map_chunk, results.append)
+        with pool:
+            for number in range(5):
+                pool.submit([number])
+        self.assertEqual(list(range(5)), [r["numbers"][0] for r in results])
+        self.assertTrue(pool.closed)
+        self.assertEqual(0, gc.get_freeze_count())
+
+
+if __name__ == "__main__":
+    unittest.main()